@@ -31,49 +31,134 @@ import dash_ag_grid as dag
 import dash_bootstrap_components as dbc
 import json
 import logging
+import numpy as np
 import pandas as pd
 import psutil
 import re
 import socket
 import sys
+import time
 from dash import Dash, dcc, html, Input, Patch, State, callback_context, no_update
 from dash.dependencies import Input, Output, State
 from dash.exceptions import PreventUpdate
+from datetime import datetime, timedelta
 from pathlib import Path
+from typing import Iterable
 from .interactive import repl
-from app.core.azure_activity_processor import AzureActivityProcessor
-from app.utils.config import valid_output_types
-from app.utils.file_io import write_activity_log_data
-from app.utils.log_getters import get_azure_activity_restapi
+from app.core.azure_activity_processor import AzureActivityProcessor, SimplifyWorkerError
+from app.core.azure_axe_key import is_axe_key_hash_mode_available
+from app.core.columnar_store import ColumnarEventStore, columnar_hot_fields
+from app.core.dataframe_views import get_view_key
+from app.core.field_paths import filter_records, is_field_path, split_field_condition
+from app.core.query_engine import QueryPlan, QuerySyntaxError
+from app.core.keyed_log_summary import ApproximateKeyedLogSummary
+from app.core.spill_store import SpillGroupStore
+from app.utils.checkpoint import FollowCheckpoint
+from app.utils.config import FETCH_CACHE_MAX_MB, FOLLOW_INTERVAL_SECONDS, FOLLOW_QUIET_MINUTES, SPILL_MEMORY_BUDGET_MB, SUBSCRIPTION_WORKERS, valid_axe_key_hash_modes, valid_fetch_engines, valid_output_types
+from app.utils.fetch_cache import FetchCache
+from app.utils.file_io import read_subscription_ids, write_activity_log_data, write_json_array
+from app.utils.log_readers import iter_input_pages
+from app.utils.log_getters import PrefetchError, format_filter_time, iter_azure_activity_subscriptions, parse_filter_time, prefetch_pages
 from app.utils.logger import get_logger
+from app.utils.retry import RetryScheduler
 from rich import print_json
 from rich.console import Console
 
 command_logger = get_logger('commands')
 
 @click.group()
-@click.option('--subscription-id', required=True, help='Azure Subscription ID')
+@click.option('--subscription-id', multiple=True, help='Azure Subscription ID (Can be used more than once.)')
+@click.option('--subscriptions-file', default=None, type=click.Path(exists=True, dir_okay=False), help='File of Azure Subscription IDs, one per line.')
+@click.option('--all-subscriptions', is_flag=True, default=False, help='Fetch every enabled subscription the identity can read in the tenant.')
+@click.option('--input', 'input_paths', multiple=True, type=click.Path(exists=True), help='Read exported activity logs instead of calling the REST API. Json, json lines, diagnostic setting archives (PT1H.json), Event Hub capture (.avro), optionally gzipped. Files or directories (Can be used more than once.)')
+@click.option('--input-workers', type=click.IntRange(min=1), default=1, show_default=True, help='Number of input files parsed in parallel processes.')
+@click.option('--subscription-workers', type=click.IntRange(min=1), default=SUBSCRIPTION_WORKERS, show_default=True, help='Number of subscriptions fetched concurrently.')
 @click.option('--start-time', default=None, help='Filter Start Time (If start & end time are not both provided, defaults to last 24 hours. UTC)')
 @click.option('--end-time', default=None, help='Filter End Time (If start & end time are not both provided, defaults to last 24 hours. UTC)')
 @click.option('--correlation-id', default=None, help='Azure Correlation ID (Must be within start & end time (Microsoft Endpoint Requirement))')
+@click.option('--fetch-workers', type=click.IntRange(min=1), default=1, help='Number of concurrent workers per subscription. Greater than 1 splits the time window into slices fetched in parallel.')
+@click.option('--fetch-engine', type=click.Choice(valid_fetch_engines), default='threads', show_default=True, help='threads: one blocking session per worker. async: all pagination chains on one event loop (requires aiohttp).')
+@click.option('--fetch-stats', is_flag=True, default=False, help='Print request, retry and throttle wait statistics after fetching.')
+@click.option('--cache', 'use_cache', is_flag=True, default=False, help='Serve settled time buckets from the on-disk fetch cache and only fetch missing or open ranges.')
+@click.option('--cache-dir', default=None, help='Fetch cache directory. (Defaults to ./cache)')
+@click.option('--cache-max-mb', type=click.IntRange(min=1), default=FETCH_CACHE_MAX_MB, show_default=True, help='Fetch cache size cap, least recently used buckets are evicted.')
+@click.option('--simplify-workers', type=click.IntRange(min=1), default=1, show_default=True, help='Number of worker processes folding events into simplified operations, sharded by axeKey.')
+@click.option('--columnar', is_flag=True, default=False, help='Hold keyed events in a compact columnar store. Hot field filters run vectorized.')
+@click.option('--approximate', is_flag=True, default=False, help='Summary counts from fixed memory HyperLogLog & count-min sketches instead of exact sets. Error bounds are reported with each count.')
+@click.option('--axe-key-hash', type=click.Choice(valid_axe_key_hash_modes), default='md5', show_default=True, help='Axe key hash. blake2b & xxhash (requires xxhash) are faster for internal grouping but do not match the Sentinel query or md5 keyed outputs.')
+@click.option('--spill', is_flag=True, default=False, help='Group out of core: keyed events are spilled to a temporary SQLite file and simplified records are streamed, for windows larger than memory.')
+@click.option('--memory-budget-mb', type=click.IntRange(min=1), default=SPILL_MEMORY_BUDGET_MB, show_default=True, help='Memory budget for the --spill insert buffer and page cache.')
+@click.option('--spill-dir', default=None, type=click.Path(file_okay=False), help='Directory for the --spill file. (Defaults to the system temp directory)')
+@click.option('--no-raw-retention', is_flag=True, default=False, help='Drop raw events once simplified to lower memory use. Axe keyed data commands are unavailable.')
 @click.option('--select', default=None, help='SUB: Field Selection. Comma Delimited E.g. axeKey,caller,operationName (Used by the Show & Save commands.)')
-@click.option('--field-value-select', multiple=True, help='SUB: Select rows based on the value of a field. E.g. operationName:microsoft.storage/storageaccounts/listKeys/action (Used by the Show & Save commands. Does NOT support nested field. See README for more examples.)')
-@click.option('--field-value-deselect', multiple=True, help='SUB: De-select rows based on the value of a field. E.g. operationName:microsoft.storage/storageaccounts/listKeys/action (Used by the Show & Save commands. Does NOT support nested field. See README for more examples.)')
+@click.option('--field-value-select', multiple=True, help='SUB: Select rows based on the value of a field. E.g. operationName:microsoft.storage/storageaccounts/listKeys/action (Used by the Show & Save commands. Nested fields use a dotted path, E.g. claims.appid or requestBody.properties.*. See README for more examples.)')
+@click.option('--field-value-deselect', multiple=True, help='SUB: De-select rows based on the value of a field. E.g. operationName:microsoft.storage/storageaccounts/listKeys/action (Used by the Show & Save commands. Nested fields use a dotted path, E.g. claims.appid or requestBody.properties.*. See README for more examples.)')
+@click.option('--query', default=None, help="SUB: Query expression. E.g. \"operationName ~ 'roleassignments' and startTime >= 2024-06-01 and statusCounts.Failed > 0\" (Used by the Show, Save, aggrid & explain commands. See README for the syntax.)")
 @click.option('--output-type', type=click.Choice(['json', 'csv']), default='json', help='SUB: Output Type. (Used by the Show & Save commands.)')
 @click.option('--filepath', default=None, help='SUB: Absolute File Path. (Used by the Save commands.)')
 @click.pass_context
-def azure_activity_log_axe(ctx, subscription_id: str, start_time: str | None, end_time: str | None, correlation_id: str | None, select: str | None, field_value_select, field_value_deselect, output_type: str | None, filepath: str | None):
+def azure_activity_log_axe(ctx, subscription_id: tuple, subscriptions_file: str | None, all_subscriptions: bool, input_paths: tuple, input_workers: int, subscription_workers: int, start_time: str | None, end_time: str | None, correlation_id: str | None, fetch_workers: int, fetch_engine: str, fetch_stats: bool, use_cache: bool, cache_dir: str | None, cache_max_mb: int, simplify_workers: int, columnar: bool, approximate: bool, axe_key_hash: str, spill: bool, memory_budget_mb: int, spill_dir: str | None, no_raw_retention: bool, select: str | None, field_value_select, field_value_deselect, query: str | None, output_type: str | None, filepath: str | None):
     """
     Azure Activity Log Axe: Simplify and understand your logs.
     """
     console = Console()
-    logDict = get_azure_activity_restapi(subscription_id, start_time, end_time, correlation_id)
-    if logDict:
+    subscription_ids: list[str] = list(subscription_id)
+    if subscriptions_file:
+        subscription_ids.extend(read_subscription_ids(Path(subscriptions_file)))
+    if not subscription_ids and not all_subscriptions and not input_paths:
+        raise click.UsageError('Provide --subscription-id, --subscriptions-file, --all-subscriptions or --input.')
+    if input_paths and ctx.invoked_subcommand == 'follow':
+        raise click.UsageError('follow polls the REST API and cannot be used with --input.')
+
+    retry_scheduler = RetryScheduler(max_concurrency=fetch_workers * subscription_workers)
+    fetch_cache: FetchCache | None = FetchCache(Path(cache_dir) if cache_dir else None, cache_max_mb) if use_cache else None
+    ctx.obj['fetch_params'] = {
+        'sub_ids': subscription_ids,
+        'cor_id': correlation_id,
+        'fetch_workers': fetch_workers,
+        'subscription_workers': subscription_workers,
+        'all_subscriptions': all_subscriptions,
+        'fetch_engine': fetch_engine,
+        'retry_scheduler': retry_scheduler,
+        'fetch_cache': fetch_cache,
+    }
+    if not is_axe_key_hash_mode_available(axe_key_hash):
+        command_logger.warning(f'The {axe_key_hash} axe key hash is not installed, using md5.')
+        axe_key_hash = 'md5'
+    ctx.obj['processor_params'] = {'approximate': approximate, 'axe_key_hash_mode': axe_key_hash}
+    ctx.obj['start_time_param'] = start_time
+    ctx.obj['output_type_param'] = output_type
+    ctx.obj['filepath_param'] = Path(filepath) if filepath else None
+
+    # Follow mode polls from its own checkpoint
+    if ctx.invoked_subcommand == 'follow':
+        return
+
+    if input_paths:
+        activity_pages = iter_input_pages([Path(input_path) for input_path in input_paths], input_workers)
+        console.print("[+] Reading and processing exported Azure activity logs...", style="bold green")
+    else:
+        activity_pages = iter_azure_activity_subscriptions(filter_start_time=start_time, filter_end_time=end_time, **ctx.obj['fetch_params'])
+        console.print("[+] Obtaining and processing Azure activity logs...", style="bold green")
+
+    # Pages are keyed and simplified while the next page downloads
+    azure_activity: AzureActivityProcessor = AzureActivityProcessor(**ctx.obj['processor_params'])
+    spill_store: SpillGroupStore | None = SpillGroupStore(Path(spill_dir) if spill_dir else None, memory_budget_mb) if spill else None
+    try:
+        azure_activity.process_activity_pages(prefetch_pages(activity_pages), retain_raw=not no_raw_retention, simplify_workers=simplify_workers, columnar=columnar, spill_store=spill_store)
+    except (PrefetchError, SimplifyWorkerError) as e:
+        console.print(f"[-] {e}", style="bold red")
+        sys.exit(1)
+    if fetch_stats:
+        console.print("[+] Fetch Statistics:", style="bold green")
+        print_json(json.dumps(retry_scheduler.stats.as_dict()))
+    if retry_scheduler.get_failure_count():
+        # Some windows did not finish: the results are still shown, the run then exits with 1
+        console.print(f"[-] {retry_scheduler.stats.exhausted} request(s) exhausted their retries and {retry_scheduler.stats.errors} request(s) failed "
+                      f"(authentication, 403, 404...), results are incomplete. See the log for the failed requests.", style="bold red")
+        ctx.call_on_close(lambda: ctx.exit(1))
+    if azure_activity.processed_event_count:
         console.print("[+] Azure activity logs obtained.", style="bold green")
-        azure_activity: AzureActivityProcessor = AzureActivityProcessor()
-        console.print("[+] Processing...", style="bold green")
-        azure_activity.get_axe_key_azure_activity(logDict)
-        azure_activity.get_simplified_azure_activity_list(azure_activity.get_simplified_azure_activity(azure_activity.keyed_log_data))
         console.print("[+] Axe keyed and simplified Azure activity logs are ready.", style="bold green")
     else:
         console.print("[-] Failed to obtain logs.", style="bold red")
@@ -83,19 +168,40 @@ def azure_activity_log_axe(ctx, subscription_id: str, start_time: str | None, en
     ctx.obj['select_param'] = select
     ctx.obj['field_value_select_param'] = tuple(field_value_select)
     ctx.obj['field_value_deselect_param'] = tuple(field_value_deselect)
-    ctx.obj['output_type_param'] = output_type
-    ctx.obj['filepath_param'] = Path(filepath) if filepath else None
+    ctx.obj['query_param'] = query
     ctx.obj['azure_activity'] = azure_activity
 
 
 @azure_activity_log_axe.command()
+@click.option('--top', type=click.IntRange(min=0), default=0, help='Add status counts, time bounds and the top N operations, callers and resource providers.')
+@click.option('--save-sketch', default=None, help='Save the approximate summary sketches to a file for a later merge. (Requires --approximate)')
+@click.option('--merge-sketch', multiple=True, type=click.Path(exists=True, dir_okay=False), help='Merge saved summary sketches into the printed summary. (Requires --approximate, can be used more than once.)')
 @click.pass_context
-def summary(ctx):
+def summary(ctx, top: int = 0, save_sketch: str | None = None, merge_sketch: tuple = ()):
     """
     Prints a summary of axe keyed log details.
     """
     azure_activity: AzureActivityProcessor = ctx.obj['azure_activity']
-    azure_activity.get_keyed_log_summary()
+    keyed_log_summary = azure_activity.keyed_log_summary
+    if save_sketch or merge_sketch:
+        if not isinstance(keyed_log_summary, ApproximateKeyedLogSummary):
+            command_logger.warning('Summary sketches require --approximate, --save-sketch & --merge-sketch skipped.')
+        else:
+            if save_sketch:
+                keyed_log_summary.save(Path(save_sketch))
+                Console().print(f"[+] Summary sketch saved to {save_sketch}.", style="bold green")
+            if merge_sketch:
+                # Merged into a copy, the session's own summary is unchanged
+                keyed_log_summary = ApproximateKeyedLogSummary.from_dict(keyed_log_summary.to_dict())
+                for sketch_path in merge_sketch:
+                    saved_summary = ApproximateKeyedLogSummary.load(Path(sketch_path))
+                    if saved_summary:
+                        keyed_log_summary.merge(saved_summary)
+                azure_activity.summary_keyed_log_data = keyed_log_summary.get_summary(top)
+                Console().print("[+] Axe Keyed Log Summary (merged):", style="bold green")
+                print_json(json.dumps(azure_activity.summary_keyed_log_data))
+                return
+    azure_activity.get_keyed_log_summary(top)
 
     Console().print("[+] Axe Keyed Log Summary:", style="bold green")
     print_json(json.dumps(azure_activity.summary_keyed_log_data))
@@ -103,37 +209,41 @@ def summary(ctx):
 
 @azure_activity_log_axe.command()
 @click.pass_context
-def save_axe_keyed_data(ctx, select: str | None = None, field_value_select: tuple | None = None, field_value_deselect: tuple | None = None, filepath: str | None = None, output_type: str | None = None):
+def save_axe_keyed_data(ctx, select: str | None = None, field_value_select: tuple | None = None, field_value_deselect: tuple | None = None, query: str | None = None, filepath: str | None = None, output_type: str | None = None):
     """
     Saves the original azure activity log data plus axeKey to a json or csv file.
     """
     default_filename = "axe_keyed_activity_data"
     azure_activity: AzureActivityProcessor = ctx.obj['azure_activity']
+    if not azure_activity.retain_raw:
+        command_logger.warning('Raw events were not retained (--no-raw-retention), axe keyed data is unavailable.')
+        return
 
     # Assign aruments from options.
     # 1st assignment check is from interactive, 2nd is running the python app command directly
     select = select or ctx.obj['select_param']
     field_value_select = field_value_select or ctx.obj['field_value_select_param']
     field_value_deselect = field_value_deselect or ctx.obj['field_value_deselect_param']
+    query = query or ctx.obj['query_param']
     output_type = output_type or ctx.obj['output_type_param'] or 'json'
     filepath: Path | None = Path(filepath) if filepath else None or ctx.obj['filepath_param']
 
     # Apply any filters that exist
-    if select or field_value_select or field_value_deselect:
-        keyed_log_data = df_filter(select, field_value_select, field_value_deselect, azure_activity.keyed_log_data)
+    if select or field_value_select or field_value_deselect or query:
+        keyed_log_data = get_df_view(select, field_value_select, field_value_deselect, query, azure_activity, 'keyed')
         if not keyed_log_data.empty:
             Console().print("[+] Original azure activity log data plus Axe Key written to file.", style="bold green")
             write_activity_log_data(keyed_log_data.to_dict(orient='records'), default_filename, filepath, output_type)
         else:
-            command_logger.warning(f'It appears your filters resulted in an empty list:\n select: {select}\n field_value_select: {field_value_select}\n field_value_deselect: {field_value_deselect}')
+            command_logger.warning(f'It appears your filters resulted in an empty list:\n select: {select}\n field_value_select: {field_value_select}\n field_value_deselect: {field_value_deselect}\n query: {query}')
     else:
         Console().print("[+] Original azure activity log data plus Axe Key written to file.", style="bold green")
-        write_activity_log_data(azure_activity.keyed_log_data, default_filename, filepath, output_type)
+        write_activity_log_data(azure_activity.iter_keyed_log_data(), default_filename, filepath, output_type)
 
 
 @azure_activity_log_axe.command()
 @click.pass_context
-def save_simplified_data(ctx, select: str | None = None, field_value_select: tuple | None = None, field_value_deselect: tuple | None = None, filepath: str | None = None, output_type: str | None = None):
+def save_simplified_data(ctx, select: str | None = None, field_value_select: tuple | None = None, field_value_deselect: tuple | None = None, query: str | None = None, filepath: str | None = None, output_type: str | None = None):
     """
     Saves the simplified azure activity log data to a json or csv file.
     """
@@ -145,53 +255,58 @@ def save_simplified_data(ctx, select: str | None = None, field_value_select: tup
     select = select or ctx.obj['select_param']
     field_value_select = field_value_select or ctx.obj['field_value_select_param']
     field_value_deselect = field_value_deselect or ctx.obj['field_value_deselect_param']
+    query = query or ctx.obj['query_param']
     output_type = output_type or ctx.obj['output_type_param'] or 'json'
     filepath: Path | None = Path(filepath) if filepath else None or ctx.obj['filepath_param']
 
     # Apply any filters that exist
-    if select or field_value_deselect:
-        simplified_log_data_list = df_filter(select, field_value_select, field_value_deselect, azure_activity.simplified_log_data_list)
+    if select or field_value_select or field_value_deselect or query:
+        simplified_log_data_list = get_df_view(select, field_value_select, field_value_deselect, query, azure_activity, 'simplified')
         if not simplified_log_data_list.empty:
             Console().print("[+] Simplified Azure activity log data written to file:", style="bold green")
             write_activity_log_data(simplified_log_data_list.to_dict(orient='records'), default_filename, filepath, output_type)
         else:
-            command_logger.warning(f'It appears your filters resulted in an empty list:\n select: {select}\n field_value_select: {field_value_select}\n field_value_deselect: {field_value_deselect}')
+            command_logger.warning(f'It appears your filters resulted in an empty list:\n select: {select}\n field_value_select: {field_value_select}\n field_value_deselect: {field_value_deselect}\n query: {query}')
     else:
         Console().print("[+] Simplified Azure activity log data written to file:", style="bold green")
-        write_activity_log_data(azure_activity.simplified_log_data_list, default_filename, filepath, output_type)
+        write_activity_log_data(azure_activity.iter_simplified_log_data(), default_filename, filepath, output_type)
 
 
 @azure_activity_log_axe.command()
 @click.pass_context
-def show_axe_keyed_data(ctx, select: str | None = None, field_value_select: tuple | None = None, field_value_deselect: tuple | None = None, output_type: str | None = None):
+def show_axe_keyed_data(ctx, select: str | None = None, field_value_select: tuple | None = None, field_value_deselect: tuple | None = None, query: str | None = None, output_type: str | None = None):
     """
     Prints the original azure activity log data plus axeKey (json or csv), to the cli.
     """
     azure_activity: AzureActivityProcessor = ctx.obj['azure_activity']
+    if not azure_activity.retain_raw:
+        command_logger.warning('Raw events were not retained (--no-raw-retention), axe keyed data is unavailable.')
+        return
 
     # Assign aruments from options.
     # 1st assignment check is from interactive, 2nd is running the python app command directly
     select = select or ctx.obj['select_param']
     field_value_select = field_value_select or ctx.obj['field_value_select_param']
     field_value_deselect = field_value_deselect or ctx.obj['field_value_deselect_param']
+    query = query or ctx.obj['query_param']
     output_type = output_type or ctx.obj['output_type_param'] or 'json'
 
     # Apply any filters that exist
-    if select or field_value_select or field_value_deselect:
-        keyed_log_data = df_filter(select, field_value_select, field_value_deselect, azure_activity.keyed_log_data)
+    if select or field_value_select or field_value_deselect or query:
+        keyed_log_data = get_df_view(select, field_value_select, field_value_deselect, query, azure_activity, 'keyed')
         if not keyed_log_data.empty:
             Console().print("[+] Original azure activity log data plus Axe Key:", style="bold green")
             print_output_type(output_type, keyed_log_data.to_dict(orient='records'))
         else:
-            command_logger.info(f'It appears your filters resulted in an empty list:\n select: {select}\n field_value_select: {field_value_select}\n field_value_deselect: {field_value_deselect}')
+            command_logger.info(f'It appears your filters resulted in an empty list:\n select: {select}\n field_value_select: {field_value_select}\n field_value_deselect: {field_value_deselect}\n query: {query}')
     else:
         Console().print("[+] Original azure activity log data Axe Key:", style="bold green")
-        print_output_type(output_type, azure_activity.keyed_log_data)
+        print_output_type(output_type, azure_activity.iter_keyed_log_data())
 
 
 @azure_activity_log_axe.command()
 @click.pass_context
-def show_simplified_data(ctx, select: str | None = None, field_value_select: tuple | None = None, field_value_deselect: tuple | None = None, output_type: str | None = None):
+def show_simplified_data(ctx, select: str | None = None, field_value_select: tuple | None = None, field_value_deselect: tuple | None = None, query: str | None = None, output_type: str | None = None):
     """
     Prints the simplified azure activity log data (json or csv) to the cli.
     """
@@ -202,24 +317,25 @@ def show_simplified_data(ctx, select: str | None = None, field_value_select: tup
     select = select or ctx.obj['select_param']
     field_value_select = field_value_select or ctx.obj['field_value_select_param']
     field_value_deselect = field_value_deselect or ctx.obj['field_value_deselect_param']
+    query = query or ctx.obj['query_param']
     output_type = output_type or ctx.obj['output_type_param'] or 'json'
 
     # Apply any filters that exist
-    if select or field_value_select or field_value_deselect:
-        simplified_log_data_list = df_filter(select, field_value_select, field_value_deselect, azure_activity.simplified_log_data_list)
+    if select or field_value_select or field_value_deselect or query:
+        simplified_log_data_list = get_df_view(select, field_value_select, field_value_deselect, query, azure_activity, 'simplified')
         if not simplified_log_data_list.empty:
             Console().print("[+] Simplified Azure activity log data:", style="bold green")
             print_output_type(output_type, simplified_log_data_list.to_dict(orient='records'))
         else:
-            command_logger.info(f'It appears your filters resulted in an empty list:\n select: {select}\n field_value_select: {field_value_select}\n field_value_deselect: {field_value_deselect}')
+            command_logger.info(f'It appears your filters resulted in an empty list:\n select: {select}\n field_value_select: {field_value_select}\n field_value_deselect: {field_value_deselect}\n query: {query}')
     else:
         Console().print("[+] Simplified Azure activity log data:", style="bold green")
-        print_output_type(output_type, azure_activity.simplified_log_data_list)
+        print_output_type(output_type, azure_activity.iter_simplified_log_data())
 
 
 @azure_activity_log_axe.command()
 @click.pass_context
-def aggrid(ctx, select: str | None = None, field_value_select: tuple | None = None, field_value_deselect: tuple | None = None):
+def aggrid(ctx, select: str | None = None, field_value_select: tuple | None = None, field_value_deselect: tuple | None = None, query: str | None = None):
     """
     Browser GUI - Navigate the data using AG-Grid.
     """
@@ -241,34 +357,15 @@ def aggrid(ctx, select: str | None = None, field_value_select: tuple | None = No
         select = select or ctx.obj['select_param']
         field_value_select = field_value_select or ctx.obj['field_value_select_param']
         field_value_deselect = field_value_deselect or ctx.obj['field_value_deselect_param']
-        dfKeyedLogData: pd.DataFrame | None = None
-        dfSimplifiedData: pd.DataFrame | None = None
+        query = query or ctx.obj['query_param']
 
-        # Apply any filters that exist
-        if select or field_value_select or field_value_deselect:
-            dfKeyedLogData = df_filter(select, field_value_select, field_value_deselect, azure_activity.keyed_log_data)
-            dfSimplifiedData = df_filter(select, field_value_select, field_value_deselect, azure_activity.simplified_log_data_list)
-        else:
-            dfKeyedLogData = azure_activity.keyed_log_data
-            dfSimplifiedData = azure_activity.simplified_log_data_list
+        # Apply any filters that exist, views are cached on the processor and shared with show & save until the data changes
+        dfKeyedLogData: pd.DataFrame = get_df_view(select, field_value_select, field_value_deselect, query, azure_activity, 'keyed')
+        dfSimplifiedData: pd.DataFrame = get_df_view(select, field_value_select, field_value_deselect, query, azure_activity, 'simplified')
 
-        # Check that field is JSON
-        def is_json_serializable(value) -> bool:
-            try:
-                json.dumps(value)
-                return True
-            except (TypeError, OverflowError):
-                return False
-
-        # Convert fields to JSON strings if they are JSON serializable
-        def jsonSerialize(og_df: pd.DataFrame) -> pd.DataFrame:
-            df: pd.DataFrame = og_df.copy()
-            for col in df.columns:
-                df[col] = df[col].apply(lambda x: json.dumps(x) if is_json_serializable(x) else x)
-            return df
         # Clean Data and Create Default Columns
-        convertedDfKeyedLogData: pd.DataFrame = jsonSerialize(dfKeyedLogData)
-        convertedDfSimplifiedData: pd.DataFrame = jsonSerialize(dfSimplifiedData)
+        convertedDfKeyedLogData: pd.DataFrame = get_df_view(select, field_value_select, field_value_deselect, query, azure_activity, 'keyed', serialized=True)
+        convertedDfSimplifiedData: pd.DataFrame = get_df_view(select, field_value_select, field_value_deselect, query, azure_activity, 'simplified', serialized=True)
         keyed_default_columns: list[str] = ['axeKey', 'operationName', 'correlationId', 'operationId', 'caller', 'category', 'eventTimestamp', 'status']
         simplified_default_columns: list[str] = ['axeKey', 'operationName', 'correlationId', 'operationIds', 'caller', 'category', 'startTime', 'endTime', 'statusCounts']
         keyedLogDataColumnDefDefaults: list[dict[str,str]] = [{"field": str(col)} for col in keyed_default_columns]
@@ -521,6 +618,100 @@ def aggrid(ctx, select: str | None = None, field_value_select: tuple | None = No
         command_logger.info(f"An error occurred: {str(e)}")
 
 
+@azure_activity_log_axe.command()
+@click.option('--interval', type=click.IntRange(min=1), default=FOLLOW_INTERVAL_SECONDS, show_default=True, help='Seconds between polls.')
+@click.option('--checkpoint-file', default=None, help='Checkpoint path. (Defaults to ./checkpoints/follow_<subscriptions hash>.json)')
+@click.option('--max-polls', type=click.IntRange(min=0), default=0, help='Stop after this many polls. (0 runs until interrupted)')
+@click.option('--emit-completed', is_flag=True, default=False, help='Emit each operation once, after a terminal status and --quiet-minutes without events, and drop it from memory. Late events are emitted as update records.')
+@click.option('--quiet-minutes', type=click.IntRange(min=0), default=FOLLOW_QUIET_MINUTES, show_default=True, help='Event time minutes without events before a terminal operation is emitted. (Used by --emit-completed)')
+@click.pass_context
+def follow(ctx, interval: int, checkpoint_file: str | None, max_polls: int, emit_completed: bool, quiet_minutes: int):
+    """
+    Polls for events newer than the persisted checkpoint and emits new or changed simplified operations (json lines).
+    """
+    console = Console(stderr=True)
+    fetch_params: dict = ctx.obj['fetch_params']
+    filepath: Path | None = ctx.obj['filepath_param']
+    checkpoint = FollowCheckpoint(Path(checkpoint_file) if checkpoint_file else FollowCheckpoint.get_default_path(fetch_params['sub_ids'], fetch_params['all_subscriptions'], fetch_params['cor_id']))
+
+    # Without a checkpoint, start from --start-time or the last 24 hours
+    start_time: str | None = ctx.obj['start_time_param']
+    default_start = parse_filter_time(start_time) if start_time else datetime.utcnow() - timedelta(days=1)
+
+    azure_activity: AzureActivityProcessor = AzureActivityProcessor(**ctx.obj['processor_params'])
+    azure_activity.retain_raw = False
+    # Follow prints no summary, the fixed memory sketches keep it from growing with every polled event
+    azure_activity.keyed_log_summary = ApproximateKeyedLogSummary()
+    retry_scheduler: RetryScheduler = fetch_params['retry_scheduler']
+    poll_count = 0
+    try:
+        while True:
+            poll_start = format_filter_time(checkpoint.get_poll_start(default_start))
+            poll_end = format_filter_time(datetime.utcnow())
+            failure_count = retry_scheduler.get_failure_count()
+            new_events: list[dict] = []
+            for page in iter_azure_activity_subscriptions(filter_start_time=poll_start, filter_end_time=poll_end, **fetch_params):
+                new_events.extend(checkpoint.filter_new_events(page))
+
+            touched_axe_keys = azure_activity.add_events(new_events, refresh_list=False)
+            # Pages arrive newest first, a poll cut short by failed requests would move the checkpoint past events it never read.
+            # Keep the checkpoint, the next poll re-reads the same range (add_events skips the events already merged).
+            if retry_scheduler.get_failure_count() == failure_count:
+                checkpoint.update(new_events)
+                checkpoint.save()
+            else:
+                console.print(f"[-] {poll_end}: requests failed during the poll, the checkpoint was not advanced.", style="bold red")
+
+            if emit_completed:
+                completed_operations = azure_activity.pop_completed_operations(timedelta(minutes=quiet_minutes), emitted_id_cutoff=checkpoint.get_poll_start(default_start))
+                console.print(f"[+] {poll_end}: {len(new_events)} new events, {len(completed_operations)} completed operations, {len(azure_activity.simplified_log_data_objects)} in flight.", style="bold green")
+                write_json_lines(completed_operations, filepath)
+            else:
+                changed_operations = [azure_activity.get_simplified_event(axe_key) for axe_key in touched_axe_keys]
+                console.print(f"[+] {poll_end}: {len(new_events)} new events, {len(changed_operations)} new or changed operations.", style="bold green")
+                write_json_lines(changed_operations, filepath)
+                # Settled operations before the next poll's re-read window can no longer change
+                azure_activity.prune_settled_operations(checkpoint.get_poll_start(default_start))
+
+            poll_count += 1
+            if max_polls and poll_count >= max_polls:
+                break
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        console.print("[+] Follow stopped, checkpoint saved.", style="bold green")
+    finally:
+        # In flight operations are past the checkpoint, emit them so a restart does not lose their events
+        if emit_completed:
+            write_json_lines(azure_activity.pop_completed_operations(timedelta(minutes=quiet_minutes), flush=True), filepath)
+
+
+@azure_activity_log_axe.command()
+@click.pass_context
+def explain(ctx, query: str | None = None):
+    """
+    Runs the --query on the axe keyed and simplified data and prints the plan: index terms, scanned terms and row counts.
+    """
+    azure_activity: AzureActivityProcessor = ctx.obj['azure_activity']
+    query = query or ctx.obj['query_param']
+    if not query:
+        command_logger.warning('Usage: explain --query <expression>')
+        return
+
+    query_plan = get_query_plan(query)
+    if query_plan is None:
+        return
+    query_explanation: dict = {}
+    datasets = {'Axe Keyed Data': 'keyed', 'Simplified Data': 'simplified'} if azure_activity.retain_raw else {'Simplified Data': 'simplified'}
+    for title, dataset in datasets.items():
+        if azure_activity.spill_store is not None:
+            for _ in query_plan.iter_matches(azure_activity.iter_keyed_log_data() if dataset == 'keyed' else azure_activity.iter_simplified_log_data()):
+                pass
+        else:
+            query_plan.get_row_ids(azure_activity.get_query_source(dataset), azure_activity.get_time_indexes(dataset))
+        query_explanation[title] = query_plan.explain()
+    print_json(json.dumps(query_explanation))
+
+
 @azure_activity_log_axe.command()
 @click.pass_context
 def interactive(ctx):
@@ -530,7 +721,8 @@ def interactive(ctx):
     repl(ctx)
 
 
-def print_output_type(output_type: str | None, azure_activity_data: list[dict]) -> None:
+# json is written one record at a time (spilled data is streamed), csv is printed as one DataFrame
+def print_output_type(output_type: str | None, azure_activity_data: Iterable[dict]) -> None:
     # Secondary override to force json if None
     output_type = output_type or 'json'
     # Force a correct file type
@@ -539,9 +731,10 @@ def print_output_type(output_type: str | None, azure_activity_data: list[dict])
         output_type = 'json'
 
     if output_type == 'json':
-        print(json.dumps(azure_activity_data, indent=2))
+        write_json_array(sys.stdout, azure_activity_data)
+        sys.stdout.write('\n')
     elif output_type == 'csv':
-        df = pd.DataFrame(azure_activity_data)
+        df = pd.DataFrame(list(azure_activity_data))
         pd.set_option('display.max_colwidth', 40)
         pd.set_option('display.width', None)
         pd.set_option('display.max_columns', len(df.columns))
@@ -549,25 +742,55 @@ def print_output_type(output_type: str | None, azure_activity_data: list[dict])
         print(df)
 
 
+def write_json_lines(azure_activity_data: list[dict], filepath: Path | None = None) -> None:
+    # Appends to filepath when provided, prints otherwise
+    if not azure_activity_data:
+        return
+    lines = ''.join(json.dumps(event) + '\n' for event in azure_activity_data)
+    if filepath:
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        with open(filepath, 'a') as file:
+            file.write(lines)
+    else:
+        sys.stdout.write(lines)
+        sys.stdout.flush()
+
+
 def df_filter(select: str | None, field_value_select: tuple | None, field_value_deselect: tuple | None, azure_activity_data: list[dict]) -> pd.DataFrame | None:
     # Take all filter options and filter down DataFrame
     try:
+        # Dotted path conditions (claims.appid) run first, compiled & evaluated in one pass over the records
+        if any(is_field_path(split_field_condition(condition)[0]) for condition in (*(field_value_select or ()), *(field_value_deselect or ()))):
+            conditions = get_filter_conditions(field_value_select, field_value_deselect)
+            if conditions is None:
+                return pd.DataFrame()  # return empty dataframe
+            azure_activity_data = filter_records(azure_activity_data, [condition for condition in conditions if is_field_path(condition[0])])
+            field_value_select = tuple(condition for condition in field_value_select or () if not is_field_path(split_field_condition(condition)[0]))
+            field_value_deselect = tuple(condition for condition in field_value_deselect or () if not is_field_path(split_field_condition(condition)[0]))
+            if not azure_activity_data:
+                command_logger.warning(f'No records matched the field path filters.')
+                return pd.DataFrame()  # return empty dataframe
+
         df = pd.DataFrame(azure_activity_data)
 
         if field_value_select:
             for condition in field_value_select:
-                field, values = condition.split(':') # field:"value,value"
+                field, values = split_field_condition(condition) # field:"value,value"
                 field_value_select_list = values.split(',') # [value,value]
                 if isinstance(df[field].iloc[0], dict):
                     df = df[df[field].apply(lambda x: x.get('value') in field_value_select_list)]
+                elif isinstance(df[field].iloc[0], list): # any element, as the field index posts list fields
+                    df = df[df[field].apply(lambda x: isinstance(x, list) and any(value in field_value_select_list for value in x))]
                 else:
                     df = df[df[field].isin(field_value_select_list)]
         if field_value_deselect:
             for condition in field_value_deselect:
-                field, values = condition.split(':') # field:"value,value"
+                field, values = split_field_condition(condition) # field:"value,value"
                 field_value_deselect_list = values.split(',') # [value,value]
                 if isinstance(df[field].iloc[0], dict):
                     df = df[~df[field].apply(lambda x: x.get('value') in field_value_deselect_list)]
+                elif isinstance(df[field].iloc[0], list): # any element, as the field index posts list fields
+                    df = df[~df[field].apply(lambda x: isinstance(x, list) and any(value in field_value_deselect_list for value in x))]
                 else:
                     df = df[~df[field].isin(field_value_deselect_list)]
         if select:
@@ -592,6 +815,134 @@ def df_filter(select: str | None, field_value_select: tuple | None, field_value_
         return pd.DataFrame()  # return empty dataframe
 
 
+def get_filter_conditions(field_value_select: tuple | None, field_value_deselect: tuple | None) -> list[tuple[str, list[str], bool]] | None:
+    # [(field, [value,value], deselect)], None when a condition is malformed
+    try:
+        conditions = [(*split_field_condition(condition), False) for condition in field_value_select or ()]
+        conditions += [(*split_field_condition(condition), True) for condition in field_value_deselect or ()]
+        return [(field, values.split(','), deselect) for field, values, deselect in conditions] # field:"value,value"
+    except ValueError:
+        command_logger.warning(f'Ensure field_value filters use a ":" to separate field:comma,delimited,list.')
+        return None
+
+
+def keyed_df_filter(select: str | None, field_value_select: tuple | None, field_value_deselect: tuple | None, azure_activity: AzureActivityProcessor) -> pd.DataFrame | None:
+    columnar_store: ColumnarEventStore | None = azure_activity.columnar_store
+    if columnar_store is None:
+        return indexed_df_filter(select, field_value_select, field_value_deselect, azure_activity, 'keyed')
+
+    conditions = get_filter_conditions(field_value_select, field_value_deselect)
+    if conditions is None:
+        return pd.DataFrame()  # return empty dataframe
+
+    # Filters on fields outside the columnar hot fields run on the decoded events
+    if any(field not in columnar_hot_fields for field, _, _ in conditions):
+        return df_filter(select, field_value_select, field_value_deselect, columnar_store.get_events())
+
+    # Vectorized masks over the code columns, only matching rows are decoded
+    mask = np.ones(len(columnar_store), dtype=bool)
+    for field, values, deselect in conditions:
+        field_mask = columnar_store.get_mask(field, values)
+        mask &= ~field_mask if deselect else field_mask
+    if not mask.any():
+        return pd.DataFrame()
+    return df_filter(select, None, None, columnar_store.get_events(np.flatnonzero(mask)))
+
+
+def simplified_df_filter(select: str | None, field_value_select: tuple | None, field_value_deselect: tuple | None, azure_activity: AzureActivityProcessor) -> pd.DataFrame | None:
+    return indexed_df_filter(select, field_value_select, field_value_deselect, azure_activity, 'simplified')
+
+
+def get_df_view(select: str | None, field_value_select: tuple | None, field_value_deselect: tuple | None, query: str | None, azure_activity: AzureActivityProcessor, dataset: str, serialized: bool = False) -> pd.DataFrame:
+    # Cached DataFrame of the keyed or simplified data, filtered when filters exist. serialized holds json strings for the grid.
+    def build_view() -> pd.DataFrame:
+        if serialized:
+            return json_serialize_df(get_df_view(select, field_value_select, field_value_deselect, query, azure_activity, dataset))
+        if azure_activity.spill_store is not None and (query or field_value_select or field_value_deselect):
+            return spilled_df_filter(select, field_value_select, field_value_deselect, query, azure_activity, dataset)
+        if query:
+            return query_df_filter(select, field_value_select, field_value_deselect, query, azure_activity, dataset)
+        if select or field_value_select or field_value_deselect:
+            df_filter_func = keyed_df_filter if dataset == 'keyed' else simplified_df_filter
+            return df_filter_func(select, field_value_select, field_value_deselect, azure_activity)
+        return pd.DataFrame(azure_activity.get_keyed_log_data() if dataset == 'keyed' else azure_activity.get_simplified_log_data())
+
+    view_key = get_view_key(dataset, 'serialized' if serialized else 'frame', select, field_value_select, field_value_deselect, query)
+    return azure_activity.get_dataframe_view(view_key, build_view)
+
+
+def query_df_filter(select: str | None, field_value_select: tuple | None, field_value_deselect: tuple | None, query: str, azure_activity: AzureActivityProcessor, dataset: str) -> pd.DataFrame:
+    # The query plan narrows the rows (indexes first, then a scan of the candidates), field value filters & select run on the result
+    query_plan = get_query_plan(query)
+    if query_plan is None:
+        return pd.DataFrame()  # return empty dataframe
+    query_source = azure_activity.get_query_source(dataset)
+    row_ids = query_plan.get_row_ids(query_source, azure_activity.get_time_indexes(dataset))
+    if not len(row_ids):
+        return pd.DataFrame()
+    return df_filter(select, field_value_select, field_value_deselect, query_source.get_records(row_ids))
+
+
+def spilled_df_filter(select: str | None, field_value_select: tuple | None, field_value_deselect: tuple | None, query: str | None, azure_activity: AzureActivityProcessor, dataset: str) -> pd.DataFrame:
+    # Spilled data has no indexes: the query & field value filters run on the streamed records, only the matches are held
+    records = azure_activity.iter_keyed_log_data() if dataset == 'keyed' else azure_activity.iter_simplified_log_data()
+    if query:
+        query_plan = get_query_plan(query)
+        if query_plan is None:
+            return pd.DataFrame()  # return empty dataframe
+        records = query_plan.iter_matches(records)
+    conditions = get_filter_conditions(field_value_select, field_value_deselect)
+    if conditions is None:
+        return pd.DataFrame()  # return empty dataframe
+    matched_records = filter_records(records, conditions)
+    if not matched_records:
+        return pd.DataFrame()
+    return df_filter(select, None, None, matched_records)
+
+
+def get_query_plan(query: str) -> QueryPlan | None:
+    try:
+        return QueryPlan(query)
+    except QuerySyntaxError as e:
+        command_logger.warning(f'Query error: {str(e)}')
+        return None
+
+
+# Convert fields to JSON strings if they are JSON serializable
+def json_serialize_df(og_df: pd.DataFrame) -> pd.DataFrame:
+    df: pd.DataFrame = og_df.copy()
+    for col in df.columns:
+        df[col] = df[col].map(json_serialize_value)
+    return df
+
+
+def json_serialize_value(value):
+    try:
+        return json.dumps(value)
+    except (TypeError, OverflowError):
+        return value
+
+
+def indexed_df_filter(select: str | None, field_value_select: tuple | None, field_value_deselect: tuple | None, azure_activity: AzureActivityProcessor, dataset: str) -> pd.DataFrame | None:
+    # Select & deselect conditions become bitmap intersections & differences over the inverted field indexes,
+    # only the matching rows are turned into a DataFrame. Missing or unindexable fields go through df_filter.
+    field_index = azure_activity.get_field_index(dataset)
+    if field_index is None:
+        records = azure_activity.get_keyed_log_data() if dataset == 'keyed' else azure_activity.get_simplified_log_data()
+        return df_filter(select, field_value_select, field_value_deselect, records)
+
+    conditions = get_filter_conditions(field_value_select, field_value_deselect)
+    if conditions is None:
+        return pd.DataFrame()  # return empty dataframe
+    if not conditions or not all(field_index.is_indexable(field) for field, _, _ in conditions):
+        return df_filter(select, field_value_select, field_value_deselect, field_index.records)
+
+    row_ids = field_index.get_row_ids(conditions)
+    if not len(row_ids):
+        return pd.DataFrame()
+    return df_filter(select, None, None, pd.DataFrame(field_index.get_records(row_ids), columns=field_index.get_columns()))
+
+
 def is_port_in_use(port: int) -> bool:
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
         try:
@@ -38,8 +38,8 @@ def repl(ctx):
         command = input('azure-activity-log-axe>> ').strip()
         if command == 'exit':
             break
-        elif command == 'summary':
-            ctx.invoke(commands.summary)
+        elif command.startswith('summary'):
+            process_repl_summary(ctx, command, commands.summary)
         elif command.startswith('aggrid'):
             process_repl_aggrid(ctx, command, commands.aggrid)
         elif command.startswith('save-axe-keyed-data'):
@@ -50,6 +50,8 @@ def repl(ctx):
             process_repl_show_command(ctx, command, commands.show_axe_keyed_data)
         elif command.startswith('show-simplified-data'):
             process_repl_show_command(ctx, command, commands.show_simplified_data)
+        elif command.startswith('explain'):
+            process_repl_explain(ctx, command, commands.explain)
         elif command == 'help' or command == 'h':
             repl_print_help()
         else:
@@ -64,13 +66,18 @@ def repl_print_help():
 
     Options:
     --select TEXT             Field Selection. Comma Delimited E.g. axeKey,caller,operationName (Used by the Show & Save commands.)
-    --field-value-select TEXT   Select rows based on the value of a field. E.g. operationName:microsoft.storage/storageaccounts/listKeys/action (Used by the Show & Save commands. Does NOT support nested field. See README for more examples.)
-    --field-value-deselect TEXT   De-select rows based on the value of a field. E.g. operationName:microsoft.storage/storageaccounts/listKeys/action (Used by the Show & Save commands. Does NOT support nested field. See README for more examples.)
+    --field-value-select TEXT   Select rows based on the value of a field. E.g. operationName:microsoft.storage/storageaccounts/listKeys/action (Used by the Show & Save commands. Nested fields use a dotted path, E.g. claims.appid or requestBody.properties.*. See README for more examples.)
+    --field-value-deselect TEXT   De-select rows based on the value of a field. E.g. operationName:microsoft.storage/storageaccounts/listKeys/action (Used by the Show & Save commands. Nested fields use a dotted path, E.g. claims.appid or requestBody.properties.*. See README for more examples.)
+    --query TEXT              Query expression. E.g. "operationName ~ 'roleassignments' and startTime >= 2024-06-01 and statusCounts.Failed > 0" (Used by the Show, Save, aggrid & explain commands. See README for the syntax.)
     --output-type [json|csv]  Output Type. (Used by the Show & Save commands.)
     --filepath TEXT           Absolute File Path. (Used by the Save commands.)
+    --top INTEGER             Add status counts, time bounds and the top N operations, callers and resource providers. (Used by the summary command.)
+    --save-sketch TEXT        Save the approximate summary sketches to a file. (Used by the summary command, requires --approximate.)
+    --merge-sketch TEXT       Merge saved summary sketches into the printed summary. (Used by the summary command, requires --approximate.)
 
     Commands:
     aggrid                Browser GUI - Navigate the data using AG-Grid.
+    explain               Runs the --query and prints the plan: index terms, scanned terms and row counts.
     save-axe-keyed-data   Saves the original azure activity log data plus axeKey to a json or csv file.
     save-simplified-data  Saves the simplified azure activity log data to a json or csv file.
     show-axe-keyed-data   Prints the original azure activity log data plus axeKey (json or csv), to the cli.
@@ -80,6 +87,43 @@ def repl_print_help():
     """)
 
 
+def process_repl_summary(ctx, command, func):
+    # This processor gets called to collect all arguments before sending to command
+    try:
+        args = shlex.split(command)
+        command_args = {'merge_sketch': []}
+        iterator_obj = iter(args[1:])
+        for arg in iterator_obj:
+            if arg == '--top':
+                command_args['top'] = int(next(iterator_obj))
+            elif arg == '--save-sketch':
+                command_args['save_sketch'] = next(iterator_obj)
+            elif arg == '--merge-sketch':
+                command_args['merge_sketch'].append(next(iterator_obj))
+            elif arg.startswith('--'):
+                interactive_logger.warning(f'Invalid arg {arg}, skipped.')
+        command_args['merge_sketch'] = tuple(command_args['merge_sketch']) # Set multi entry option/arg to expected tuple
+        ctx.invoke(func, **command_args)
+    except (ValueError, StopIteration):
+        interactive_logger.warning(f'Usage: summary --top <count> --save-sketch <file_path> --merge-sketch <file_path>')
+
+
+def process_repl_explain(ctx, command, func):
+    # This processor gets called to collect all arguments before sending to command
+    try:
+        args = shlex.split(command)
+        command_args = {}
+        iterator_obj = iter(args[1:])
+        for arg in iterator_obj:
+            if arg == '--query':
+                command_args['query'] = next(iterator_obj)
+            elif arg.startswith('--'):
+                interactive_logger.warning(f'Invalid arg {arg}, skipped.')
+        ctx.invoke(func, **command_args)
+    except (ValueError, StopIteration):
+        interactive_logger.warning(f'Usage: explain --query <expression>')
+
+
 def process_repl_save_command(ctx, command, func):
     # This processor gets called to collect all arguments before sending to command
     try:
@@ -99,6 +143,8 @@ def process_repl_save_command(ctx, command, func):
                 command_args['field_value_select'].append(next(iterator_obj))
             elif arg == '--field-value-deselect':
                 command_args['field_value_deselect'].append(next(iterator_obj))
+            elif arg == '--query':
+                command_args['query'] = next(iterator_obj)
             elif arg == '--output-type':
                 command_args['output_type'] = next(iterator_obj)
             elif arg == '--filepath':
@@ -110,12 +156,12 @@ def process_repl_save_command(ctx, command, func):
         command_args['field_value_deselect'] = tuple(command_args['field_value_deselect']) # Set multi entry option/arg to expected tuple
         ctx.invoke(func, **command_args)
     except (ValueError, IndexError):
-        interactive_logger.warning(f'Usage: {command.split()[0]} --select <fields,> --field-value-select <field:value,> --field-value-deselect <field:value,> --output-type <json|csv> --filepath <file_path>')
+        interactive_logger.warning(f'Usage: {command.split()[0]} --select <fields,> --field-value-select <field:value,> --field-value-deselect <field:value,> --query <expression> --output-type <json|csv> --filepath <file_path>')
     except StopIteration:
-        interactive_logger.warning(f'You have provided an argument with no input. \n Usage: --select <fields,> --field-value-select <field:value,> --field-value-deselect <field:value,> --output-type <json|csv> --filepath <file_path>')
+        interactive_logger.warning(f'You have provided an argument with no input. \n Usage: --select <fields,> --field-value-select <field:value,> --field-value-deselect <field:value,> --query <expression> --output-type <json|csv> --filepath <file_path>')
     except Exception as e:
         interactive_logger.error(f'Unexpected error: {str(e)}')
-        interactive_logger.warning(f'Usage: {command.split()[0]} --select <fields,> --field-value-select <field:value,> --field-value-deselect <field:value,> --output-type <json|csv> --filepath <file_path>')
+        interactive_logger.warning(f'Usage: {command.split()[0]} --select <fields,> --field-value-select <field:value,> --field-value-deselect <field:value,> --query <expression> --output-type <json|csv> --filepath <file_path>')
 
 
 def process_repl_show_command(ctx, command, func):
@@ -137,6 +183,8 @@ def process_repl_show_command(ctx, command, func):
                 command_args['field_value_select'].append(next(iterator_obj))
             elif arg == '--field-value-deselect':
                 command_args['field_value_deselect'].append(next(iterator_obj))
+            elif arg == '--query':
+                command_args['query'] = next(iterator_obj)
             elif arg == '--output-type':
                 command_args['output_type'] = next(iterator_obj)
             elif arg.startswith('--'):
@@ -146,12 +194,12 @@ def process_repl_show_command(ctx, command, func):
         command_args['field_value_deselect'] = tuple(command_args['field_value_deselect']) # Set multi entry option/arg to expected tuple
         ctx.invoke(func, **command_args)
     except (ValueError, IndexError):
-        interactive_logger.warning(f'Usage: {command.split()[0]} --select <fields,> --field-value-select <field:value,> --field-value-deselect <field:value,> --output-type <json|csv>')
+        interactive_logger.warning(f'Usage: {command.split()[0]} --select <fields,> --field-value-select <field:value,> --field-value-deselect <field:value,> --query <expression> --output-type <json|csv>')
     except StopIteration:
-        interactive_logger.warning(f'You have provided an argument with no input. \n Usage: --select <fields,> --field-value-select <field:value,> --field-value-deselect <field:value,> --output-type <json|csv>')
+        interactive_logger.warning(f'You have provided an argument with no input. \n Usage: --select <fields,> --field-value-select <field:value,> --field-value-deselect <field:value,> --query <expression> --output-type <json|csv>')
     except Exception as e:
         interactive_logger.error(f'Unexpected error: {str(e)}')
-        interactive_logger.warning(f'Usage: {command.split()[0]} --select <fields,> --field-value-select <field:value,> --field-value-deselect <field:value,> --output-type <json|csv>')
+        interactive_logger.warning(f'Usage: {command.split()[0]} --select <fields,> --field-value-select <field:value,> --field-value-deselect <field:value,> --query <expression> --output-type <json|csv>')
 
 
 def process_repl_aggrid(ctx, command, func):
@@ -173,6 +221,8 @@ def process_repl_aggrid(ctx, command, func):
                 command_args['field_value_select'].append(next(iterator_obj))
             elif arg == '--field-value-deselect':
                 command_args['field_value_deselect'].append(next(iterator_obj))
+            elif arg == '--query':
+                command_args['query'] = next(iterator_obj)
             elif arg.startswith('--'):
                  interactive_logger.warning(f'Invalid arg {arg}, skipped.')
 
@@ -180,9 +230,9 @@ def process_repl_aggrid(ctx, command, func):
         command_args['field_value_deselect'] = tuple(command_args['field_value_deselect']) # Set multi entry option/arg to expected tuple
         ctx.invoke(func, **command_args)
     except (ValueError, IndexError):
-        interactive_logger.warning(f'Usage: {command.split()[0]} --select <fields,> --field-value-select <field:value,> --field-value-deselect <field:value,>')
+        interactive_logger.warning(f'Usage: {command.split()[0]} --select <fields,> --field-value-select <field:value,> --field-value-deselect <field:value,> --query <expression>')
     except StopIteration:
-        interactive_logger.warning(f'You have provided an argument with no input. \n Usage: --select <fields,> --field-value-select <field:value,> --field-value-deselect <field:value,>')
+        interactive_logger.warning(f'You have provided an argument with no input. \n Usage: --select <fields,> --field-value-select <field:value,> --field-value-deselect <field:value,> --query <expression>')
     except Exception as e:
         interactive_logger.error(f'Unexpected error: {str(e)}')
-        interactive_logger.warning(f'Usage: {command.split()[0]} --select <fields,> --field-value-select <field:value,> --field-value-deselect <field:value,>')
\ No newline at end of file
+        interactive_logger.warning(f'Usage: {command.split()[0]} --select <fields,> --field-value-select <field:value,> --field-value-deselect <field:value,> --query <expression>')
\ No newline at end of file
@@ -26,24 +26,75 @@ License: Apache License
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 
-import json
-from .azure_axe_key import get_axe_key
-from datetime import datetime
-from typing import Optional, Any
+import multiprocessing
+import pandas as pd
+from datetime import datetime, timedelta
+from .azure_axe_key import get_axe_keys
+from .columnar_store import ColumnarEventStore
+from .dataframe_views import DataFrameViewCache
+from .field_index import FieldIndex
+from .keyed_log_summary import ApproximateKeyedLogSummary, KeyedLogSummary
+from .simplified_operation import SimplifiedOperation
+from .spill_store import SpilledKeyedLogSummary, SpillGroupStore
+from .time_index import TimeIndex, get_time_array, time_index_fields
+from typing import Callable, Iterable
+from app.utils.config import FOLLOW_OVERLAP_MINUTES, SIMPLIFY_CHUNK_BYTES
+from app.utils.file_io import dump_event_line, load_event_line
 from app.utils.logger import get_logger
 
 azure_activity_logger = get_logger('azure_activity')
 
 
+class SimplifyWorkerError(RuntimeError):
+    pass
+
+
 class AzureActivityProcessor:
-    def __init__(self):
+    def __init__(self, approximate: bool = False, axe_key_hash_mode: str = 'md5'):
         # Basic azure activity data with simplify key
         self.keyed_log_data: list[dict] = []
+        # Optional columnar copy of the keyed events, used instead of keyed_log_data when set (process_activity_pages columnar)
+        self.columnar_store: ColumnarEventStore | None = None
+        # Optional out-of-core store, keyed events & groups live on disk and simplified records are streamed (process_activity_pages spill_store)
+        self.spill_store: SpillGroupStore | None = None
         self.summary_keyed_log_data: dict = {}
+        # Summary counters, updated as events are keyed (available without raw retention)
+        # approximate uses fixed memory sketches instead of exact distinct sets
+        self.keyed_log_summary: KeyedLogSummary = ApproximateKeyedLogSummary() if approximate else KeyedLogSummary()
 
         # Simplified azure activity data
-        # self.simplified_log_data_objects = {} #replaced with get_simplified_azure_activity return to limit memory use
-        self.simplified_log_data_list: list[dict] = []
+        # Groups are folded in a single pass into compact SimplifiedOperation records, rendered to dicts for output
+        self.simplified_log_data_objects: dict[str, SimplifiedOperation] = {}
+        # Rendered from simplified_log_data_objects on first read (see simplified_log_data_list), None until then
+        self._simplified_log_data_list: list[dict] | None = []
+        # axeKey -> position in simplified_log_data_list, lets add_events refresh only touched entries
+        self.simplified_log_data_positions: dict[str, int] = {}
+        # eventDataIds already merged, built from the groups on the first add_events call
+        self.seen_event_data_ids: set[str] | None = None
+
+        # Completion-aware emission (pop_completed_operations): the newest event time seen, axe keys already emitted (late events become
+        # update records) & eventDataIds of emitted groups (re-delivered events are skipped instead of counted again in an update).
+        # Both map to the group end time and are pruned once they fall before the cutoff a poll can re-read from (as FollowCheckpoint
+        # prunes by its overlap), a late event after the cutoff starts a new record.
+        self.event_time_watermark: datetime | None = None
+        self.emitted_axe_keys: dict[str, datetime] = {}
+        self.emitted_event_data_ids: dict[str, datetime] = {}
+
+        # Bumped whenever keyed or simplified data changes, derived indexes are rebuilt on the next use
+        self.data_version: int = 0
+        # Inverted field indexes per dataset ('keyed', 'simplified'), see get_field_index
+        self.field_indexes: dict[str, FieldIndex] = {}
+        # Sorted time indexes per dataset with the data_version & row count they were built at, see get_time_index
+        self.time_indexes: dict[str, tuple[int, int, TimeIndex]] = {}
+        # DataFrame views of keyed & simplified data, see get_dataframe_view
+        self.dataframe_views: DataFrameViewCache = DataFrameViewCache()
+
+        # md5 unless a faster internal grouping hash is requested (azure_axe_key)
+        self.axe_key_hash_mode: str = axe_key_hash_mode
+
+        # Streaming state
+        self.retain_raw: bool = True
+        self.processed_event_count: int = 0
 
     # Build and apply axeKey to original logs
     def get_axe_key_azure_activity(self, activity_logs: list[dict]) -> None:
@@ -51,208 +102,448 @@ class AzureActivityProcessor:
             azure_activity_logger.critical(f'No activity logs exist to add the simplify key.')
             return
 
-        for raw_event in activity_logs:
-            cor_id = raw_event.get('correlationId')
-            operation_name = raw_event.get('operationName').get('value')
-            resource_id = raw_event.get('resourceId')
-            axe_key = get_axe_key(cor_id, operation_name, resource_id)
+        self.keyed_log_data.extend(self.get_keyed_events(activity_logs))
+        self.summary_keyed_log_data = {}
+        self.data_version += 1
+
+    def get_keyed_events(self, activity_logs: list[dict]) -> list[dict]:
+        keyed_events: list[dict] = []
+        for raw_event, axe_key in zip(activity_logs, self.apply_axe_keys(activity_logs)):
+            if axe_key:
+                self.keyed_log_summary.add_event(raw_event)
+                keyed_events.append(raw_event)
+        return keyed_events
+
+    # Keys a page at once, returns the axe key (or None) per event
+    def apply_axe_keys(self, activity_logs: list[dict]) -> list[str | None]:
+        axe_keys = get_axe_keys(((raw_event.get('correlationId'), (raw_event.get('operationName') or {}).get('value'), raw_event.get('resourceId')) for raw_event in activity_logs), self.axe_key_hash_mode)
+        for raw_event, axe_key in zip(activity_logs, axe_keys):
             if axe_key:
                 raw_event['axeKey'] = axe_key
-                self.keyed_log_data.append(raw_event)
             else:
                 azure_activity_logger.warning(f'Failed to add simplify key to raw_event: {raw_event}')
+        return axe_keys
 
-        self.summary_keyed_log_data = {}
-
-    # Build new list of objects simplifying data and grouping transactional operations
-    def get_simplified_azure_activity(self, keyed_log_data: list[dict]) -> None:
+    # Build new list of objects simplifying data and grouping transactional operations, axeKey -> simplified record.
+    # Each record includes its axeKey as well (first), get_simplified_azure_activity_list keeps it first. None without keyed data.
+    def get_simplified_azure_activity(self, keyed_log_data: list[dict]) -> dict[str, dict] | None:
         simplified_log_data_objects = {}
         if not keyed_log_data:
             azure_activity_logger.critical(f'No keyed log data exists.')
             return
 
         for raw_event in keyed_log_data:
-            axe_key = raw_event.get('axeKey')
-            if axe_key:
-                if axe_key not in simplified_log_data_objects:
-                    # Initialize the dict for the axe_key with serializable values
-                    simplified_log_data_objects[axe_key] = {
-                        'caller': None,
-                        'operationName': None,
-                        'operationNameLocalized': None,
-                        'startTime': None,
-                        'endTime': None,
-                        'ip': None,
-                        'subStatuses': [],
-                        'subStatusCounts': {},
-                        'startStatus': None,
-                        'endStatus': None,
-                        'statuses': [],
-                        'statusCounts': {},
-                        'subscriptionId': None,
-                        'claims': {},
-                        'requestBody': {},
-                        'responseBody': {},
-                        'category': None,
-                        'level': None,
-                        'resourceGroupName': None,
-                        'resourceId': None,
-                        'eventDataIds': [],
-                        'correlationId': None,
-                        'operationIds': set()
-                    }
-
-                ### --- Collect fields per simplify key --- ###
-                simplified_event = simplified_log_data_objects[axe_key]
-                simplified_event['caller'] = self.get_object_value(raw_event, 'caller')
-                simplified_event['operationName'] = self.get_object_value(raw_event, 'operationName', 'value').lower()
-                simplified_event['operationNameLocalized'] = self.get_object_value(raw_event, 'operationName', 'localizedValue')
-                simplified_event['ip'] = self.get_object_value(raw_event, 'httpRequest', 'clientIpAddress') or self.get_object_value(raw_event, 'claims', 'ipaddr')
-                simplified_event['subscriptionId'] = self.get_object_value(raw_event, 'subscriptionId')
-                simplified_event['category'] = self.get_object_value(raw_event, 'category', 'value')
-                simplified_event['level'] = self.get_object_value(raw_event, 'level')
-                simplified_event['resourceProviderName'] = self.get_object_value(raw_event, 'resourceProviderName', 'value').lower()
-                simplified_event['resourceGroupName'] = self.get_object_value(raw_event, 'resourceGroupName')
-                simplified_event['resourceId'] = self.get_object_value(raw_event, 'resourceId')
-                simplified_event['correlationId'] = self.get_object_value(raw_event, 'correlationId')
-
-                # subStatus & status
-                sub_status: str = self.get_object_value(raw_event, 'subStatus', 'value')
-                if sub_status:
-                    substatus_element: Optional[int] = self.get_object_value(simplified_event['subStatusCounts'], sub_status)
-                    if substatus_element is None:
-                        simplified_event['subStatusCounts'][sub_status] = 1
-                    else:
-                        simplified_event['subStatusCounts'][sub_status] += 1
-
-                    if sub_status not in simplified_event['subStatuses']:
-                        simplified_event['subStatuses'].append(sub_status)
-                status: str = self.get_object_value(raw_event, 'status', 'value')
-                if status:
-                    status_element: Optional[int] = self.get_object_value(simplified_event['statusCounts'], status)
-                    if status_element is None:
-                        simplified_event['statusCounts'][status] = 1
-                    else:
-                        simplified_event['statusCounts'][status] += 1
-
-                    if status not in simplified_event['statuses']:
-                        simplified_event['statuses'].append(status)
-
-                # Start & End (Time / Status)
-                date_format = '%Y-%m-%dT%H:%M:%S.%fZ'
-                event_time = self.get_object_value(raw_event, 'eventTimestamp')
-                if event_time:
-                    if '.' in event_time:
-                        if len(event_time.split('.')[-1]) > 6:
-                            # Trim the fractional seconds to 6 digits (Python iso rec)
-                            event_time = event_time[:-1][:26] + 'Z'
-                    else:
-                        event_time = event_time[:-1] + '.000000Z'
-                    try:
-                        event_time = datetime.strptime(event_time, date_format)
-                    except ValueError as e:
-                        azure_activity_logger.error(f"Error parsing event time {event_time}: {e}")
+            self.fold_simplified_event(simplified_log_data_objects, raw_event)
+        return {axe_key: simplified_operation.to_dict() for axe_key, simplified_operation in simplified_log_data_objects.items()}
+
+    # Stream pages through keying & simplification, the next page can download while the current one is folded.
+    # With retain_raw False the raw events are dropped once folded and keyed_log_data stays empty.
+    # With simplify_workers above 1 the fold runs in worker processes, sharded by axeKey.
+    # With columnar the retained events go to a ColumnarEventStore instead of keyed_log_data.
+    # With a spill_store events & groups go to disk and simplified_log_data_list stays empty, use iter_simplified_log_data.
+    def process_activity_pages(self, pages: Iterable[list[dict]], retain_raw: bool = True, simplify_workers: int = 1, columnar: bool = False, spill_store: SpillGroupStore | None = None) -> None:
+        self.retain_raw = retain_raw
+        if spill_store is not None:
+            if simplify_workers > 1 or columnar:
+                azure_activity_logger.warning('Spilled grouping runs in a single process without the columnar store.')
+            self.spill_store = spill_store
+            # The exact distinct sets go to the spill file, the approximate summary is fixed memory already
+            if not isinstance(self.keyed_log_summary, ApproximateKeyedLogSummary) and not self.keyed_log_summary.event_count:
+                self.keyed_log_summary = SpilledKeyedLogSummary(spill_store)
+            for page in pages:
+                self.spill_activity_logs(page)
+            spill_store.finalize()
+            return
+        if columnar and retain_raw and self.columnar_store is None:
+            self.columnar_store = ColumnarEventStore()
+        if simplify_workers > 1:
+            self.merge_activity_pages_sharded(pages, simplify_workers)
+        else:
+            for page in pages:
+                self.merge_activity_logs(page)
+
+        self._simplified_log_data_list = None
+        self.data_version += 1
+
+    # Simplified records are rendered (bodies parsed, times formatted) on first use by show, save, aggrid & the filters,
+    # so commands that never read them (summary) skip every body parse
+    @property
+    def simplified_log_data_list(self) -> list[dict]:
+        if self._simplified_log_data_list is None:
+            self._simplified_log_data_list = [simplified_operation.to_dict() for simplified_operation in self.simplified_log_data_objects.values()]
+            self.simplified_log_data_positions = {}
+        return self._simplified_log_data_list
+
+    @simplified_log_data_list.setter
+    def simplified_log_data_list(self, simplified_log_data_list: list[dict]) -> None:
+        self._simplified_log_data_list = simplified_log_data_list
+
+    # Incremental merge: events with an eventDataId that was already merged are skipped, the rest are folded into the existing groups.
+    # Only the touched entries of simplified_log_data_list are re-rendered (refresh_list). Returns the touched axe keys.
+    def add_events(self, activity_logs: list[dict], refresh_list: bool = True) -> set[str]:
+        if self.seen_event_data_ids is None:
+            self.seen_event_data_ids = {event_data_id for simplified_operation in self.simplified_log_data_objects.values() for event_data_id in simplified_operation.event_data_ids}
+        seen_event_data_ids = self.seen_event_data_ids
+
+        new_events: list[dict] = []
+        for raw_event in activity_logs:
+            event_data_id = raw_event.get('eventDataId')
+            if event_data_id:
+                if event_data_id in seen_event_data_ids or event_data_id in self.emitted_event_data_ids:
+                    continue
+                seen_event_data_ids.add(event_data_id)
+            new_events.append(raw_event)
+
+        touched_axe_keys = self.merge_activity_logs(new_events)
+        if refresh_list and touched_axe_keys:
+            self.refresh_simplified_log_data_list(touched_axe_keys)
+        return touched_axe_keys
+
+    def refresh_simplified_log_data_list(self, axe_keys: set[str]) -> None:
+        if self._simplified_log_data_list is None:
+            # Not rendered yet, the first read renders every group
+            self.data_version += 1
+            return
+        simplified_log_data_list = self._simplified_log_data_list
+        positions = self.simplified_log_data_positions
+        if len(positions) != len(simplified_log_data_list):
+            positions.clear()
+            positions.update((simplified_event['axeKey'], position) for position, simplified_event in enumerate(simplified_log_data_list))
+
+        for axe_key in axe_keys:
+            if axe_key in positions:
+                simplified_log_data_list[positions[axe_key]] = self.simplified_log_data_objects[axe_key].to_dict()
+        if any(axe_key not in positions for axe_key in axe_keys):
+            # New groups are appended in first seen order
+            for axe_key, simplified_operation in self.simplified_log_data_objects.items():
+                if axe_key not in positions:
+                    positions[axe_key] = len(simplified_log_data_list)
+                    simplified_log_data_list.append(simplified_operation.to_dict())
+        self.data_version += 1
+
+    # Key events and hand them to the spill store, grouping happens when the simplified records are streamed
+    def spill_activity_logs(self, activity_logs: list[dict]) -> None:
+        spill_store = self.spill_store
+        for raw_event, axe_key in zip(activity_logs, self.apply_axe_keys(activity_logs)):
+            if not axe_key:
+                continue
+            self.keyed_log_summary.add_event(raw_event)
+            spill_store.append_event(raw_event)
+            self.processed_event_count += 1
+        self.summary_keyed_log_data = {}
+        self.data_version += 1
+
+    # Key and fold new raw events into the existing groups in one pass, returns the axe keys that were created or changed
+    def merge_activity_logs(self, activity_logs: list[dict]) -> set[str]:
+        touched_axe_keys: set[str] = set()
+        if not activity_logs:
+            return touched_axe_keys
+
+        simplified_log_data_objects = self.simplified_log_data_objects
+        retain_event = self.get_retain_event()
+        for raw_event, axe_key in zip(activity_logs, self.apply_axe_keys(activity_logs)):
+            if not axe_key:
+                continue
+            self.fold_simplified_event(simplified_log_data_objects, raw_event)
+            self.keyed_log_summary.add_event(raw_event)
+            touched_axe_keys.add(axe_key)
+            if retain_event:
+                retain_event(raw_event)
+            self.processed_event_count += 1
+        self.summary_keyed_log_data = {}
+        self.data_version += 1
+        return touched_axe_keys
+
+    def get_retain_event(self):
+        if not self.retain_raw:
+            return None
+        if self.columnar_store is not None:
+            return self.columnar_store.append_event
+        return self.keyed_log_data.append
+
+    # Keyed events as dicts, decoded from the columnar or spill store when one is used
+    def get_keyed_log_data(self) -> list[dict]:
+        if self.spill_store is not None:
+            return list(self.spill_store.iter_events())
+        if self.columnar_store is not None:
+            return self.columnar_store.get_events()
+        return self.keyed_log_data
+
+    # Streams from the spill store instead of materializing every event (exports)
+    def iter_keyed_log_data(self) -> Iterable[dict]:
+        if self.spill_store is not None:
+            return self.spill_store.iter_events()
+        return self.get_keyed_log_data()
+
+    # Inverted index over keyed_log_data or simplified_log_data_list, rebuilt after the data changes.
+    # None when the records are not held as a list (columnar keyed data uses its own masks, spilled data is streamed).
+    def get_field_index(self, dataset: str) -> FieldIndex | None:
+        if self.spill_store is not None:
+            return None
+        if dataset == 'keyed':
+            if self.columnar_store is not None:
+                return None
+            records = self.keyed_log_data
+        else:
+            records = self.simplified_log_data_list
+        field_index = self.field_indexes.get(dataset)
+        if field_index is None or field_index.records is not records or field_index.version != self.data_version or field_index.row_count != len(records):
+            field_index = self.field_indexes[dataset] = FieldIndex(records, self.data_version)
+        return field_index
+
+    # Row source for the query engine: the field index, the columnar store for columnar keyed data, or an unindexed copy of spilled data
+    def get_query_source(self, dataset: str) -> FieldIndex | ColumnarEventStore:
+        field_index = self.get_field_index(dataset)
+        if field_index is not None:
+            return field_index
+        if dataset == 'keyed' and self.columnar_store is not None and self.spill_store is None:
+            return self.columnar_store
+        return FieldIndex(self.get_keyed_log_data() if dataset == 'keyed' else self.get_simplified_log_data())
+
+    # Sorted eventTimestamp (keyed) or startTime/endTime (simplified) index, rebuilt after the data changes.
+    # Simplified operations without an endTime end at their startTime. None for spilled data.
+    def get_time_index(self, dataset: str) -> TimeIndex | None:
+        if self.spill_store is not None:
+            return None
+        if dataset == 'keyed':
+            row_count = len(self.columnar_store) if self.columnar_store is not None else len(self.keyed_log_data)
+        else:
+            row_count = len(self.simplified_log_data_list)
+        cached = self.time_indexes.get(dataset)
+        if cached is not None and cached[0] == self.data_version and cached[1] == row_count:
+            return cached[2]
+
+        fields = time_index_fields[dataset]
+        if dataset == 'keyed':
+            if self.columnar_store is not None:
+                start_times = self.columnar_store.get_event_times()
+            else:
+                start_times = get_time_array(event.get('eventTimestamp') for event in self.keyed_log_data)
+            time_index = TimeIndex(start_times, fields=fields)
+        else:
+            records = self.simplified_log_data_list
+            start_times = get_time_array(record.get('startTime') for record in records)
+            end_times = get_time_array(record.get('endTime') or record.get('startTime') for record in records)
+            time_index = TimeIndex(start_times, end_times, fields)
+        self.time_indexes[dataset] = (self.data_version, row_count, time_index)
+        return time_index
+
+    # Query engine: time field -> time index over the same rows as get_query_source
+    def get_time_indexes(self, dataset: str) -> dict[str, TimeIndex]:
+        time_index = self.get_time_index(dataset)
+        if time_index is None:
+            return {}
+        return {field: time_index for field in time_index.fields}
+
+    # Cached until the data changes, build makes the view on a miss
+    def get_dataframe_view(self, key: tuple, build: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+        return self.dataframe_views.get(key, self.data_version, build)
+
+    def get_simplified_log_data(self) -> list[dict]:
+        if self.spill_store is not None:
+            return list(self.spill_store.iter_simplified_events())
+        return self.simplified_log_data_list
+
+    def iter_simplified_log_data(self) -> Iterable[dict]:
+        if self.spill_store is not None:
+            return self.spill_store.iter_simplified_events()
+        return self.simplified_log_data_list
+
+    # Key events here and fold them in worker processes. Events of one axeKey always go to the same shard, in arrival order,
+    # so shard results merge without reconciliation. Events cross the process boundary as NDJSON bytes.
+    def merge_activity_pages_sharded(self, pages: Iterable[list[dict]], simplify_workers: int) -> None:
+        simplified_log_data_objects = self.simplified_log_data_objects
+        shard_connections = []
+        shard_processes = []
+        for shard in range(simplify_workers):
+            # Existing groups (e.g. from an earlier merge) continue in their shard
+            shard_objects = {axe_key: simplified_operation for axe_key, simplified_operation in simplified_log_data_objects.items() if get_axe_key_shard(axe_key, simplify_workers) == shard}
+            parent_connection, child_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=run_simplify_shard, args=(child_connection, shard_objects), daemon=True)
+            process.start()
+            child_connection.close()
+            shard_connections.append(parent_connection)
+            shard_processes.append(process)
+
+        shard_buffers: list[list[bytes]] = [[] for _ in range(simplify_workers)]
+        shard_buffer_sizes: list[int] = [0] * simplify_workers
+        new_axe_keys: dict[str, None] = {}  # Ordered set, keeps first seen order
+        shard_results: list[dict] = []
+        shard_error: Exception | None = None
+        retain_event = self.get_retain_event()
+        try:
+            for page in pages:
+                for raw_event, axe_key in zip(page, self.apply_axe_keys(page)):
+                    if not axe_key:
                         continue
-                if not simplified_event['startTime'] or event_time < datetime.strptime(simplified_event['startTime'], date_format):
-                    simplified_event['startTime'] = event_time.strftime(date_format)
-                    simplified_event['startStatus'] = raw_event['status']['value']
-
-                if not simplified_event['endTime'] or event_time > datetime.strptime(simplified_event['endTime'], date_format):
-                    simplified_event['endTime'] = event_time.strftime(date_format)
-                    simplified_event['endStatus'] = raw_event['status']['value']
-
-                # claims
-                claim_appid: str = self.get_object_value(raw_event, 'claims', 'appid')
-                if claim_appid:
-                    simplified_event['claims']['appid'] = claim_appid
-                claim_appidacr: str = self.get_object_value(raw_event, 'claims', 'appidacr')
-                if claim_appidacr:
-                    simplified_event['claims']['appidacr'] = claim_appidacr
-                claim_idtyp: str = self.get_object_value(raw_event, 'claims', 'idtyp')
-                if claim_idtyp:
-                    simplified_event['claims']['idtyp'] = claim_idtyp
-                claim_uti: str = self.get_object_value(raw_event, 'claims', 'uti')
-                if claim_uti:
-                    simplified_event['claims']['uti'] = claim_uti
-                claim_authnmethodsreferences: str = self.get_object_value(raw_event, 'claims', 'http://schemas.microsoft.com/claims/authnmethodsreferences')
-                if claim_authnmethodsreferences:
-                    simplified_event['claims']['authnmethodsreferences'] = claim_authnmethodsreferences
-
-                # body fields
-                request_body: str = self.get_object_value(raw_event, 'properties', 'requestbody')
-                if request_body:
-                    simplified_event['requestBody'] = json.loads(request_body)
-                response_body: str = self.get_object_value(raw_event, 'properties', 'responseBody')
-                if response_body:
-                    simplified_event['responseBody'] = json.loads(response_body)
-
-                # event Ids
-                id: str = self.get_object_value(raw_event, 'eventDataId')
-                if id:
-                    simplified_event['eventDataIds'].append(id)
-
-                # operation Ids
-                id: str = self.get_object_value(raw_event, 'operationId')
-                if id:
-                    simplified_event['operationIds'].add(id)
-        for simplified_event in simplified_log_data_objects.values():
-            simplified_event['operationIds'] = list(simplified_event['operationIds'])
-        return simplified_log_data_objects
+                    if axe_key not in simplified_log_data_objects:
+                        new_axe_keys[axe_key] = None
+                    self.keyed_log_summary.add_event(raw_event)
+                    shard = get_axe_key_shard(axe_key, simplify_workers)
+                    # Pages arrive decoded, so each event is encoded again for its shard. With orjson this is ~10us an event
+                    # (~25% of a serial fold); projecting the fold's fields first costs more in Python than it saves in bytes.
+                    line = dump_event_line(raw_event)
+                    shard_buffers[shard].append(line)
+                    shard_buffer_sizes[shard] += len(line)
+                    if shard_buffer_sizes[shard] >= SIMPLIFY_CHUNK_BYTES:
+                        shard_connections[shard].send_bytes(b'\n'.join(shard_buffers[shard]))
+                        shard_buffers[shard] = []
+                        shard_buffer_sizes[shard] = 0
+                    if retain_event:
+                        retain_event(raw_event)
+                    self.processed_event_count += 1
+
+            for shard, shard_connection in enumerate(shard_connections):
+                if shard_buffers[shard]:
+                    shard_connection.send_bytes(b'\n'.join(shard_buffers[shard]))
+                shard_connection.send_bytes(b'')  # End of input
+            shard_results = [shard_connection.recv() for shard_connection in shard_connections]
+        except (EOFError, OSError) as e:
+            shard_error = e
+        finally:
+            for shard_connection in shard_connections:
+                shard_connection.close()
+            for process in shard_processes:
+                process.join(timeout=5)
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
+
+        # The failed shard held its groups, a partial merge would silently drop them
+        if shard_error is not None:
+            azure_activity_logger.critical(f'Simplify worker failed: {shard_error}')
+            raise SimplifyWorkerError(f'A simplify worker failed, the run was stopped: {shard_error}') from shard_error
+
+        # Existing groups keep their position, new groups follow in first seen order
+        merged_objects: dict = {}
+        for shard_objects in shard_results:
+            merged_objects.update(shard_objects)
+        for axe_key in list(simplified_log_data_objects) + list(new_axe_keys):
+            if axe_key in merged_objects:
+                simplified_log_data_objects[axe_key] = merged_objects[axe_key]
+        self.summary_keyed_log_data = {}
+        self.data_version += 1
+
+    # Completion-aware emission for streaming & follow. A group is emitted and dropped from memory once it has a terminal status
+    # and no event for quiet_period, measured in event time against the newest event seen. Late events for an emitted axeKey fold into
+    # a new group that is emitted as an update record, holding only the late events. flush emits every remaining group as incomplete.
+    # The working set stays proportional to in-flight operations instead of total volume.
+    # emitted_id_cutoff is the earliest event time a later poll can re-read, the overlap before the watermark by default.
+    def pop_completed_operations(self, quiet_period: timedelta, flush: bool = False, emitted_id_cutoff: datetime | None = None) -> list[dict]:
+        simplified_log_data_objects = self.simplified_log_data_objects
+        for simplified_operation in simplified_log_data_objects.values():
+            end_time = simplified_operation.end_time
+            if end_time is not None and (self.event_time_watermark is None or end_time > self.event_time_watermark):
+                self.event_time_watermark = end_time
+        if self.event_time_watermark is None and not flush:
+            return []
+
+        completed_operations: list[dict] = []
+        for axe_key, simplified_operation in list(simplified_log_data_objects.items()):
+            if flush:
+                record_type = 'incomplete'
+            elif simplified_operation.has_terminal_status() and simplified_operation.end_time is not None and simplified_operation.end_time + quiet_period <= self.event_time_watermark:
+                record_type = 'completed'
+            else:
+                continue
+            simplified_event = simplified_operation.to_dict()
+            simplified_event['recordType'] = 'update' if axe_key in self.emitted_axe_keys else record_type
+            completed_operations.append(simplified_event)
+
+            # Drop the group and its position, its eventDataIds move to the emitted ids
+            del simplified_log_data_objects[axe_key]
+            self.simplified_log_data_positions.pop(axe_key, None)
+            if self.seen_event_data_ids is not None:
+                self.seen_event_data_ids.difference_update(simplified_operation.event_data_ids)
+            emitted_time = simplified_operation.end_time or self.event_time_watermark
+            if emitted_time is not None:
+                self.emitted_event_data_ids.update(dict.fromkeys(simplified_operation.event_data_ids, emitted_time))
+                # An update group only holds the late events, keep the newest end time of the operation
+                self.emitted_axe_keys[axe_key] = max(emitted_time, self.emitted_axe_keys.get(axe_key, emitted_time))
+        if emitted_id_cutoff is None and self.event_time_watermark is not None:
+            emitted_id_cutoff = self.event_time_watermark - timedelta(minutes=FOLLOW_OVERLAP_MINUTES)
+        if emitted_id_cutoff is not None:
+            self.emitted_axe_keys = {axe_key: emitted_time for axe_key, emitted_time in self.emitted_axe_keys.items() if emitted_time >= emitted_id_cutoff}
+            self.emitted_event_data_ids = {event_data_id: emitted_time for event_data_id, emitted_time in self.emitted_event_data_ids.items() if emitted_time >= emitted_id_cutoff}
+        if completed_operations and self._simplified_log_data_list:
+            self._simplified_log_data_list = [simplified_event for simplified_event in self._simplified_log_data_list if simplified_event['axeKey'] in simplified_log_data_objects]
+            self.simplified_log_data_positions = {}
+            self.data_version += 1
+        return completed_operations
+
+    # Follow without emission: groups that reached a terminal status and ended before cutoff (the earliest event time a poll re-reads)
+    # are dropped, later events for their axeKey start a new group. The dedupe set is rebuilt from the remaining groups on the next
+    # add_events, so both stay proportional to the overlap window instead of the whole follow. Returns the dropped group count.
+    def prune_settled_operations(self, cutoff: datetime) -> int:
+        simplified_log_data_objects = self.simplified_log_data_objects
+        settled_axe_keys = [axe_key for axe_key, simplified_operation in simplified_log_data_objects.items()
+                            if simplified_operation.has_terminal_status() and simplified_operation.end_time is not None and simplified_operation.end_time < cutoff]
+        if not settled_axe_keys:
+            return 0
+        for axe_key in settled_axe_keys:
+            del simplified_log_data_objects[axe_key]
+        self.seen_event_data_ids = None
+        if self._simplified_log_data_list:
+            self._simplified_log_data_list = [simplified_event for simplified_event in self._simplified_log_data_list if simplified_event['axeKey'] in simplified_log_data_objects]
+        self.simplified_log_data_positions = {}
+        self.data_version += 1
+        return len(settled_axe_keys)
+
+    # Serializable copy of one group
+    def get_simplified_event(self, axe_key: str) -> dict | None:
+        simplified_operation = self.simplified_log_data_objects.get(axe_key)
+        if simplified_operation is None:
+            return None
+        return simplified_operation.to_dict()
+
+    # Fold one keyed event into its axe_key group
+    def fold_simplified_event(self, simplified_log_data_objects: dict, raw_event: dict) -> None:
+        axe_key = raw_event.get('axeKey')
+        if not axe_key:
+            return
+        simplified_operation = simplified_log_data_objects.get(axe_key)
+        if simplified_operation is None:
+            simplified_operation = simplified_log_data_objects[axe_key] = SimplifiedOperation(axe_key)
+        simplified_operation.add_event(raw_event)
 
     # Re-orient data to simplify structure. Ensures axeKey is part of the log dict, not a parent element.
     def get_simplified_azure_activity_list(self, simplified_azure_activity_object: dict) -> None:
+        self.simplified_log_data_list = []
         for key, value in simplified_azure_activity_object.items():
             full_event = {'axeKey': key}
             full_event.update(value)
 
             self.simplified_log_data_list.append(full_event)
-
-    def get_object_value(self, dictObject: dict, *keys) -> Optional[Any]:
-        value: Any = dictObject
-        for key in keys:
-            value = value.get(key)
-            if value is None:
-                # azure_activity_logger.warning(f'The provided key did not return a value: {key}.')
-                return None
-        return value
-
-    def get_unique_values(self, dictObjectList: list[dict], *keys) -> list:
-        if not dictObjectList:
-            azure_activity_logger.warning('No activity logs exist.')
-            return []
-
-        unique_values = set()
-        for raw_event in dictObjectList:
-            value: Any = self.get_object_value(raw_event, *keys)
-            if value is not None and not isinstance(value, dict):
-                unique_values.add(value)
-            else:
-                azure_activity_logger.warning(f'The result from the key was a dict: {keys}, value: {value}.')
-
-        if not unique_values:
-            azure_activity_logger.warning(f'No unique values found for key: {keys}.')
-            return []
-
-        return sorted(unique_values)
-
-    def get_unique_values_count(self, unique_values: list) -> int:
-        if not unique_values:
-            azure_activity_logger.warning('No unique values.')
-            return 0
-
-        return len(unique_values)
+        self.data_version += 1
 
     def get_keyed_event_count(self) -> int:
+        if self.spill_store is not None and len(self.spill_store):
+            return len(self.spill_store)
+        if self.columnar_store is not None and len(self.columnar_store):
+            return len(self.columnar_store)
         if self.keyed_log_data:
             return len(self.keyed_log_data)
         azure_activity_logger.warning(f'Keyed log is empty.')
         return 0
 
-    # Note to self: May move this to allow filters
-    def get_keyed_log_summary(self) -> dict:
-        self.summary_keyed_log_data['Total Event Count'] = self.get_keyed_event_count()
-        self.summary_keyed_log_data['Axe Key Count'] = self.get_unique_values_count(self.get_unique_values(self.keyed_log_data, 'axeKey'))
-        self.summary_keyed_log_data['Correlation Id Count'] = self.get_unique_values_count(self.get_unique_values(self.keyed_log_data, 'correlationId'))
-        self.summary_keyed_log_data['Operation Id Count'] = self.get_unique_values_count(self.get_unique_values(self.keyed_log_data, 'operationId'))
-        self.summary_keyed_log_data['Operation Name Count'] = self.get_unique_values_count(self.get_unique_values(self.keyed_log_data, 'operationName', 'value'))
-        self.summary_keyed_log_data['Resource Provider Name Count'] = self.get_unique_values_count(self.get_unique_values(self.keyed_log_data, 'resourceProviderName', 'value'))
+    # Counters are maintained as events are keyed, top adds status counts, time bounds and the top N operations, callers & providers
+    def get_keyed_log_summary(self, top: int = 0) -> dict:
+        self.summary_keyed_log_data = self.keyed_log_summary.get_summary(top)
+        return self.summary_keyed_log_data
+
+
+def get_axe_key_shard(axe_key: str, shard_count: int) -> int:
+    return int(axe_key[:8], 16) % shard_count
+
+
+# Worker process: folds NDJSON chunks for one shard until an empty chunk arrives, then returns its groups
+def run_simplify_shard(connection, simplified_log_data_objects: dict) -> None:
+    processor = AzureActivityProcessor()
+    while True:
+        chunk = connection.recv_bytes()
+        if not chunk:
+            break
+        for line in chunk.split(b'\n'):
+            processor.fold_simplified_event(simplified_log_data_objects, load_event_line(line))
+    connection.send(simplified_log_data_objects)
+    connection.close()
@@ -27,20 +27,64 @@ License: Apache License
 #   limitations under the License.
 
 import hashlib
+from app.utils.config import AXE_KEY_CACHE_SIZE, valid_axe_key_hash_modes
 from app.utils.logger import get_logger
+from typing import Iterable
+
+try:
+    import xxhash
+except ImportError:  # Optional, only required for the xxhash axe key mode
+    xxhash = None
 
 axe_key_logger = get_logger('azure_axe_key')
 
-def get_axe_key(cor_id: str | None, operation_name: str | None, resource_id: str | None) -> str | None:
+# Events of one operation share the same (correlationId, operationName, resourceId) triple, repeats skip the lowercasing & hashing.
+# Bounded per hash mode, cleared when full (events of an operation arrive close together).
+axe_key_caches: dict[str, dict[tuple[str, str, str], str]] = {hash_mode: {} for hash_mode in valid_axe_key_hash_modes}
+
+def get_axe_key(cor_id: str | None, operation_name: str | None, resource_id: str | None, hash_mode: str = 'md5') -> str | None:
     if cor_id and operation_name and resource_id:
+        key_fields = (cor_id, operation_name, resource_id)
+        axe_key_cache = axe_key_caches.get(hash_mode, {})
+        axe_key = axe_key_cache.get(key_fields)
+        if axe_key is not None:
+            return axe_key
         try:
-            cor_id = cor_id.lower()
-            operation_name = operation_name.lower()
-            resource_id = resource_id.lower()
-
-            return hashlib.md5((f'{cor_id}:{operation_name}:{resource_id}').encode()).hexdigest()
+            axe_key = get_hashed_axe_key(cor_id.lower(), operation_name.lower(), resource_id.lower(), hash_mode)
+            if len(axe_key_cache) >= AXE_KEY_CACHE_SIZE:
+                axe_key_cache.clear()
+            axe_key_cache[key_fields] = axe_key
+            return axe_key
         except Exception as e:
             axe_key_logger.error(f'Axe key creation failure: {e}')
 
     # Missing data
-    axe_key_logger.critical(f'Missing data, key cannot be created.')
\ No newline at end of file
+    axe_key_logger.critical(f'Missing data, key cannot be created.')
+
+
+# md5 is the compatible default (Sentinel query, earlier outputs), blake2b & xxhash keys are for internal grouping only
+def get_hashed_axe_key(cor_id: str, operation_name: str, resource_id: str, hash_mode: str = 'md5') -> str:
+    key_source = f'{cor_id}:{operation_name}:{resource_id}'.encode()
+    if hash_mode == 'md5':
+        return hashlib.md5(key_source).hexdigest()
+    elif hash_mode == 'blake2b':
+        return hashlib.blake2b(key_source, digest_size=16).hexdigest()
+    elif hash_mode == 'xxhash' and xxhash is not None:
+        return xxhash.xxh3_128_hexdigest(key_source)
+    raise ValueError(f'Unavailable axe key hash mode: {hash_mode}')
+
+
+# Batch API, keys a whole page of (correlationId, operationName, resourceId) triples. Cache hits skip the per key call.
+def get_axe_keys(key_fields: Iterable[tuple[str | None, str | None, str | None]], hash_mode: str = 'md5') -> list[str | None]:
+    axe_key_cache = axe_key_caches.get(hash_mode, {})
+    axe_keys: list[str | None] = []
+    for cor_id, operation_name, resource_id in key_fields:
+        axe_key = axe_key_cache.get((cor_id, operation_name, resource_id))
+        if axe_key is None:
+            axe_key = get_axe_key(cor_id, operation_name, resource_id, hash_mode)
+        axe_keys.append(axe_key)
+    return axe_keys
+
+
+def is_axe_key_hash_mode_available(hash_mode: str) -> bool:
+    return hash_mode != 'xxhash' or xxhash is not None
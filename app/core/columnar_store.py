@@ -0,0 +1,136 @@
+"""
+Tool Name: Azure Activity Log Axe
+Script Name: columnar_store.py
+Author: Nathan Eades
+Date: 2024-06-01
+Description: Columnar (NumPy) store of axe keyed events for vectorized filters, counts and exports.
+License: Apache License
+"""
+
+#   This file is part of Azure Activity Log Axe.
+#
+#   Copyright 2024 Permiso Security <https://permiso.io>
+#         Nathan Eades:
+#             - LinkedIn: <@eadesclouddef>
+#             - GitHub: <eadesclouddef> or <neades2305>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import numpy as np
+from app.utils.file_io import dump_event_line, load_event_line
+from app.utils.logger import get_logger
+from app.utils.timestamps import get_event_time_microseconds
+from array import array
+from typing import Callable, Iterable
+
+columnar_store_logger = get_logger('columnar_store')
+
+# Column name (matches the df_filter field name), path to the value in the raw event
+columnar_hot_fields: dict[str, tuple[str, ...]] = {
+    'axeKey': ('axeKey',),
+    'correlationId': ('correlationId',),
+    'operationId': ('operationId',),
+    'operationName': ('operationName', 'value'),
+    'resourceProviderName': ('resourceProviderName', 'value'),
+    'status': ('status', 'value'),
+    'caller': ('caller',),
+}
+
+
+class ColumnarEventStore:
+    # Hot fields are dictionary encoded (code 0 is None) into int32 code columns, eventTimestamp is int64 microseconds since epoch.
+    # The full event is kept as a compact json blob in one buffer, decoded only for the rows an export needs.
+    def __init__(self):
+        self.column_codes: dict[str, array] = {column: array('i') for column in columnar_hot_fields}
+        self.column_values: dict[str, list[str | None]] = {column: [None] for column in columnar_hot_fields}
+        self.column_lookup: dict[str, dict[str | None, int]] = {column: {None: 0} for column in columnar_hot_fields}
+        self.event_times: array = array('q')
+        self.blobs: bytearray = bytearray()
+        self.blob_offsets: array = array('q', [0])
+        # Read only numpy views over column_codes, dropped on append (an array exporting its buffer cannot grow)
+        self.code_views: dict[str, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self.event_times)
+
+    def append_events(self, keyed_events: Iterable[dict]) -> None:
+        for raw_event in keyed_events:
+            self.append_event(raw_event)
+
+    def append_event(self, raw_event: dict) -> None:
+        if self.code_views:
+            self.code_views.clear()
+        for column, path in columnar_hot_fields.items():
+            value = raw_event.get(path[0])
+            if len(path) > 1:
+                value = value.get(path[1]) if isinstance(value, dict) else None
+            if not isinstance(value, str):
+                value = None
+            lookup = self.column_lookup[column]
+            code = lookup.get(value)
+            if code is None:
+                code = lookup[value] = len(self.column_values[column])
+                self.column_values[column].append(value)
+            self.column_codes[column].append(code)
+
+        self.event_times.append(get_event_time_microseconds(raw_event.get('eventTimestamp')))
+
+        self.blobs += dump_event_line(raw_event)
+        self.blob_offsets.append(len(self.blobs))
+
+    def get_codes(self, column: str) -> np.ndarray:
+        # Zero copy view, cached until the next append. Callers use it and let it go, a view held across an append makes the append fail.
+        codes = self.code_views.get(column)
+        if codes is None:
+            codes = self.code_views[column] = np.frombuffer(self.column_codes[column], dtype=np.int32)
+            codes.flags.writeable = False
+        return codes
+
+    def get_event_times(self) -> np.ndarray:
+        return np.array(self.event_times, dtype=np.int64)
+
+    def get_mask(self, column: str, values: Iterable[str]) -> np.ndarray:
+        lookup = self.column_lookup[column]
+        matched_codes = [lookup[value] for value in values if value in lookup]
+        return np.isin(self.get_codes(column), matched_codes)
+
+    # Query engine source: hot fields are answered from the code columns, test runs once per distinct value
+    @property
+    def row_count(self) -> int:
+        return len(self)
+
+    def is_indexable(self, column: str) -> bool:
+        return column in columnar_hot_fields
+
+    def get_mask_where(self, column: str, test: Callable[[str], bool]) -> np.ndarray:
+        matched_codes = [code for code, value in enumerate(self.column_values[column]) if value is not None and test(value)]
+        return np.isin(self.get_codes(column), matched_codes)
+
+    def get_records(self, indices: Iterable[int]) -> list[dict]:
+        return self.get_events(indices)
+
+    def get_value_counts(self, column: str) -> dict[str, int]:
+        counts = np.bincount(self.get_codes(column), minlength=len(self.column_values[column]))
+        column_values = self.column_values[column]
+        return {column_values[code]: int(count) for code, count in enumerate(counts) if count and code}
+
+    def get_distinct_count(self, column: str) -> int:
+        counts = np.bincount(self.get_codes(column), minlength=1)
+        return int(np.count_nonzero(counts[1:]))
+
+    def get_events(self, indices: Iterable[int] | None = None) -> list[dict]:
+        if indices is None:
+            indices = range(len(self))
+        blobs = memoryview(self.blobs)
+        blob_offsets = self.blob_offsets
+        return [load_event_line(bytes(blobs[blob_offsets[index]:blob_offsets[index + 1]])) for index in indices]
@@ -0,0 +1,74 @@
+"""
+Tool Name: Azure Activity Log Axe
+Script Name: dataframe_views.py
+Author: Nathan Eades
+Date: 2024-06-01
+Description: Versioned LRU cache of DataFrame views shared by the show, save and aggrid commands.
+License: Apache License
+"""
+
+#   This file is part of Azure Activity Log Axe.
+#
+#   Copyright 2024 Permiso Security <https://permiso.io>
+#         Nathan Eades:
+#             - LinkedIn: <@eadesclouddef>
+#             - GitHub: <eadesclouddef> or <neades2305>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import pandas as pd
+from app.utils.config import DATAFRAME_VIEW_CACHE_SIZE
+from app.utils.logger import get_logger
+from collections import OrderedDict
+from typing import Callable
+
+dataframe_views_logger = get_logger('dataframe_views')
+
+
+class DataFrameViewCache:
+    # Full and filtered DataFrames of the keyed & simplified data, least recently used views are evicted past max_views.
+    # Views belong to one processor data_version, they are only dropped when the underlying data changes.
+    # Views are shared, callers copy before modifying them.
+    def __init__(self, max_views: int = DATAFRAME_VIEW_CACHE_SIZE):
+        self.max_views = max_views
+        self.version: int | None = None
+        self.views: OrderedDict[tuple, pd.DataFrame] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple, version: int, build: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+        if version != self.version:
+            self.views.clear()
+            self.version = version
+        view = self.views.get(key)
+        if view is not None:
+            self.views.move_to_end(key)
+            self.hits += 1
+            return view
+
+        self.misses += 1
+        view = build()
+        # Empty results are not kept, a failed filter logs its warning again when repeated
+        if view is not None and not view.empty:
+            self.views[key] = view
+            if len(self.views) > self.max_views:
+                self.views.popitem(last=False)
+        return view
+
+    def clear(self) -> None:
+        self.views.clear()
+
+
+# Condition order does not change a filter result, (dataset, kind, select, sorted selects, sorted deselects, query)
+def get_view_key(dataset: str, kind: str, select: str | None, field_value_select: tuple | None, field_value_deselect: tuple | None, query: str | None = None) -> tuple:
+    return (dataset, kind, select or None, tuple(sorted(set(field_value_select or ()))), tuple(sorted(set(field_value_deselect or ()))), query.strip() if query else None)
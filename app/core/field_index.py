@@ -0,0 +1,141 @@
+"""
+Tool Name: Azure Activity Log Axe
+Script Name: field_index.py
+Author: Nathan Eades
+Date: 2024-06-01
+Description: Inverted field indexes (value to row ids) for --field-value-select & --field-value-deselect.
+License: Apache License
+"""
+
+#   This file is part of Azure Activity Log Axe.
+#
+#   Copyright 2024 Permiso Security <https://permiso.io>
+#         Nathan Eades:
+#             - LinkedIn: <@eadesclouddef>
+#             - GitHub: <eadesclouddef> or <neades2305>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import numpy as np
+from .field_paths import compile_field_path, get_terminal_value, is_field_path
+from app.utils.logger import get_logger
+from typing import Any, Callable, Iterable
+
+field_index_logger = get_logger('field_index')
+
+
+class FieldIndex:
+    # Inverted index over one record list (keyed or simplified data). Each field is indexed on first use, value -> sorted int32 row ids.
+    # Dict fields are indexed on their 'value' (operationName, status...), the same match df_filter makes.
+    # List fields (statuses, operationIds) post a row under each element, so a value matches when any element equals it.
+    # A field that is missing from every record or holds other unhashable values is not indexable, callers fall back to df_filter.
+    # Dotted paths (claims.appid, requestBody.properties.*) are indexed through their compiled accessor, a row is posted under every value found.
+    def __init__(self, records: list[dict], version: int = 0):
+        self.records = records
+        self.version = version
+        self.row_count = len(records)
+        self.postings: dict[str, dict[Any, np.ndarray] | None] = {}
+        self.columns: list[str] | None = None
+
+    def get_postings(self, field: str) -> dict[Any, np.ndarray] | None:
+        if field not in self.postings:
+            if is_field_path(field):
+                self.postings[field] = build_path_postings(self.records, field)
+            else:
+                self.postings[field] = build_postings(self.records, field)
+        return self.postings[field]
+
+    def is_indexable(self, field: str) -> bool:
+        return self.get_postings(field) is not None
+
+    # Bitmap of the rows whose field value is one of values
+    def get_mask(self, field: str, values: Iterable[str]) -> np.ndarray:
+        postings = self.get_postings(field) or {}
+        mask = np.zeros(self.row_count, dtype=bool)
+        for value in values:
+            row_ids = postings.get(value)
+            if row_ids is not None:
+                mask[row_ids] = True
+        return mask
+
+    # Bitmap of the rows with a value that passes test, test runs once per distinct value (query engine)
+    def get_mask_where(self, field: str, test: Callable[[str], bool]) -> np.ndarray:
+        postings = self.get_postings(field) or {}
+        mask = np.zeros(self.row_count, dtype=bool)
+        for value, row_ids in postings.items():
+            value = get_terminal_value(value)
+            if value is not None and test(value):
+                mask[row_ids] = True
+        return mask
+
+    # conditions: (field, values, deselect). Selects intersect, deselects subtract, returns the matching row ids in record order
+    def get_row_ids(self, conditions: list[tuple[str, list[str], bool]]) -> np.ndarray:
+        mask = np.ones(self.row_count, dtype=bool)
+        for field, values, deselect in conditions:
+            field_mask = self.get_mask(field, values)
+            if deselect:
+                mask &= ~field_mask
+            else:
+                mask &= field_mask
+        return np.flatnonzero(mask)
+
+    # Columns of the full record list in DataFrame order (first appearance), so a filtered frame keeps every column
+    def get_columns(self) -> list[str]:
+        if self.columns is None:
+            columns: dict[str, None] = {}
+            for record in self.records:
+                if not columns.keys() >= record.keys():
+                    columns.update(dict.fromkeys(record))
+            self.columns = list(columns)
+        return self.columns
+
+    def get_records(self, row_ids: Iterable[int]) -> list[dict]:
+        records = self.records
+        return [records[row_id] for row_id in row_ids]
+
+
+def build_postings(records: list[dict], field: str) -> dict[Any, np.ndarray] | None:
+    postings: dict[Any, list[int]] = {}
+    present = False
+    for row_id, record in enumerate(records):
+        if field not in record:
+            continue
+        present = True
+        field_value = record[field]
+        elements = field_value if isinstance(field_value, list) else (field_value,)
+        try:
+            for value in set(element.get('value') if isinstance(element, dict) else element for element in elements):
+                row_ids = postings.get(value)
+                if row_ids is None:
+                    postings[value] = [row_id]
+                else:
+                    row_ids.append(row_id)
+        except TypeError:  # Unhashable values (nested lists) are not indexed
+            field_index_logger.debug(f'Field {field} holds unhashable values, not indexed.')
+            return None
+    if not present:
+        return None
+    return {value: np.array(row_ids, dtype=np.int32) for value, row_ids in postings.items()}
+
+
+def build_path_postings(records: list[dict], path: str) -> dict[Any, np.ndarray]:
+    accessor = compile_field_path(path)
+    postings: dict[Any, list[int]] = {}
+    for row_id, record in enumerate(records):
+        for value in set(accessor(record)):
+            row_ids = postings.get(value)
+            if row_ids is None:
+                postings[value] = [row_id]
+            else:
+                row_ids.append(row_id)
+    return {value: np.array(row_ids, dtype=np.int32) for value, row_ids in postings.items()}
@@ -0,0 +1,166 @@
+"""
+Tool Name: Azure Activity Log Axe
+Script Name: field_paths.py
+Author: Nathan Eades
+Date: 2024-06-01
+Description: Dotted field paths (claims.appid, requestBody.properties.*) compiled into accessors for nested filters.
+License: Apache License
+"""
+
+#   This file is part of Azure Activity Log Axe.
+#
+#   Copyright 2024 Permiso Security <https://permiso.io>
+#         Nathan Eades:
+#             - LinkedIn: <@eadesclouddef>
+#             - GitHub: <eadesclouddef> or <neades2305>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import re
+from app.utils.logger import get_logger
+from typing import Any, Callable, Iterable
+
+field_paths_logger = get_logger('field_paths')
+
+WILDCARD: str = '*'
+# One path segment: a bracketed quoted key (dots & colons allowed), a bracketed index or *, or a bare dotted key
+field_path_segment_pattern = re.compile(r"""\[\s*'((?:[^'\\]|\\.)*)'\s*\]|\[\s*"((?:[^"\\]|\\.)*)"\s*\]|\[([^\]'"]*)\]|([^.\[\]]+)""")
+
+# Compiled accessors per path, a path is compiled once per process
+compiled_field_paths: dict[str, Callable[[dict], tuple]] = {}
+
+
+def is_field_path(field: str) -> bool:
+    return '.' in field or '[' in field
+
+
+# claims.appid, claims['http://schemas.xmlsoap.org/ws/2005/05/identity/claims/upn'], operationIds[0]: dots separate bare keys,
+# a bracket holds one quoted key (which may contain dots) or an index / *. Raises ValueError on a malformed path.
+def split_field_path(path: str) -> tuple[str, ...]:
+    segments: list[str] = []
+    position = 0
+    while position < len(path):
+        if segments and path[position] == '.':
+            position += 1
+        match = field_path_segment_pattern.match(path, position)
+        if not match:
+            raise ValueError(f'Invalid field path {path!r} at position {position}.')
+        single_quoted, double_quoted, bracketed, bare = match.groups()
+        quoted = single_quoted if single_quoted is not None else double_quoted
+        segments.append(re.sub(r'\\(.)', r'\1', quoted) if quoted is not None else (bracketed if bracketed is not None else bare).strip())
+        position = match.end()
+    if not segments:
+        raise ValueError(f'Invalid field path {path!r}.')
+    return tuple(segments)
+
+
+# field:value,value filter conditions, the field ends at the first ':' outside a bracketed key
+def split_field_condition(condition: str) -> tuple[str, str]:
+    position = 0
+    while True:
+        colon = condition.find(':', position)
+        bracket = condition.find('[', position)
+        if colon == -1:
+            raise ValueError(f'Missing ":" in field value filter {condition!r}.')
+        if bracket == -1 or colon < bracket:
+            return condition[:colon], condition[colon + 1:]
+        match = field_path_segment_pattern.match(condition, bracket)
+        if not match:
+            raise ValueError(f'Invalid field path in field value filter {condition!r}.')
+        position = match.end()
+
+
+# Accessor returning every value at the path as a tuple (empty when the path is missing).
+# Segments are dict keys or list indexes, * matches every dict value or list item.
+# A terminal {'value': ..., 'localizedValue': ...} dict matches on its value, as top level filters do.
+def compile_field_path(path: str) -> Callable[[dict], tuple]:
+    accessor = compiled_field_paths.get(path)
+    if accessor is not None:
+        return accessor
+
+    segments: tuple[str, ...] = split_field_path(path)
+    if WILDCARD not in segments:
+        def accessor(record: dict) -> tuple:
+            value: Any = record
+            for segment in segments:
+                value = get_segment_value(value, segment)
+                if value is None:
+                    return ()
+            return get_terminal_values(value)
+    else:
+        def accessor(record: dict) -> tuple:
+            values: list = [record]
+            for segment in segments:
+                next_values: list = []
+                for value in values:
+                    if segment == WILDCARD:
+                        if isinstance(value, dict):
+                            next_values.extend(value.values())
+                        elif isinstance(value, list):
+                            next_values.extend(value)
+                    else:
+                        value = get_segment_value(value, segment)
+                        if value is not None:
+                            next_values.append(value)
+                values = next_values
+                if not values:
+                    return ()
+            return tuple(terminal_value for value in values for terminal_value in get_terminal_values(value))
+
+    compiled_field_paths[path] = accessor
+    return accessor
+
+
+def get_segment_value(value: Any, segment: str) -> Any:
+    if isinstance(value, dict):
+        return value.get(segment)
+    if isinstance(value, list) and segment.isdigit():
+        index = int(segment)
+        return value[index] if index < len(value) else None
+    return None
+
+
+# A list matches on any of its elements (statuses, operationIds), the same rows the field index posts it under
+def get_terminal_values(value: Any) -> tuple:
+    if isinstance(value, list):
+        return tuple(terminal_value for terminal_value in map(get_terminal_value, value) if terminal_value is not None)
+    value = get_terminal_value(value)
+    return () if value is None else (value,)
+
+
+# Filter values are text: numbers & booleans compare as their json text, dicts & lists are not matchable
+def get_terminal_value(value: Any) -> str | None:
+    if isinstance(value, dict):
+        value = value.get('value')
+    if isinstance(value, str) or value is None:
+        return value
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, float)):
+        return str(value)
+    return None
+
+
+# One pass over the records for every path condition. conditions: (path, values, deselect).
+# A record is selected when any value at the path is in values, deselected the same way.
+def filter_records(records: Iterable[dict], conditions: list[tuple[str, list[str], bool]]) -> list[dict]:
+    compiled_conditions = [(compile_field_path(path), frozenset(values), deselect) for path, values, deselect in conditions]
+    filtered_records: list[dict] = []
+    for record in records:
+        for accessor, values, deselect in compiled_conditions:
+            matched = not values.isdisjoint(accessor(record))
+            if matched == deselect:
+                break
+        else:
+            filtered_records.append(record)
+    return filtered_records
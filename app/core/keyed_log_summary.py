@@ -0,0 +1,224 @@
+"""
+Tool Name: Azure Activity Log Axe
+Script Name: keyed_log_summary.py
+Author: Nathan Eades
+Date: 2024-06-01
+Description: Incremental summary counters of axe keyed events.
+License: Apache License
+"""
+
+#   This file is part of Azure Activity Log Axe.
+#
+#   Copyright 2024 Permiso Security <https://permiso.io>
+#         Nathan Eades:
+#             - LinkedIn: <@eadesclouddef>
+#             - GitHub: <eadesclouddef> or <neades2305>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import json
+from .sketches import CountMinSketch, HyperLogLog
+from app.utils.logger import get_logger
+from app.utils.timestamps import format_event_timestamp, parse_event_timestamp
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+keyed_log_summary_logger = get_logger('keyed_log_summary')
+
+# Summary name, path to the value in the raw event
+approximate_distinct_fields: dict[str, tuple[str, ...]] = {
+    'axeKey': ('axeKey',),
+    'correlationId': ('correlationId',),
+    'operationId': ('operationId',),
+    'operationName': ('operationName', 'value'),
+    'resourceProviderName': ('resourceProviderName', 'value'),
+}
+approximate_frequency_fields: dict[str, tuple[str, ...]] = {
+    'operationName': ('operationName', 'value'),
+    'caller': ('caller',),
+    'resourceProviderName': ('resourceProviderName', 'value'),
+}
+
+
+class KeyedLogSummary:
+    # Updated once per keyed event so the summary never rescans the events
+    def __init__(self):
+        self.event_count: int = 0
+        self.axe_keys: set[str] = set()
+        self.correlation_ids: set[str] = set()
+        self.operation_ids: set[str] = set()
+        self.status_counts: Counter = Counter()
+        self.operation_name_counts: Counter = Counter()
+        self.caller_counts: Counter = Counter()
+        self.resource_provider_name_counts: Counter = Counter()
+        self.first_event_time: datetime | None = None
+        self.last_event_time: datetime | None = None
+
+    def add_event(self, raw_event: dict) -> None:
+        self.event_count += 1
+        self.add_event_time(raw_event)
+        self.add_distinct_values(raw_event)
+        add_counted_value(self.status_counts, get_value(raw_event.get('status')))
+        add_counted_value(self.operation_name_counts, get_value(raw_event.get('operationName')))
+        add_counted_value(self.caller_counts, raw_event.get('caller'))
+        add_counted_value(self.resource_provider_name_counts, get_value(raw_event.get('resourceProviderName')))
+
+    def add_distinct_values(self, raw_event: dict) -> None:
+        add_distinct_value(self.axe_keys, raw_event.get('axeKey'))
+        add_distinct_value(self.correlation_ids, raw_event.get('correlationId'))
+        add_distinct_value(self.operation_ids, raw_event.get('operationId'))
+
+    # Axe key, correlation id & operation id counts
+    def get_distinct_counts(self) -> tuple[int, int, int]:
+        return len(self.axe_keys), len(self.correlation_ids), len(self.operation_ids)
+
+    def add_event_time(self, raw_event: dict) -> None:
+        event_time = raw_event.get('eventTimestamp')
+        if event_time:
+            try:
+                event_time = parse_event_timestamp(event_time)
+            except ValueError:
+                return
+            if self.first_event_time is None or event_time < self.first_event_time:
+                self.first_event_time = event_time
+            if self.last_event_time is None or event_time > self.last_event_time:
+                self.last_event_time = event_time
+
+    # Same counts as the original full scan summary, top adds status counts, time bounds and the top N operations, callers & providers
+    def get_summary(self, top: int = 0) -> dict:
+        axe_key_count, correlation_id_count, operation_id_count = self.get_distinct_counts()
+        summary = {
+            'Total Event Count': self.event_count,
+            'Axe Key Count': axe_key_count,
+            'Correlation Id Count': correlation_id_count,
+            'Operation Id Count': operation_id_count,
+            'Operation Name Count': len(self.operation_name_counts),
+            'Resource Provider Name Count': len(self.resource_provider_name_counts),
+        }
+        if top > 0:
+            summary['First Event Time'] = format_event_timestamp(self.first_event_time) if self.first_event_time else None
+            summary['Last Event Time'] = format_event_timestamp(self.last_event_time) if self.last_event_time else None
+            summary['Status Counts'] = dict(self.status_counts.most_common())
+            summary['Top Operations'] = dict(self.operation_name_counts.most_common(top))
+            summary['Top Callers'] = dict(self.caller_counts.most_common(top))
+            summary['Top Resource Providers'] = dict(self.resource_provider_name_counts.most_common(top))
+        return summary
+
+
+class ApproximateKeyedLogSummary(KeyedLogSummary):
+    # Fixed memory summary: HyperLogLog distinct counts and count-min top N, status counts stay exact (few values).
+    # Serializable and mergeable, e.g. per subscription or per day summaries combined later without the events.
+    def __init__(self):
+        super().__init__()
+        self.distinct_sketches: dict[str, HyperLogLog] = {name: HyperLogLog() for name in approximate_distinct_fields}
+        self.frequency_sketches: dict[str, CountMinSketch] = {name: CountMinSketch() for name in approximate_frequency_fields}
+
+    def add_event(self, raw_event: dict) -> None:
+        self.event_count += 1
+        self.add_event_time(raw_event)
+        add_counted_value(self.status_counts, get_value(raw_event.get('status')))
+        for name, path in approximate_distinct_fields.items():
+            value = get_path_value(raw_event, path)
+            if isinstance(value, str):
+                self.distinct_sketches[name].add(value)
+        for name, path in approximate_frequency_fields.items():
+            value = get_path_value(raw_event, path)
+            if isinstance(value, str):
+                self.frequency_sketches[name].add(value)
+
+    def get_summary(self, top: int = 0) -> dict:
+        summary = {'Total Event Count': self.event_count}
+        for name, summary_name in (('axeKey', 'Axe Key Count'), ('correlationId', 'Correlation Id Count'), ('operationId', 'Operation Id Count'), ('operationName', 'Operation Name Count'), ('resourceProviderName', 'Resource Provider Name Count')):
+            distinct_sketch = self.distinct_sketches[name]
+            summary[summary_name] = distinct_sketch.count()
+            summary[f'{summary_name} Error'] = f'+/-{distinct_sketch.get_standard_error():.2%} (one standard error)'
+        if top > 0:
+            summary['First Event Time'] = format_event_timestamp(self.first_event_time) if self.first_event_time else None
+            summary['Last Event Time'] = format_event_timestamp(self.last_event_time) if self.last_event_time else None
+            summary['Status Counts'] = dict(self.status_counts.most_common())
+            for name, summary_name in (('operationName', 'Top Operations'), ('caller', 'Top Callers'), ('resourceProviderName', 'Top Resource Providers')):
+                frequency_sketch = self.frequency_sketches[name]
+                summary[summary_name] = frequency_sketch.get_top(top)
+                summary[f'{summary_name} Error'] = f'counts over-estimated by at most {frequency_sketch.get_error_bound()} ({frequency_sketch.get_confidence():.1%} confidence)'
+        return summary
+
+    def merge(self, other: 'ApproximateKeyedLogSummary') -> None:
+        self.event_count += other.event_count
+        self.status_counts.update(other.status_counts)
+        for event_time in (other.first_event_time, other.last_event_time):
+            if event_time is not None:
+                self.first_event_time = min(self.first_event_time or event_time, event_time)
+                self.last_event_time = max(self.last_event_time or event_time, event_time)
+        for name, distinct_sketch in self.distinct_sketches.items():
+            distinct_sketch.merge(other.distinct_sketches[name])
+        for name, frequency_sketch in self.frequency_sketches.items():
+            frequency_sketch.merge(other.frequency_sketches[name])
+
+    def to_dict(self) -> dict:
+        return {
+            'version': 1,
+            'eventCount': self.event_count,
+            'firstEventTime': format_event_timestamp(self.first_event_time) if self.first_event_time else None,
+            'lastEventTime': format_event_timestamp(self.last_event_time) if self.last_event_time else None,
+            'statusCounts': dict(self.status_counts),
+            'distinct': {name: distinct_sketch.to_dict() for name, distinct_sketch in self.distinct_sketches.items()},
+            'frequency': {name: frequency_sketch.to_dict() for name, frequency_sketch in self.frequency_sketches.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'ApproximateKeyedLogSummary':
+        summary = cls()
+        summary.event_count = data['eventCount']
+        summary.first_event_time = parse_event_timestamp(data['firstEventTime']) if data['firstEventTime'] else None
+        summary.last_event_time = parse_event_timestamp(data['lastEventTime']) if data['lastEventTime'] else None
+        summary.status_counts = Counter(data['statusCounts'])
+        summary.distinct_sketches = {name: HyperLogLog.from_dict(sketch) for name, sketch in data['distinct'].items()}
+        summary.frequency_sketches = {name: CountMinSketch.from_dict(sketch) for name, sketch in data['frequency'].items()}
+        return summary
+
+    def save(self, filepath: Path) -> None:
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        with open(filepath, 'w') as file:
+            json.dump(self.to_dict(), file)
+
+    @classmethod
+    def load(cls, filepath: Path) -> 'ApproximateKeyedLogSummary | None':
+        try:
+            with open(filepath, 'r') as file:
+                return cls.from_dict(json.load(file))
+        except (OSError, ValueError, KeyError) as e:
+            keyed_log_summary_logger.error(f'Unable to read summary sketch {filepath}: {e}')
+            return None
+
+
+def get_path_value(raw_event: dict, path: tuple[str, ...]):
+    value = raw_event.get(path[0])
+    if len(path) > 1:
+        return value.get(path[1]) if isinstance(value, dict) else None
+    return value
+
+
+def get_value(field: dict | None):
+    return field.get('value') if isinstance(field, dict) else None
+
+
+def add_distinct_value(values: set, value) -> None:
+    # None & nested values are not counted
+    if value is not None and not isinstance(value, (dict, list)):
+        values.add(value)
+
+
+def add_counted_value(counts: Counter, value) -> None:
+    if value is not None and not isinstance(value, (dict, list)):
+        counts[value] += 1
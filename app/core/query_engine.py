@@ -0,0 +1,446 @@
+"""
+Tool Name: Azure Activity Log Axe
+Script Name: query_engine.py
+Author: Nathan Eades
+Date: 2024-06-01
+Description: Query expressions (--query) parsed once into a predicate plan that uses field indexes before scanning.
+License: Apache License
+"""
+
+#   This file is part of Azure Activity Log Axe.
+#
+#   Copyright 2024 Permiso Security <https://permiso.io>
+#         Nathan Eades:
+#             - LinkedIn: <@eadesclouddef>
+#             - GitHub: <eadesclouddef> or <neades2305>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+#   Grammar:
+#       query      := or ('or' and)*
+#       and        := not ('and' not)*
+#       not        := 'not' not | '(' query ')' | overlaps | comparison
+#       overlaps   := 'overlaps' '(' literal ',' literal ')'
+#       comparison := field operator literal | field 'in' '(' literal (',' literal)* ')'
+#   field is a top level field or a dotted path (claims.appid, statusCounts.Failed, requestBody.properties.*), keys with dots go in
+#   brackets (claims['http://schemas.xmlsoap.org/ws/2005/05/identity/claims/upn']).
+#   Operators: = != (exact), ~ (contains), ^= (prefix), =~ (regex), > >= < <= (number, time or text by the literal).
+#   ~ and ^= ignore case. A list field (statuses, operationIds) matches when any element does, != when none does. Literals are quoted ('a b', "a b") or bare (Succeeded, 0, 2024-06-01, 2024-06-01T10:00:00Z).
+#   overlaps(start, end) matches keyed events inside the interval and simplified operations whose startTime-endTime overlaps it.
+#   E.g. operationName ~ 'roleassignments' and startTime >= 2024-06-01 and statusCounts.Failed > 0
+
+import math
+import numpy as np
+import operator
+import re
+from .field_paths import compile_field_path
+from app.utils.config import QUERY_SCAN_CHUNK_ROWS
+from app.utils.logger import get_logger
+from app.utils.timestamps import get_microseconds, parse_event_timestamp
+from datetime import datetime, timezone
+from typing import Any, Callable, Iterable, Iterator
+
+query_engine_logger = get_logger('query_engine')
+
+comparison_operators: tuple[str, ...] = ('=', '!=', '~', '^=', '=~', '>', '>=', '<', '<=')
+ordered_comparisons: dict[str, Callable[[Any, Any], bool]] = {'>': operator.gt, '>=': operator.ge, '<': operator.lt, '<=': operator.le}
+query_keywords: frozenset[str] = frozenset(('and', 'or', 'not', 'in'))
+bare_literal_pattern = re.compile(r"""[^\s()'",=<>!~^]+""")
+query_token_pattern = re.compile(r"""\s*(?:('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")|(>=|<=|!=|=~|\^=|[=<>~(),])|((?:[^\s()'",=<>!~^\[]|\[(?:'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|[^\]'"]*)\])+))""")
+
+
+class QuerySyntaxError(ValueError):
+    pass
+
+
+class Comparison:
+    def __init__(self, field: str, comparison: str, literals: list[str]):
+        self.field = field
+        self.comparison = comparison
+        self.literals = literals
+        self.accessor = compile_field_path(field)
+        self.test: Callable[[str], bool] = compile_test(comparison, literals)
+        # Microseconds since epoch when this is an ordered comparison with a time, answered by a time index
+        self.time: int | None = None
+        if comparison in ordered_comparisons and parse_query_number(literals[0]) is None:
+            time = parse_query_time(literals[0])
+            self.time = get_microseconds(time) if time is not None else None
+
+    def matches(self, record: dict) -> bool:
+        test = self.test
+        return any(test(value) for value in self.accessor(record))
+
+    # Time comparisons use a time index (two binary searches), other comparisons are evaluated over the distinct values of an
+    # indexed field. None when neither index covers the field.
+    def get_mask(self, source, time_indexes: dict | None = None) -> np.ndarray | None:
+        time_index = (time_indexes or {}).get(self.field)
+        if time_index is not None and self.time is not None:
+            return time_index.get_comparison_mask(self.field, self.comparison, self.time)
+        if not source.is_indexable(self.field):
+            return None
+        return source.get_mask_where(self.field, self.test)
+
+    def get_index_name(self, time_indexes: dict | None = None) -> str:
+        return 'time index' if self.time is not None and self.field in (time_indexes or {}) else 'index'
+
+    def describe(self) -> str:
+        if self.comparison == 'in':
+            return f"{self.field} in ({', '.join(map(quote_literal, self.literals))})"
+        return f'{self.field} {self.comparison} {quote_literal(self.literals[0])}'
+
+
+class Overlaps:
+    # Keyed events inside [start, end], simplified operations whose startTime-endTime overlaps it
+    def __init__(self, start: str, end: str):
+        self.literals = [start, end]
+        times = [parse_query_time(literal) for literal in self.literals]
+        if None in times:
+            raise QuerySyntaxError(f'overlaps expects two times, found {start!r}, {end!r}.')
+        self.start, self.end = times
+        self.start_time, self.end_time = get_microseconds(self.start), get_microseconds(self.end)
+
+    def matches(self, record: dict) -> bool:
+        event_time = record.get('eventTimestamp')
+        if event_time is not None:
+            start = end = parse_query_time(event_time)
+        else:
+            start = parse_query_time(record.get('startTime') or '')
+            end = parse_query_time(record.get('endTime') or '') or start
+        return start is not None and start <= self.end and end >= self.start
+
+    def get_mask(self, source, time_indexes: dict | None = None) -> np.ndarray | None:
+        time_index = next(iter((time_indexes or {}).values()), None)
+        if time_index is None:
+            return None
+        return time_index.get_mask(time_index.get_overlapping(self.start_time, self.end_time))
+
+    def get_index_name(self, time_indexes: dict | None = None) -> str:
+        return 'time index'
+
+    def describe(self) -> str:
+        return f"overlaps({', '.join(map(quote_literal, self.literals))})"
+
+
+class And:
+    def __init__(self, children: list):
+        self.children = children
+
+    def matches(self, record: dict) -> bool:
+        return all(child.matches(record) for child in self.children)
+
+    def get_mask(self, source, time_indexes: dict | None = None) -> np.ndarray | None:
+        mask: np.ndarray | None = None
+        for child in self.children:
+            child_mask = child.get_mask(source, time_indexes)
+            if child_mask is None:
+                return None
+            mask = child_mask if mask is None else mask & child_mask
+        return mask
+
+    def get_index_name(self, time_indexes: dict | None = None) -> str:
+        return 'index'
+
+    def describe(self) -> str:
+        return ' and '.join(describe_child(child) for child in self.children)
+
+
+class Or:
+    def __init__(self, children: list):
+        self.children = children
+
+    def matches(self, record: dict) -> bool:
+        return any(child.matches(record) for child in self.children)
+
+    def get_mask(self, source, time_indexes: dict | None = None) -> np.ndarray | None:
+        mask: np.ndarray | None = None
+        for child in self.children:
+            child_mask = child.get_mask(source, time_indexes)
+            if child_mask is None:
+                return None
+            mask = child_mask if mask is None else mask | child_mask
+        return mask
+
+    def get_index_name(self, time_indexes: dict | None = None) -> str:
+        return 'index'
+
+    def describe(self) -> str:
+        return ' or '.join(describe_child(child) for child in self.children)
+
+
+class Not:
+    def __init__(self, child):
+        self.child = child
+
+    def matches(self, record: dict) -> bool:
+        return not self.child.matches(record)
+
+    def get_mask(self, source, time_indexes: dict | None = None) -> np.ndarray | None:
+        child_mask = self.child.get_mask(source, time_indexes)
+        return None if child_mask is None else ~child_mask
+
+    def get_index_name(self, time_indexes: dict | None = None) -> str:
+        return self.child.get_index_name(time_indexes)
+
+    def describe(self) -> str:
+        return f'not {describe_child(self.child)}'
+
+
+class QueryPlan:
+    # A parsed query. The top level 'and' terms that an index can answer narrow the candidate rows with bitmaps,
+    # the remaining terms are evaluated on the candidate records only. steps records the path taken by the last run (explain).
+    # source: FieldIndex or ColumnarEventStore (row_count, is_indexable, get_mask_where, get_records).
+    # time_indexes: field -> TimeIndex over the same rows, for time comparisons & overlaps.
+    def __init__(self, query: str):
+        self.query = query
+        self.root = parse_query(query)
+        self.steps: list[str] = []
+
+    def get_row_ids(self, source, time_indexes: dict | None = None) -> np.ndarray:
+        self.steps = []
+        terms = self.root.children if isinstance(self.root, And) else [self.root]
+        candidate_mask: np.ndarray | None = None
+        residual_terms: list = []
+        for term in terms:
+            term_mask = term.get_mask(source, time_indexes)
+            if term_mask is None:
+                residual_terms.append(term)
+                continue
+            candidate_mask = term_mask if candidate_mask is None else candidate_mask & term_mask
+            self.steps.append(f'{term.get_index_name(time_indexes)}: {term.describe()} -> {int(np.count_nonzero(candidate_mask))} candidate rows')
+
+        candidate_ids = np.flatnonzero(candidate_mask) if candidate_mask is not None else np.arange(source.row_count)
+        if not residual_terms:
+            self.steps.append(f'result: {len(candidate_ids)} of {source.row_count} rows, no scan')
+            return candidate_ids
+
+        # Candidates are fetched in chunks, the columnar store decodes only the rows it is asked for
+        residual = residual_terms[0] if len(residual_terms) == 1 else And(residual_terms)
+        matched_ids: list[int] = []
+        for chunk_start in range(0, len(candidate_ids), QUERY_SCAN_CHUNK_ROWS):
+            chunk_ids = candidate_ids[chunk_start:chunk_start + QUERY_SCAN_CHUNK_ROWS]
+            matched_ids.extend(row_id for row_id, record in zip(chunk_ids, source.get_records(chunk_ids)) if residual.matches(record))
+        self.steps.append(f'scan: {residual.describe()} over {len(candidate_ids)} of {source.row_count} rows -> {len(matched_ids)} rows')
+        return np.array(matched_ids, dtype=np.int64)
+
+    # Streamed records (spilled data) have no indexes, each record is matched as it is read and only the matches are kept
+    def iter_matches(self, records: Iterable[dict]) -> Iterator[dict]:
+        self.steps = []
+        scanned_count = matched_count = 0
+        for record in records:
+            scanned_count += 1
+            if self.root.matches(record):
+                matched_count += 1
+                yield record
+        self.steps.append(f'stream scan: {self.root.describe()} over {scanned_count} rows -> {matched_count} rows')
+
+    def explain(self) -> list[str]:
+        return [f'query: {self.root.describe()}'] + self.steps
+
+
+def describe_child(child) -> str:
+    return f'({child.describe()})' if isinstance(child, (And, Or)) else child.describe()
+
+
+# Bare when the literal reads back as one word, quoted otherwise
+def quote_literal(literal: str) -> str:
+    if bare_literal_pattern.fullmatch(literal) and literal.lower() not in query_keywords:
+        return literal
+    return "'" + literal.replace("'", "\\'") + "'"
+
+
+def tokenize_query(query: str) -> list[tuple[str, str]]:
+    # (kind, text): kind is 'literal' (quoted), 'symbol' or 'word'
+    tokens: list[tuple[str, str]] = []
+    position = 0
+    query = query.strip()
+    while position < len(query):
+        match = query_token_pattern.match(query, position)
+        if not match or match.end() == position:
+            if query[position:].lstrip()[:1] in ('"', "'"):
+                raise QuerySyntaxError(f'Unterminated quote at position {position}: {query[position:position + 10]!r}')
+            raise QuerySyntaxError(f'Unexpected character at position {position}: {query[position:position + 10]!r}')
+        quoted, symbol, word = match.groups()
+        if quoted is not None:
+            tokens.append(('literal', re.sub(r'\\(.)', r'\1', quoted[1:-1])))
+        elif symbol is not None:
+            tokens.append(('symbol', symbol))
+        else:
+            tokens.append(('word', word))
+        position = match.end()
+    return tokens
+
+
+def parse_query(query: str):
+    tokens = tokenize_query(query)
+    if not tokens:
+        raise QuerySyntaxError('The query is empty.')
+    parser = QueryParser(tokens)
+    node = parser.parse_or()
+    if parser.position != len(tokens):
+        raise QuerySyntaxError(f'Unexpected {tokens[parser.position][1]!r} after {node.describe()!r}.')
+    return node
+
+
+class QueryParser:
+    def __init__(self, tokens: list[tuple[str, str]]):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self) -> tuple[str, str] | None:
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def take(self) -> tuple[str, str]:
+        token = self.peek()
+        if token is None:
+            raise QuerySyntaxError('The query ended early.')
+        self.position += 1
+        return token
+
+    def is_keyword(self, keyword: str) -> bool:
+        token = self.peek()
+        return token is not None and token[0] == 'word' and token[1].lower() == keyword
+
+    def is_symbol(self, symbol: str) -> bool:
+        return self.peek() == ('symbol', symbol)
+
+    def parse_or(self):
+        children = [self.parse_and()]
+        while self.is_keyword('or'):
+            self.take()
+            children.append(self.parse_and())
+        return children[0] if len(children) == 1 else Or(children)
+
+    def parse_and(self):
+        children = [self.parse_not()]
+        while self.is_keyword('and'):
+            self.take()
+            children.append(self.parse_not())
+        return children[0] if len(children) == 1 else And(children)
+
+    def parse_not(self):
+        if self.is_keyword('not'):
+            self.take()
+            return Not(self.parse_not())
+        if self.is_keyword('overlaps') and self.position + 1 < len(self.tokens) and self.tokens[self.position + 1] == ('symbol', '('):
+            self.position += 2
+            start = self.parse_literal()
+            if not self.is_symbol(','):
+                raise QuerySyntaxError('overlaps expects (start, end).')
+            self.take()
+            end = self.parse_literal()
+            if not self.is_symbol(')'):
+                raise QuerySyntaxError('Missing ) after overlaps(start, end.')
+            self.take()
+            return Overlaps(start, end)
+        if self.is_symbol('('):
+            self.take()
+            node = self.parse_or()
+            if not self.is_symbol(')'):
+                raise QuerySyntaxError(f'Missing ) after {node.describe()!r}.')
+            self.take()
+            return node
+        return self.parse_comparison()
+
+    def parse_comparison(self):
+        kind, field = self.take()
+        if kind != 'word':
+            raise QuerySyntaxError(f'Expected a field name, found {field!r}.')
+        if self.is_keyword('in'):
+            self.take()
+            if not self.is_symbol('('):
+                raise QuerySyntaxError(f'Expected ( after {field} in.')
+            self.take()
+            literals = [self.parse_literal()]
+            while self.is_symbol(','):
+                self.take()
+                literals.append(self.parse_literal())
+            if not self.is_symbol(')'):
+                raise QuerySyntaxError(f'Missing ) after {field} in (...')
+            self.take()
+            return Comparison(field, 'in', literals)
+
+        kind, comparison = self.take()
+        if kind != 'symbol' or comparison not in comparison_operators:
+            raise QuerySyntaxError(f'Expected an operator after {field}, found {comparison!r}.')
+        literal = self.parse_literal()
+        # != is the negation of =, rows without the field match as well
+        if comparison == '!=':
+            return Not(Comparison(field, '=', [literal]))
+        try:
+            return Comparison(field, comparison, [literal])
+        except re.error as e:
+            raise QuerySyntaxError(f'Invalid regex {literal!r}: {str(e)}.')
+        except ValueError as e:
+            raise QuerySyntaxError(str(e))
+
+    def parse_literal(self) -> str:
+        kind, literal = self.take()
+        if kind == 'symbol':
+            raise QuerySyntaxError(f'Expected a value, found {literal!r}.')
+        return literal
+
+
+def compile_test(comparison: str, literals: list[str]) -> Callable[[str], bool]:
+    literal = literals[0]
+    if comparison in ('=', 'in'):
+        literal_set = frozenset(literals)
+        return literal_set.__contains__
+    if comparison == '~':
+        lowered = literal.lower()
+        return lambda value: lowered in value.lower()
+    if comparison == '^=':
+        lowered = literal.lower()
+        return lambda value: value.lower().startswith(lowered)
+    if comparison == '=~':
+        pattern = re.compile(literal)
+        return lambda value: pattern.search(value) is not None
+
+    # Ordered comparisons: numeric when the literal is a number, time when it is a date or timestamp, text otherwise
+    compare = ordered_comparisons[comparison]
+    number = parse_query_number(literal)
+    if number is not None:
+        def test(value: str) -> bool:
+            value_number = parse_query_number(value)
+            return value_number is not None and compare(value_number, number)
+        return test
+    time = parse_query_time(literal)
+    if time is not None:
+        def test(value: str) -> bool:
+            value_time = parse_query_time(value)
+            return value_time is not None and compare(value_time, time)
+        return test
+    return lambda value: compare(value, literal)
+
+
+# nan & inf are not numbers here, float() would take them and every comparison with nan is False
+def parse_query_number(value: str) -> float | None:
+    try:
+        number = float(value)
+    except ValueError:
+        return None
+    return number if math.isfinite(number) else None
+
+
+# Naive UTC datetime for event timestamps, iso dates & times, None when the value is not a time
+def parse_query_time(value: str) -> datetime | None:
+    try:
+        return parse_event_timestamp(value)
+    except ValueError:
+        pass
+    try:
+        parsed_time = datetime.fromisoformat(value[:-1] if value.endswith('Z') else value)
+    except ValueError:
+        return None
+    if parsed_time.tzinfo is not None:
+        parsed_time = parsed_time.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed_time
@@ -0,0 +1,229 @@
+"""
+Tool Name: Azure Activity Log Axe
+Script Name: simplified_operation.py
+Author: Nathan Eades
+Date: 2024-06-01
+Description: Compact record for one simplified (axe keyed) operation.
+License: Apache License
+"""
+
+#   This file is part of Azure Activity Log Axe.
+#
+#   Copyright 2024 Permiso Security <https://permiso.io>
+#         Nathan Eades:
+#             - LinkedIn: <@eadesclouddef>
+#             - GitHub: <eadesclouddef> or <neades2305>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import json
+import sys
+from app.utils.logger import get_logger
+from app.utils.timestamps import format_event_timestamp, parse_event_timestamp
+from datetime import datetime
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # Optional, faster request/response body parsing
+    orjson = None
+
+simplified_operation_logger = get_logger('simplified_operation')
+
+# Raw claim name, simplified claim name
+simplified_claim_names: tuple[tuple[str, str], ...] = (
+    ('appid', 'appid'),
+    ('appidacr', 'appidacr'),
+    ('idtyp', 'idtyp'),
+    ('uti', 'uti'),
+    ('http://schemas.microsoft.com/claims/authnmethodsreferences', 'authnmethodsreferences'),
+)
+
+# status.value of an operation that will not change again (completion-aware emission)
+terminal_statuses: frozenset[str] = frozenset(('Succeeded', 'Failed', 'Canceled'))
+
+
+def intern_value(value: Any) -> Any:
+    # Repeated values (operation names, callers, categories...) share one string across operations
+    return sys.intern(value) if type(value) is str else value
+
+
+class SimplifiedOperation:
+    # Slotted record, rendered to the simplified dict shape only by to_dict
+    # subStatuses & statuses are the insertion ordered keys of their count maps, operation_ids is an ordered set
+    __slots__ = (
+        'axe_key', 'caller', 'operation_name', 'operation_name_localized', 'start_time', 'end_time', 'ip',
+        'sub_status_counts', 'start_status', 'end_status', 'status_counts', 'subscription_id', 'claims',
+        'request_body', 'response_body', 'unparsed_request_body', 'unparsed_response_body', 'category', 'level',
+        'resource_group_name', 'resource_id', 'event_data_ids', 'correlation_id', 'operation_ids', 'resource_provider_name',
+    )
+
+    def __init__(self, axe_key: str):
+        self.axe_key: str = axe_key
+        self.caller: str | None = None
+        self.operation_name: str | None = None
+        self.operation_name_localized: str | None = None
+        self.start_time: datetime | None = None
+        self.end_time: datetime | None = None
+        self.ip: str | None = None
+        self.sub_status_counts: dict[str, int] = {}
+        self.start_status: str | None = None
+        self.end_status: str | None = None
+        self.status_counts: dict[str, int] = {}
+        self.subscription_id: str | None = None
+        self.claims: dict | None = None
+        self.request_body: Any = None
+        self.response_body: Any = None
+        self.unparsed_request_body: str | None = None
+        self.unparsed_response_body: str | None = None
+        self.category: str | None = None
+        self.level: str | None = None
+        self.resource_group_name: str | None = None
+        self.resource_id: str | None = None
+        self.event_data_ids: list[str] = []
+        self.correlation_id: str | None = None
+        self.operation_ids: dict[str, None] = {}
+        self.resource_provider_name: str | None = None
+
+    # Fold one keyed event into the operation
+    def add_event(self, raw_event: dict) -> None:
+        ### --- Collect fields per simplify key --- ###
+        operation_name: dict = raw_event.get('operationName') or {}
+        http_request: dict = raw_event.get('httpRequest') or {}
+        claims: dict = raw_event.get('claims') or {}
+        category: dict = raw_event.get('category') or {}
+        resource_provider_name: dict = raw_event.get('resourceProviderName') or {}
+        self.caller = intern_value(raw_event.get('caller'))
+        self.operation_name = intern_value(operation_name.get('value').lower())
+        self.operation_name_localized = intern_value(operation_name.get('localizedValue'))
+        self.ip = http_request.get('clientIpAddress') or claims.get('ipaddr')
+        self.subscription_id = intern_value(raw_event.get('subscriptionId'))
+        self.category = intern_value(category.get('value'))
+        self.level = intern_value(raw_event.get('level'))
+        self.resource_provider_name = intern_value(resource_provider_name.get('value').lower())
+        self.resource_group_name = intern_value(raw_event.get('resourceGroupName'))
+        self.resource_id = raw_event.get('resourceId')
+        self.correlation_id = raw_event.get('correlationId')
+
+        # subStatus & status
+        sub_status: str = (raw_event.get('subStatus') or {}).get('value')
+        if sub_status:
+            sub_status_counts = self.sub_status_counts
+            if sub_status in sub_status_counts:
+                sub_status_counts[sub_status] += 1
+            else:
+                sub_status_counts[intern_value(sub_status)] = 1
+        status: str = (raw_event.get('status') or {}).get('value')
+        if status:
+            status = intern_value(status)
+            status_counts = self.status_counts
+            if status in status_counts:
+                status_counts[status] += 1
+            else:
+                status_counts[status] = 1
+
+        # Start & End (Time / Status)
+        event_time = raw_event.get('eventTimestamp')
+        if event_time:
+            try:
+                event_time = parse_event_timestamp(event_time)
+            except ValueError as e:
+                simplified_operation_logger.error(f"Error parsing event time {event_time}: {e}")
+                return
+            if self.start_time is None or event_time < self.start_time:
+                self.start_time = event_time
+                self.start_status = status
+            if self.end_time is None or event_time > self.end_time:
+                self.end_time = event_time
+                self.end_status = status
+
+        # claims
+        if claims:
+            for claim_name, simplified_claim_name in simplified_claim_names:
+                claim_value = claims.get(claim_name)
+                if claim_value:
+                    if self.claims is None:
+                        self.claims = {}
+                    self.claims[simplified_claim_name] = claim_value
+
+        # body fields, only the last body is kept and it is parsed by to_dict
+        properties: dict = raw_event.get('properties')
+        if properties:
+            request_body: str = properties.get('requestbody')
+            if request_body:
+                self.unparsed_request_body = request_body
+            response_body: str = properties.get('responseBody')
+            if response_body:
+                self.unparsed_response_body = response_body
+
+        # event Ids
+        id: str = raw_event.get('eventDataId')
+        if id:
+            self.event_data_ids.append(id)
+
+        # operation Ids
+        id: str = raw_event.get('operationId')
+        if id:
+            self.operation_ids[id] = None
+
+    def has_terminal_status(self) -> bool:
+        return any(status in terminal_statuses for status in self.status_counts)
+
+    def to_dict(self) -> dict:
+        if self.unparsed_request_body is not None:
+            self.request_body = get_parsed_body(self.unparsed_request_body)
+            self.unparsed_request_body = None
+        if self.unparsed_response_body is not None:
+            self.response_body = get_parsed_body(self.unparsed_response_body)
+            self.unparsed_response_body = None
+
+        return {
+            'axeKey': self.axe_key,
+            'caller': self.caller,
+            'operationName': self.operation_name,
+            'operationNameLocalized': self.operation_name_localized,
+            'startTime': format_event_timestamp(self.start_time) if self.start_time else None,
+            'endTime': format_event_timestamp(self.end_time) if self.end_time else None,
+            'ip': self.ip,
+            'subStatuses': list(self.sub_status_counts),
+            'subStatusCounts': dict(self.sub_status_counts),
+            'startStatus': self.start_status,
+            'endStatus': self.end_status,
+            'statuses': list(self.status_counts),
+            'statusCounts': dict(self.status_counts),
+            'subscriptionId': self.subscription_id,
+            'claims': dict(self.claims) if self.claims else {},
+            'requestBody': self.request_body if self.request_body is not None else {},
+            'responseBody': self.response_body if self.response_body is not None else {},
+            'category': self.category,
+            'level': self.level,
+            'resourceGroupName': self.resource_group_name,
+            'resourceId': self.resource_id,
+            'eventDataIds': list(self.event_data_ids),
+            'correlationId': self.correlation_id,
+            'operationIds': list(self.operation_ids),
+            'resourceProviderName': self.resource_provider_name,
+        }
+
+
+def get_parsed_body(body: str) -> Any:
+    if orjson is not None:
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            pass  # e.g. NaN or integers past 64 bit, retried with json
+    try:
+        return json.loads(body)
+    except ValueError as e:
+        simplified_operation_logger.error(f'Error parsing body: {e}')
+        return {}
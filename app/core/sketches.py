@@ -0,0 +1,166 @@
+"""
+Tool Name: Azure Activity Log Axe
+Script Name: sketches.py
+Author: Nathan Eades
+Date: 2024-06-01
+Description: Mergeable, serializable HyperLogLog & count-min sketches for approximate summaries.
+License: Apache License
+"""
+
+#   This file is part of Azure Activity Log Axe.
+#
+#   Copyright 2024 Permiso Security <https://permiso.io>
+#         Nathan Eades:
+#             - LinkedIn: <@eadesclouddef>
+#             - GitHub: <eadesclouddef> or <neades2305>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import base64
+import hashlib
+import math
+from array import array
+
+# Bits of the 64 bit hash used for the register index, 2**14 registers is a 0.81% standard error
+HLL_PRECISION: int = 14
+# Count-min dimensions, over-count is at most e/width * total with probability 1 - e**-depth
+CMS_WIDTH: int = 4096
+CMS_DEPTH: int = 5
+
+
+def get_hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+
+
+class HyperLogLog:
+    def __init__(self, precision: int = HLL_PRECISION, registers: bytearray | None = None):
+        self.precision: int = precision
+        self.registers: bytearray = registers if registers is not None else bytearray(1 << precision)
+
+    def add(self, value: str) -> None:
+        hash_value = get_hash64(value)
+        index = hash_value >> (64 - self.precision)
+        # Rank of the first set bit in the remaining bits
+        remaining_bits = 64 - self.precision
+        rank = remaining_bits - (hash_value & ((1 << remaining_bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self) -> int:
+        register_count = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / register_count)
+        estimate = alpha * register_count * register_count / sum(2.0 ** -register for register in self.registers)
+        zero_registers = self.registers.count(0)
+        if estimate <= 2.5 * register_count and zero_registers:
+            # Small range correction (linear counting)
+            estimate = register_count * math.log(register_count / zero_registers)
+        return int(round(estimate))
+
+    def get_standard_error(self) -> float:
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def merge(self, other: 'HyperLogLog') -> None:
+        if other.precision != self.precision:
+            raise ValueError(f'HyperLogLog precision mismatch: {self.precision} != {other.precision}')
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def to_dict(self) -> dict:
+        return {'precision': self.precision, 'registers': base64.b64encode(bytes(self.registers)).decode()}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'HyperLogLog':
+        return cls(data['precision'], bytearray(base64.b64decode(data['registers'])))
+
+
+class CountMinSketch:
+    # Frequency estimates plus a bounded set of heavy hitter candidates for top N
+    def __init__(self, width: int = CMS_WIDTH, depth: int = CMS_DEPTH, candidate_capacity: int = 100):
+        self.width: int = width
+        self.depth: int = depth
+        self.table: list[array] = [array('q', bytes(8 * width)) for _ in range(depth)]
+        self.total: int = 0
+        self.candidate_capacity: int = candidate_capacity
+        self.candidates: dict[str, int] = {}
+        # Lowest candidate estimate once the candidates are full, values at or below it are skipped
+        self.candidate_floor: int = 0
+
+    def get_indexes(self, value: str) -> list[int]:
+        # Double hashing, one 64 bit hash split into two 32 bit halves
+        hash_value = get_hash64(value)
+        first_hash, second_hash = hash_value >> 32, hash_value & 0xFFFFFFFF
+        return [(first_hash + row * second_hash) % self.width for row in range(self.depth)]
+
+    def add(self, value: str, count: int = 1) -> None:
+        self.total += count
+        estimate = None
+        for row, index in zip(self.table, self.get_indexes(value)):
+            row[index] += count
+            estimate = row[index] if estimate is None else min(estimate, row[index])
+        self.update_candidate(value, estimate)
+
+    def update_candidate(self, value: str, estimate: int) -> None:
+        candidates = self.candidates
+        if value in candidates or len(candidates) < self.candidate_capacity:
+            candidates[value] = estimate
+            return
+        if estimate <= self.candidate_floor:
+            return
+        lowest_value = min(candidates, key=candidates.get)
+        if estimate > candidates[lowest_value]:
+            del candidates[lowest_value]
+            candidates[value] = estimate
+        self.candidate_floor = min(candidates.values())
+
+    def estimate(self, value: str) -> int:
+        return min(row[index] for row, index in zip(self.table, self.get_indexes(value)))
+
+    def get_top(self, top: int) -> dict[str, int]:
+        return dict(sorted(self.candidates.items(), key=lambda item: item[1], reverse=True)[:top])
+
+    def get_error_bound(self) -> int:
+        # Estimates never under-count and over-count by at most this, with probability get_confidence
+        return math.ceil(math.e / self.width * self.total)
+
+    def get_confidence(self) -> float:
+        return 1 - math.exp(-self.depth)
+
+    def merge(self, other: 'CountMinSketch') -> None:
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError(f'Count-min sketch dimension mismatch: {(self.width, self.depth)} != {(other.width, other.depth)}')
+        for row, other_row in zip(self.table, other.table):
+            for index, count in enumerate(other_row):
+                if count:
+                    row[index] += count
+        self.total += other.total
+        # Candidates from both sides are re-estimated against the merged table
+        merged_candidates = {value: self.estimate(value) for value in {**self.candidates, **other.candidates}}
+        self.candidates = dict(sorted(merged_candidates.items(), key=lambda item: item[1], reverse=True)[:self.candidate_capacity])
+        self.candidate_floor = 0
+
+    def to_dict(self) -> dict:
+        return {
+            'width': self.width,
+            'depth': self.depth,
+            'total': self.total,
+            'table': [base64.b64encode(row.tobytes()).decode() for row in self.table],
+            'candidateCapacity': self.candidate_capacity,
+            'candidates': self.candidates,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'CountMinSketch':
+        sketch = cls(data['width'], data['depth'], data['candidateCapacity'])
+        sketch.table = [array('q', base64.b64decode(row)) for row in data['table']]
+        sketch.total = data['total']
+        sketch.candidates = dict(data['candidates'])
+        return sketch
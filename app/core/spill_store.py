@@ -0,0 +1,165 @@
+"""
+Tool Name: Azure Activity Log Axe
+Script Name: spill_store.py
+Author: Nathan Eades
+Date: 2024-06-01
+Description: Out-of-core (SQLite) grouping of axe keyed events for windows larger than memory.
+License: Apache License
+"""
+
+#   This file is part of Azure Activity Log Axe.
+#
+#   Copyright 2024 Permiso Security <https://permiso.io>
+#         Nathan Eades:
+#             - LinkedIn: <@eadesclouddef>
+#             - GitHub: <eadesclouddef> or <neades2305>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import os
+import sqlite3
+import tempfile
+import weakref
+from .keyed_log_summary import KeyedLogSummary
+from .simplified_operation import SimplifiedOperation
+from app.utils.config import SPILL_MEMORY_BUDGET_MB
+from app.utils.file_io import dump_event_line, load_event_line
+from app.utils.logger import get_logger
+from pathlib import Path
+from typing import Iterator
+
+spill_store_logger = get_logger('spill_store')
+
+
+class SpillGroupStore:
+    # Keyed events are written to a temporary SQLite file as compact json, groups get a row in first seen order.
+    # Simplified records are folded one group at a time while streaming the (group, arrival) ordered events back,
+    # so only the insert buffer, the SQLite page cache and one group are held in memory.
+    # Half the memory budget goes to the insert buffer, half to the page cache.
+    def __init__(self, spill_dir: Path | None = None, memory_budget_mb: int = SPILL_MEMORY_BUDGET_MB):
+        spill_dir = Path(spill_dir) if spill_dir else Path(tempfile.gettempdir())
+        spill_dir.mkdir(parents=True, exist_ok=True)
+        file_descriptor, spill_path = tempfile.mkstemp(prefix='axe_spill_', suffix='.sqlite', dir=spill_dir)
+        os.close(file_descriptor)
+        self.spill_path = Path(spill_path)
+        self.buffer_limit_bytes = memory_budget_mb * 1024 * 1024 // 2
+
+        # Temporary data, durability is not needed
+        self.connection = sqlite3.connect(spill_path)
+        self.connection.execute('PRAGMA journal_mode = OFF')
+        self.connection.execute('PRAGMA synchronous = OFF')
+        self.connection.execute(f'PRAGMA cache_size = -{max(self.buffer_limit_bytes // 1024, 1024)}')
+        self.connection.execute('CREATE TABLE groups (group_seq INTEGER PRIMARY KEY, axe_key TEXT UNIQUE NOT NULL)')
+        self.connection.execute('CREATE TABLE events (seq INTEGER PRIMARY KEY, axe_key TEXT NOT NULL, event BLOB NOT NULL)')
+        # Distinct summary values (SpilledKeyedLogSummary), one row per (name, value)
+        self.connection.execute('CREATE TABLE distinct_values (name TEXT NOT NULL, value NOT NULL, PRIMARY KEY (name, value)) WITHOUT ROWID')
+        self.indexed = False
+        self._finalizer = weakref.finalize(self, remove_spill_file, self.connection, self.spill_path)
+
+        self.event_buffer: list[tuple[str, bytes]] = []
+        self.event_buffer_bytes = 0
+        self.event_count = 0
+        self.distinct_buffer: set[tuple[str, str]] = set()
+
+    def __len__(self) -> int:
+        return self.event_count
+
+    def append_event(self, raw_event: dict) -> None:
+        event_line = dump_event_line(raw_event)
+        self.event_buffer.append((raw_event['axeKey'], event_line))
+        self.event_buffer_bytes += len(event_line)
+        self.event_count += 1
+        if self.event_buffer_bytes >= self.buffer_limit_bytes:
+            self.flush()
+
+    # Buffered with the events, repeats inside one buffer are collapsed before the insert
+    def add_distinct_value(self, name: str, value: str) -> None:
+        distinct_value = (name, value)
+        if distinct_value not in self.distinct_buffer:
+            self.distinct_buffer.add(distinct_value)
+            self.event_buffer_bytes += len(name) + len(value)
+
+    def get_distinct_count(self, name: str) -> int:
+        self.flush()
+        return self.connection.execute('SELECT COUNT(*) FROM distinct_values WHERE name = ?', (name,)).fetchone()[0]
+
+    def flush(self) -> None:
+        if not self.event_buffer and not self.distinct_buffer:
+            return
+        with self.connection:
+            # Insert order keeps the first seen order of groups and the arrival order of events
+            self.connection.executemany('INSERT OR IGNORE INTO groups (axe_key) VALUES (?)', ((axe_key,) for axe_key, _ in self.event_buffer))
+            self.connection.executemany('INSERT INTO events (axe_key, event) VALUES (?, ?)', self.event_buffer)
+            self.connection.executemany('INSERT OR IGNORE INTO distinct_values (name, value) VALUES (?, ?)', self.distinct_buffer)
+        self.event_buffer = []
+        self.distinct_buffer = set()
+        self.event_buffer_bytes = 0
+
+    # Flush and build the grouping index once all events are in, later appends keep it up to date
+    def finalize(self) -> None:
+        self.flush()
+        if not self.indexed:
+            self.connection.execute('CREATE INDEX events_axe_key ON events (axe_key, seq)')
+            self.indexed = True
+
+    def get_group_count(self) -> int:
+        self.flush()
+        return self.connection.execute('SELECT COUNT(*) FROM groups').fetchone()[0]
+
+    # Keyed events in arrival order
+    def iter_events(self) -> Iterator[dict]:
+        self.flush()
+        for (event_line,) in self.connection.execute('SELECT event FROM events ORDER BY seq'):
+            yield load_event_line(event_line)
+
+    # Simplified records in first seen group order, identical to the in-memory fold
+    def iter_simplified_events(self) -> Iterator[dict]:
+        self.finalize()
+        simplified_operation: SimplifiedOperation | None = None
+        rows = self.connection.execute('SELECT groups.axe_key, events.event FROM groups JOIN events ON events.axe_key = groups.axe_key ORDER BY groups.group_seq, events.seq')
+        for axe_key, event_line in rows:
+            if simplified_operation is None or simplified_operation.axe_key != axe_key:
+                if simplified_operation is not None:
+                    yield simplified_operation.to_dict()
+                simplified_operation = SimplifiedOperation(axe_key)
+            simplified_operation.add_event(load_event_line(event_line))
+        if simplified_operation is not None:
+            yield simplified_operation.to_dict()
+
+    def close(self) -> None:
+        self._finalizer()
+
+
+class SpilledKeyedLogSummary(KeyedLogSummary):
+    # Exact summary for spilled data: the axe key, correlation id & operation id sets (one entry per operation) live in the spill file.
+    # The counters stay in memory, they hold one entry per status, operation name, caller & provider.
+    def __init__(self, spill_store: SpillGroupStore):
+        super().__init__()
+        self.spill_store = spill_store
+
+    def add_distinct_values(self, raw_event: dict) -> None:
+        for name in ('axeKey', 'correlationId', 'operationId'):
+            value = raw_event.get(name)
+            if isinstance(value, str):
+                self.spill_store.add_distinct_value(name, value)
+
+    def get_distinct_counts(self) -> tuple[int, int, int]:
+        return tuple(self.spill_store.get_distinct_count(name) for name in ('axeKey', 'correlationId', 'operationId'))
+
+
+def remove_spill_file(connection: sqlite3.Connection, spill_path: Path) -> None:
+    try:
+        connection.close()
+        spill_path.unlink(missing_ok=True)
+    except OSError as e:
+        spill_store_logger.warning(f'Unable to remove spill file {spill_path}: {str(e)}.')
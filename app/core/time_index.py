@@ -0,0 +1,104 @@
+"""
+Tool Name: Azure Activity Log Axe
+Script Name: time_index.py
+Author: Nathan Eades
+Date: 2024-06-01
+Description: Sorted int64 time index for time range and overlap queries on keyed and simplified data.
+License: Apache License
+"""
+
+#   This file is part of Azure Activity Log Axe.
+#
+#   Copyright 2024 Permiso Security <https://permiso.io>
+#         Nathan Eades:
+#             - LinkedIn: <@eadesclouddef>
+#             - GitHub: <eadesclouddef> or <neades2305>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import numpy as np
+from app.utils.logger import get_logger
+from app.utils.timestamps import NULL_EVENT_TIME, get_event_time_microseconds
+from typing import Iterable
+
+time_index_logger = get_logger('time_index')
+
+# Time fields per dataset, role 'start' or 'end'. Keyed events are instants, start & end are both eventTimestamp.
+time_index_fields: dict[str, dict[str, str]] = {
+    'keyed': {'eventTimestamp': 'start'},
+    'simplified': {'startTime': 'start', 'endTime': 'end'},
+}
+
+
+class TimeIndex:
+    # Row ids sorted by start and by end time (int64 microseconds since epoch), ranges are two binary searches.
+    # Rows without a time hold NULL_EVENT_TIME, they sort first and never fall inside a range.
+    # Overlap: rows with start <= range end (prefix of the start order) whose end >= range start.
+    def __init__(self, start_times: np.ndarray, end_times: np.ndarray | None = None, fields: dict[str, str] | None = None):
+        self.row_count = len(start_times)
+        self.fields = fields or {}
+        self.start_times = start_times
+        self.end_times = start_times if end_times is None else end_times
+        self.start_order = np.argsort(start_times, kind='stable')
+        self.sorted_starts = start_times[self.start_order]
+        if end_times is None:
+            self.end_order = self.start_order
+            self.sorted_ends = self.sorted_starts
+        else:
+            self.end_order = np.argsort(end_times, kind='stable')
+            self.sorted_ends = end_times[self.end_order]
+
+    def __len__(self) -> int:
+        return self.row_count
+
+    # Row ids with start (or end) in [start, end], either bound may be None, in time order
+    def get_range(self, start: int | None = None, end: int | None = None, role: str = 'start') -> np.ndarray:
+        sorted_times, order = (self.sorted_starts, self.start_order) if role == 'start' else (self.sorted_ends, self.end_order)
+        low = np.searchsorted(sorted_times, NULL_EVENT_TIME + 1 if start is None else start, side='left')
+        high = len(sorted_times) if end is None else np.searchsorted(sorted_times, end, side='right')
+        return order[low:high]
+
+    # Row ids of operations overlapping [start, end], in start time order
+    def get_overlapping(self, start: int | None = None, end: int | None = None) -> np.ndarray:
+        row_ids = self.get_range(None, end, 'start')
+        if start is None:
+            return row_ids
+        return row_ids[self.end_times[row_ids] >= start]
+
+    # Query engine: rows where field (start or end role) compares to time
+    def get_comparison_mask(self, field: str, comparison: str, time: int) -> np.ndarray:
+        role = self.fields.get(field, 'start')
+        if comparison == '>':
+            row_ids = self.get_range(time + 1, None, role)
+        elif comparison == '>=':
+            row_ids = self.get_range(time, None, role)
+        elif comparison == '<':
+            row_ids = self.get_range(None, time - 1, role)
+        else:
+            row_ids = self.get_range(None, time, role)
+        return self.get_mask(row_ids)
+
+    def get_mask(self, row_ids: Iterable[int]) -> np.ndarray:
+        mask = np.zeros(self.row_count, dtype=bool)
+        mask[row_ids] = True
+        return mask
+
+    def get_bounds(self) -> tuple[int, int] | None:
+        low = np.searchsorted(self.sorted_starts, NULL_EVENT_TIME + 1, side='left')
+        if low == self.row_count:
+            return None
+        return int(self.sorted_starts[low]), int(self.sorted_ends[-1])
+
+
+def get_time_array(times: Iterable[str | None]) -> np.ndarray:
+    return np.fromiter((get_event_time_microseconds(time) for time in times), dtype=np.int64)
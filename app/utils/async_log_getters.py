@@ -0,0 +1,240 @@
+"""
+Tool Name: Azure Activity Log Axe
+Script Name: async_log_getters.py
+Author: Nathan Eades
+Date: 2024-06-01
+Description: Asyncio fetch engine, pulls log data from the Azure Monitor Insights endpoint on a single event loop.
+License: Apache License
+"""
+
+#   This file is part of Azure Activity Log Axe.
+#
+#   Copyright 2024 Permiso Security <https://permiso.io>
+#         Nathan Eades:
+#             - LinkedIn: <@eadesclouddef>
+#             - GitHub: <eadesclouddef> or <neades2305>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import asyncio
+import threading
+from .config import FETCH_MAX_PAGES_PER_SLICE, FETCH_MIN_SLICE_SECONDS, SUBSCRIPTION_PREFETCH_PAGES
+from .log_getters import build_activity_url, dedupe_activity_pages, format_filter_time, get_time_windows, get_unfetched_window_end, split_time_window, tag_subscription_pages
+from .logger import get_logger
+from .retry import RETRYABLE_STATUS_CODES, AsyncConcurrencyLimiter, RetryScheduler
+from collections import deque
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+from typing import Iterator
+
+try:
+    import aiohttp
+except ImportError:  # Optional, only required by --fetch-engine async
+    aiohttp = None
+
+async_log_getters_logger = get_logger('async_log_getters')
+
+
+def is_async_engine_available() -> bool:
+    return aiohttp is not None
+
+
+async def fetch_logs_restapi_async(session, url, headers, retry_scheduler: RetryScheduler | None = None, limiter: AsyncConcurrencyLimiter | None = None) -> tuple:
+    # Same (value, nextLink) contract and retry behaviour as log_getters.fetch_logs_restapi
+    retry_scheduler = retry_scheduler or RetryScheduler()
+    attempt = 0
+    while True:
+        response_headers = None
+        response_text = ''
+        response_json = None
+        try:
+            async with limiter or nullcontext():
+                async with session.get(url, headers=headers) as response:
+                    status_code: int | None = response.status
+                    response_headers = response.headers
+                    if status_code == 200:
+                        response_json = await response.json(content_type=None)
+                    else:
+                        response_text = await response.text()
+        except aiohttp.ClientError as e:
+            status_code = None
+            async_log_getters_logger.warning(f'Connection error while fetching logs: {e}')
+        except Exception as e:
+            retry_scheduler.record_error()
+            async_log_getters_logger.error(f'Exception occurred while fetching logs: {e}')
+            return None, None
+
+        retry_scheduler.record_response(status_code, response_headers)
+        if status_code == 200:
+            if response_json.get('value'):
+                return response_json.get('value', []), response_json.get('nextLink', None)
+            elif response_json.get('nextLink'):
+                # Empty page mid pagination, keep following the chain
+                return [], response_json.get('nextLink')
+            else:
+                async_log_getters_logger.warning(f'Logger: The provided parameters resulted in an empty log set.')
+                return None, None
+        elif retry_scheduler.should_retry(status_code, attempt):
+            delay = retry_scheduler.get_retry_delay(attempt, response_headers)
+            retry_scheduler.record_retry(status_code, delay)
+            async_log_getters_logger.warning(f'Fetch returned status {status_code}, retrying the same page in {delay:.1f}s (attempt {attempt + 1}/{retry_scheduler.max_retries}).')
+            await asyncio.sleep(delay)
+            attempt += 1
+        else:
+            if status_code in RETRYABLE_STATUS_CODES or status_code is None:
+                retry_scheduler.record_exhausted()
+                async_log_getters_logger.critical(f'Retries exhausted, logs are truncated at: {url}')
+            else:
+                retry_scheduler.record_error()
+                async_log_getters_logger.error(f'Error fetching logs from restapi. Status Code: {status_code}: {response_text}')
+            return None, None
+
+
+class AsyncTimeSlicedFetcher:
+    # Runs every pagination chain on one event loop (in its own thread) sharing a keep-alive connection pool.
+    # The retry scheduler bounds requests in flight overall (adapting to the throttle budget), per_subscription_limit bounds them per subscription.
+    # Each subscription fetches at most per_subscription_limit slices at a time into a bounded page queue, subscription_limit bounds
+    # the subscriptions fetching at once, so pages waiting for the consumer stay a few per subscription instead of the whole dataset.
+    def __init__(self, headers: dict[str, str], cor_id: str | None = None, concurrency: int = 16, per_subscription_limit: int | None = None, retry_scheduler: RetryScheduler | None = None,
+                 max_pages_per_slice: int = FETCH_MAX_PAGES_PER_SLICE, min_slice_seconds: int = FETCH_MIN_SLICE_SECONDS, subscription_limit: int = 4,
+                 prefetch_pages: int = SUBSCRIPTION_PREFETCH_PAGES):
+        if aiohttp is None:
+            raise RuntimeError('aiohttp is required for the async fetch engine.')
+        self.headers = headers
+        self.cor_id = cor_id
+        self.concurrency = max(1, concurrency)
+        self.per_subscription_limit = max(1, per_subscription_limit or self.concurrency)
+        self.subscription_limit = max(1, subscription_limit)
+        self.prefetch_pages = max(1, prefetch_pages)
+        self.retry_scheduler = retry_scheduler or RetryScheduler(max_concurrency=self.concurrency)
+        self.max_pages_per_slice = max_pages_per_slice
+        self.min_slice = timedelta(seconds=min_slice_seconds)
+
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name='log-axe-async-fetch', daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._open(), self.loop).result()
+
+    async def _open(self) -> None:
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.concurrency, keepalive_timeout=60)
+        self.session = aiohttp.ClientSession(connector=connector)
+        self._limiter = AsyncConcurrencyLimiter(self.retry_scheduler)
+        self._subscription_semaphores: dict[str, asyncio.Semaphore] = {}
+        self._subscription_slots = asyncio.Semaphore(self.subscription_limit)
+        self._subscription_tasks: list[asyncio.Task] = []
+
+    # Starts every subscription (waiting for a subscription slot in order) and returns their page queues, None ends a queue
+    def start_subscriptions(self, sub_ids: list[str], windows: list[tuple[datetime, datetime]]) -> list[asyncio.Queue]:
+        async def _start() -> list[asyncio.Queue]:
+            page_queues = [asyncio.Queue(maxsize=self.prefetch_pages) for _ in sub_ids]
+            self._subscription_tasks = [asyncio.ensure_future(self._fetch_subscription(sub_id, windows, page_queue)) for sub_id, page_queue in zip(sub_ids, page_queues)]
+            return page_queues
+        return asyncio.run_coroutine_threadsafe(_start(), self.loop).result()
+
+    async def _fetch_subscription(self, sub_id: str, windows: list[tuple[datetime, datetime]], page_queue: asyncio.Queue) -> None:
+        # Slices in output order, a split slice is replaced by its halves. Only the first per_subscription_limit are fetching.
+        slots: deque = deque(windows)
+        try:
+            async with self._subscription_slots:
+                while slots:
+                    for position in range(min(self.per_subscription_limit, len(slots))):
+                        if not isinstance(slots[position], asyncio.Task):
+                            slots[position] = asyncio.ensure_future(self._fetch_window(sub_id, slots[position]))
+                    pages, split_windows = await slots.popleft()
+                    for page in pages:
+                        await page_queue.put(page)
+                    slots.extendleft(reversed(split_windows))
+        except asyncio.CancelledError:
+            for slot in slots:
+                if isinstance(slot, asyncio.Task):
+                    slot.cancel()
+            raise
+        except Exception as e:
+            # Counted as a failed request so callers know the results are incomplete
+            self.retry_scheduler.record_error()
+            async_log_getters_logger.error(f'Exception occurred while fetching subscription {sub_id}: {e}')
+        await page_queue.put(None)
+
+    def iter_queue_pages(self, page_queue: asyncio.Queue) -> Iterator[list[dict]]:
+        while True:
+            page = asyncio.run_coroutine_threadsafe(page_queue.get(), self.loop).result()
+            if page is None:
+                return
+            yield page
+
+    async def _fetch_page(self, sub_id: str, url: str) -> tuple:
+        subscription_semaphore = self._subscription_semaphores.setdefault(sub_id, asyncio.Semaphore(self.per_subscription_limit))
+        async with subscription_semaphore:
+            return await fetch_logs_restapi_async(self.session, url, self.headers, self.retry_scheduler, self._limiter)
+
+    # Returns the slice's pages and, when it was split, the two halves of the unfetched older range
+    async def _fetch_window(self, sub_id: str, window: tuple[datetime, datetime]) -> tuple[list[list[dict]], list[tuple[datetime, datetime]]]:
+        start, end = window
+        url = build_activity_url(sub_id, format_filter_time(start), format_filter_time(end), self.cor_id)
+
+        pages: list[list[dict]] = []
+        page_count = 0
+        while url:
+            response_value, response_next = await self._fetch_page(sub_id, url)
+            if response_value:
+                pages.append(response_value)
+            url = response_next
+            page_count += 1
+            if url and page_count >= self.max_pages_per_slice:
+                unfetched_end = get_unfetched_window_end(pages)
+                if unfetched_end is not None and (unfetched_end - start) >= self.min_slice * 2:
+                    async_log_getters_logger.info(f'Splitting time slice {format_filter_time(start)} - {format_filter_time(unfetched_end)} after {page_count} pages.')
+                    return pages, split_time_window(start, unfetched_end, 2)
+        async_log_getters_logger.info(f'[+] Collected time slice {format_filter_time(start)} - {format_filter_time(end)} ({sub_id}).')
+        return pages, []
+
+    def close(self) -> None:
+        async def _close():
+            # Every task still on the loop (subscriptions, their slices, limiter wake ups) is cancelled and awaited before the loop stops
+            self._limiter.close()
+            pending_tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in pending_tasks:
+                task.cancel()
+            await asyncio.gather(*pending_tasks, return_exceptions=True)
+            await self.session.close()
+        asyncio.run_coroutine_threadsafe(_close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+
+def get_azure_activity_async(sub_ids: list[str], headers: dict[str, str], filter_start_time: str, filter_end_time: str, cor_id: str | None = None,
+                             fetch_workers: int = 1, subscription_workers: int = 4, retry_scheduler: RetryScheduler | None = None) -> list[dict]:
+    activity_logs: list[dict] = []
+    for page in iter_azure_activity_async(sub_ids, headers, filter_start_time, filter_end_time, cor_id, fetch_workers, subscription_workers, retry_scheduler):
+        activity_logs.extend(page)
+    return activity_logs
+
+
+def iter_azure_activity_async(sub_ids: list[str], headers: dict[str, str], filter_start_time: str, filter_end_time: str, cor_id: str | None = None,
+                              fetch_workers: int = 1, subscription_workers: int = 4, retry_scheduler: RetryScheduler | None = None) -> Iterator[list[dict]]:
+    # Pages are yielded in subscription then slice order, subscriptions waiting their turn buffer a few pages
+    try:
+        windows = get_time_windows(filter_start_time, filter_end_time, fetch_workers)
+    except ValueError as e:
+        async_log_getters_logger.critical(f'Unable to parse the start or end time for time slicing: {e}')
+        return
+
+    fetcher = AsyncTimeSlicedFetcher(headers, cor_id, concurrency=fetch_workers * subscription_workers, per_subscription_limit=fetch_workers, retry_scheduler=retry_scheduler,
+                                     subscription_limit=subscription_workers)
+    try:
+        page_queues = fetcher.start_subscriptions(sub_ids, windows)
+        for sub_id, page_queue in zip(sub_ids, page_queues):
+            yield from tag_subscription_pages(sub_id, dedupe_activity_pages(fetcher.iter_queue_pages(page_queue)))
+    finally:
+        fetcher.close()
@@ -0,0 +1,107 @@
+"""
+Tool Name: Azure Activity Log Axe
+Script Name: checkpoint.py
+Author: Nathan Eades
+Date: 2024-06-01
+Description: Persisted high-water mark (last eventTimestamp & seen eventDataIds) for follow mode.
+License: Apache License
+"""
+
+#   This file is part of Azure Activity Log Axe.
+#
+#   Copyright 2024 Permiso Security <https://permiso.io>
+#         Nathan Eades:
+#             - LinkedIn: <@eadesclouddef>
+#             - GitHub: <eadesclouddef> or <neades2305>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import hashlib
+import json
+import os
+from .config import FOLLOW_OVERLAP_MINUTES
+from .log_getters import format_filter_time, parse_filter_time
+from .logger import get_logger
+from datetime import datetime, timedelta
+from pathlib import Path
+
+checkpoint_logger = get_logger('checkpoint')
+parent_path = Path(__file__).parent.parent.parent
+
+
+class FollowCheckpoint:
+    # Polls re-read overlap_minutes before the high-water mark, seen eventDataIds inside that overlap are skipped
+    def __init__(self, filepath: Path, overlap_minutes: int = FOLLOW_OVERLAP_MINUTES):
+        self.filepath = filepath
+        self.overlap = timedelta(minutes=overlap_minutes)
+        self.last_event_time: datetime | None = None
+        self.seen_event_ids: dict[str, str] = {}  # eventDataId: eventTimestamp
+        self.load()
+
+    @staticmethod
+    def get_default_path(sub_ids: list[str], all_subscriptions: bool = False, cor_id: str | None = None) -> Path:
+        scope = 'all' if all_subscriptions else ','.join(sorted(sub_id.lower() for sub_id in sub_ids))
+        scope_hash = hashlib.sha256(f'{scope}|{(cor_id or "").lower()}'.encode()).hexdigest()[:16]
+        return Path(parent_path).joinpath('checkpoints', f'follow_{scope_hash}.json')
+
+    def load(self) -> None:
+        try:
+            with open(self.filepath, 'r') as file:
+                checkpoint = json.load(file)
+            last_event_time = checkpoint.get('lastEventTimestamp')
+            self.last_event_time = parse_filter_time(last_event_time) if last_event_time else None
+            self.seen_event_ids = checkpoint.get('seenEventDataIds', {})
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            checkpoint_logger.warning(f'Unable to read checkpoint {self.filepath}, starting without one: {e}')
+
+    def save(self) -> None:
+        self.filepath.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.filepath.with_suffix('.tmp')
+        try:
+            with open(temp_path, 'w') as file:
+                json.dump({
+                    'lastEventTimestamp': format_filter_time(self.last_event_time) if self.last_event_time else None,
+                    'seenEventDataIds': self.seen_event_ids,
+                }, file)
+            os.replace(temp_path, self.filepath)
+        except OSError as e:
+            checkpoint_logger.error(f'Unable to write checkpoint {self.filepath}: {e}')
+
+    def get_poll_start(self, default_start: datetime) -> datetime:
+        if self.last_event_time is None:
+            return default_start
+        return self.last_event_time - self.overlap
+
+    def filter_new_events(self, activity_logs: list[dict]) -> list[dict]:
+        return [raw_event for raw_event in activity_logs if raw_event.get('eventDataId') not in self.seen_event_ids]
+
+    def update(self, activity_logs: list[dict]) -> None:
+        for raw_event in activity_logs:
+            event_time = raw_event.get('eventTimestamp')
+            if not event_time:
+                continue
+            try:
+                parsed_event_time = parse_filter_time(event_time)
+            except ValueError:
+                continue
+            if self.last_event_time is None or parsed_event_time > self.last_event_time:
+                self.last_event_time = parsed_event_time
+            if raw_event.get('eventDataId'):
+                self.seen_event_ids[raw_event['eventDataId']] = event_time
+
+        # Ids older than the overlap can no longer be returned by a poll
+        if self.last_event_time is not None:
+            cutoff = self.last_event_time - self.overlap
+            self.seen_event_ids = {event_id: event_time for event_id, event_time in self.seen_event_ids.items() if parse_filter_time(event_time) >= cutoff}
@@ -27,9 +27,86 @@ License: Apache License
 #   limitations under the License.
 
 import logging
+import os
 
 # Global Log Level
 LOG_LEVEL: int = logging.WARNING
 
+# Azure Resource Manager endpoint (override to point at a sovereign cloud or a local mock endpoint)
+MANAGEMENT_ENDPOINT: str = os.environ.get('AZURE_LOG_AXE_MANAGEMENT_ENDPOINT', 'https://management.azure.com').rstrip('/')
+
 # Available Output Types
 valid_output_types: list[str] = ['json', 'csv']
+
+# Time-Sliced Fetching
+# Number of time slices queued per fetch worker when --fetch-workers is greater than 1
+FETCH_SLICES_PER_WORKER: int = 4
+# A slice that pages past this many pages is split in half and re-fetched
+FETCH_MAX_PAGES_PER_SLICE: int = 20
+# Slices are never split below this width (seconds)
+FETCH_MIN_SLICE_SECONDS: int = 60
+
+# Multi-Subscription Fetching
+# Number of subscriptions fetched at the same time
+SUBSCRIPTION_WORKERS: int = 4
+# Pages a subscription fetcher buffers ahead of the consumer, fetchers block when their buffer is full
+SUBSCRIPTION_PREFETCH_PAGES: int = 4
+
+# Fetch Engines
+# threads: requests.Session per worker thread, async: single event loop with a shared aiohttp connection pool
+valid_fetch_engines: list[str] = ['threads', 'async']
+
+# Fetch Retries & Throttling
+# Attempts per request after the first failure (429, 408 & 5xx or connection errors)
+FETCH_MAX_RETRIES: int = 6
+# Jittered exponential backoff (seconds) when the response has no Retry-After header
+FETCH_RETRY_BASE_DELAY: float = 1.0
+FETCH_RETRY_MAX_DELAY: float = 60.0
+# x-ms-ratelimit-remaining-* below the low mark shrinks concurrency, above the high mark grows it back
+RATELIMIT_LOW_REMAINING: int = 25
+RATELIMIT_HIGH_REMAINING: int = 100
+
+# On-Disk Fetch Cache
+# Raw pages are cached per subscription, filter and time bucket
+FETCH_CACHE_BUCKET_MINUTES: int = 60
+# Buckets that ended less than this long ago may still receive late events and are always fetched
+FETCH_CACHE_SETTLE_MINUTES: int = 30
+# Least recently used buckets are evicted past this size
+FETCH_CACHE_MAX_MB: int = 1024
+
+# Follow Mode
+# Seconds between polls of the activity log endpoint
+FOLLOW_INTERVAL_SECONDS: int = 300
+# Each poll re-reads this many minutes before the checkpoint to pick up late arriving events
+FOLLOW_OVERLAP_MINUTES: int = 30
+# --emit-completed: minutes without events (event time) before an operation with a terminal status is emitted
+FOLLOW_QUIET_MINUTES: int = 15
+
+# Offline Input
+# Events handed to the processor per page when reading --input files
+INPUT_PAGE_SIZE: int = 5000
+# Bytes read per chunk by the incremental json parser
+INPUT_CHUNK_SIZE: int = 1024 * 1024
+# --input-workers: pages each worker process parses ahead of the reader, workers block when their queue is full
+INPUT_PREFETCH_PAGES: int = 4
+
+# Sharded Simplification
+# NDJSON bytes buffered per shard before they are sent to its worker process
+SIMPLIFY_CHUNK_BYTES: int = 1024 * 1024
+
+# Out-of-Core Grouping (--spill)
+# Memory budget (MB) for the spill insert buffer and SQLite page cache
+SPILL_MEMORY_BUDGET_MB: int = 256
+
+# DataFrame Views
+# Full & filtered DataFrames kept per dataset for show, save & aggrid (least recently used are evicted)
+DATAFRAME_VIEW_CACHE_SIZE: int = 16
+
+# Query Engine (--query)
+# Candidate rows fetched per chunk when query terms are evaluated by scanning
+QUERY_SCAN_CHUNK_ROWS: int = 10000
+
+# Axe Key
+# Memoized (correlationId, operationName, resourceId) triples
+AXE_KEY_CACHE_SIZE: int = 65536
+valid_axe_key_hash_modes: list[str] = ['md5', 'blake2b', 'xxhash']
@@ -0,0 +1,167 @@
+"""
+Tool Name: Azure Activity Log Axe
+Script Name: fetch_cache.py
+Author: Nathan Eades
+Date: 2024-06-01
+Description: Compressed on-disk cache of raw activity log pages keyed by subscription, filter and time bucket.
+License: Apache License
+"""
+
+#   This file is part of Azure Activity Log Axe.
+#
+#   Copyright 2024 Permiso Security <https://permiso.io>
+#         Nathan Eades:
+#             - LinkedIn: <@eadesclouddef>
+#             - GitHub: <eadesclouddef> or <neades2305>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from .config import FETCH_CACHE_BUCKET_MINUTES, FETCH_CACHE_MAX_MB, FETCH_CACHE_SETTLE_MINUTES
+from .logger import get_logger
+from datetime import datetime, timedelta
+from pathlib import Path
+
+fetch_cache_logger = get_logger('fetch_cache')
+parent_path = Path(__file__).parent.parent.parent
+
+
+class FetchCache:
+    # One gzip json file per (subscription, filter, bucket). Settled buckets are immutable and never fetched twice,
+    # the index tracks sizes and last access for LRU eviction.
+    def __init__(self, cache_dir: Path | None = None, max_size_mb: int = FETCH_CACHE_MAX_MB,
+                 bucket_minutes: int = FETCH_CACHE_BUCKET_MINUTES, settle_minutes: int = FETCH_CACHE_SETTLE_MINUTES):
+        self.cache_dir = Path(cache_dir) if cache_dir else Path(parent_path).joinpath('cache')
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_size_bytes = max_size_mb * 1024 * 1024
+        self.bucket_size = timedelta(minutes=bucket_minutes)
+        self.settle_time = timedelta(minutes=settle_minutes)
+        self.index_path = self.cache_dir.joinpath('index.json')
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index: dict[str, dict] = self.load_index()
+
+    def load_index(self) -> dict[str, dict]:
+        try:
+            with open(self.index_path, 'r') as file:
+                index = json.load(file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            fetch_cache_logger.warning(f'Fetch cache index is unreadable, starting a new index: {e}')
+            return {}
+        # Drop entries whose file was removed outside the tool
+        return {key: entry for key, entry in index.items() if self.get_bucket_path(key).exists()}
+
+    def save_index(self) -> None:
+        with self._lock:
+            temp_path = self.index_path.with_suffix('.tmp')
+            try:
+                with open(temp_path, 'w') as file:
+                    json.dump(self._index, file)
+                os.replace(temp_path, self.index_path)
+            except OSError as e:
+                fetch_cache_logger.error(f'Unable to write the fetch cache index: {e}')
+
+    def get_buckets(self, start: datetime, end: datetime) -> list[tuple[datetime, datetime]]:
+        # Aligned buckets covering start to end, newest first
+        bucket_seconds = int(self.bucket_size.total_seconds())
+        epoch = datetime(1970, 1, 1)
+        bucket_start = epoch + timedelta(seconds=int((start - epoch).total_seconds()) // bucket_seconds * bucket_seconds)
+        buckets: list[tuple[datetime, datetime]] = []
+        while bucket_start <= end:
+            buckets.append((bucket_start, bucket_start + self.bucket_size))
+            bucket_start += self.bucket_size
+        buckets.reverse()
+        return buckets
+
+    def is_settled(self, bucket_end: datetime) -> bool:
+        return bucket_end <= datetime.utcnow() - self.settle_time
+
+    def get_bucket_key(self, sub_id: str, cor_id: str | None, bucket_start: datetime) -> str:
+        return hashlib.sha256(f'{sub_id.lower()}|{(cor_id or "").lower()}|{bucket_start.isoformat()}'.encode()).hexdigest()
+
+    def get_bucket_path(self, key: str) -> Path:
+        return self.cache_dir.joinpath(key[:2], f'{key}.json.gz')
+
+    def get(self, sub_id: str, cor_id: str | None, bucket_start: datetime) -> list[dict] | None:
+        key = self.get_bucket_key(sub_id, cor_id, bucket_start)
+        with self._lock:
+            entry = self._index.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        try:
+            with gzip.open(self.get_bucket_path(key), 'rt') as file:
+                events = json.load(file)
+        except (OSError, ValueError) as e:
+            fetch_cache_logger.warning(f'Dropping unreadable fetch cache bucket {key}: {e}')
+            self.remove(key)
+            self.misses += 1
+            return None
+        with self._lock:
+            entry['last_access'] = time.time()
+        self.hits += 1
+        return events
+
+    def put(self, sub_id: str, cor_id: str | None, bucket_start: datetime, events: list[dict]) -> None:
+        key = self.get_bucket_key(sub_id, cor_id, bucket_start)
+        bucket_path = self.get_bucket_path(key)
+        bucket_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = bucket_path.with_suffix('.tmp')
+        try:
+            with gzip.open(temp_path, 'wt') as file:
+                json.dump(events, file)
+            os.replace(temp_path, bucket_path)
+        except OSError as e:
+            fetch_cache_logger.error(f'Unable to write fetch cache bucket {key}: {e}')
+            return
+        with self._lock:
+            self._index[key] = {
+                'subscriptionId': sub_id,
+                'correlationId': cor_id,
+                'bucketStart': bucket_start.isoformat(),
+                'size': bucket_path.stat().st_size,
+                'last_access': time.time(),
+            }
+        self.evict()
+
+    def remove(self, key: str) -> None:
+        with self._lock:
+            self._index.pop(key, None)
+        try:
+            self.get_bucket_path(key).unlink()
+        except OSError:
+            pass
+
+    def evict(self) -> None:
+        # Least recently used first until the cache fits max_size_bytes
+        with self._lock:
+            total_size = sum(entry['size'] for entry in self._index.values())
+            if total_size <= self.max_size_bytes:
+                return
+            evict_keys: list[str] = []
+            for key, entry in sorted(self._index.items(), key=lambda item: item[1]['last_access']):
+                if total_size <= self.max_size_bytes:
+                    break
+                total_size -= entry['size']
+                evict_keys.append(key)
+        for key in evict_keys:
+            fetch_cache_logger.info(f'Evicting fetch cache bucket {key}.')
+            self.remove(key)
@@ -27,17 +27,28 @@ License: Apache License
 #   limitations under the License.
 
 import csv
+import itertools
 import json
+import textwrap
 from .config import valid_output_types
 from .logger import get_logger
 from pathlib import Path
+from typing import Iterable
+
+try:
+    import orjson
+except ImportError:  # Optional, faster event (de)serialization
+    orjson = None
 
 file_io_logger = get_logger('file_io')
 parent_path = Path(__file__).parent.parent.parent
 
 
-def write_activity_log_data(activity_log: list[dict], default_filename: str, filepath: Path | None = None, output_type: str = "json"):
+# activity_log may be a list or an iterator of records (streamed from a spill store), records are written as they arrive
+def write_activity_log_data(activity_log: Iterable[dict], default_filename: str, filepath: Path | None = None, output_type: str = "json"):
     write_to_file: bool = True
+    activity_log = iter(activity_log)
+    first_record: dict | None = next(activity_log, None)
     if not filepath:
         # Write to default location
         Path(parent_path).joinpath('output').mkdir(parents=True, exist_ok=True)
@@ -54,7 +65,7 @@ def write_activity_log_data(activity_log: list[dict], default_filename: str, fil
             else:
                 write_to_file = False
 
-    if write_to_file and activity_log:
+    if write_to_file and first_record is not None:
         try:
             # Force a correct file type
             if output_type not in valid_output_types:
@@ -66,21 +77,59 @@ def write_activity_log_data(activity_log: list[dict], default_filename: str, fil
                 filepath = update_file_extension(filepath, output_type)
             with open(filepath, 'w', newline='') as file:
                 if output_type == 'json':
-                    json.dump(activity_log, file, indent=2)
+                    write_json_array(file, itertools.chain((first_record,), activity_log))
                 elif output_type == 'csv':
-                    keys = activity_log[0].keys()
+                    keys = first_record.keys()
                     csv_writer = csv.DictWriter(file, fieldnames=keys)
                     csv_writer.writeheader()
+                    csv_writer.writerow(first_record)
                     csv_writer.writerows(activity_log)
         except Exception as e:
             file_io_logger.critical(f'Unexpected error: {str(e)}.')
     else:
         if not write_to_file:
             file_io_logger.debug(f'No data was written to file, file path did not exist and was not created.')
-        elif not activity_log:
+        elif first_record is None:
             file_io_logger.debug(f'No data was written to file as the activity log is empty.')
 
 
+# Same layout as json.dump(records, file, indent=2), one record in memory at a time
+def write_json_array(file, records: Iterable[dict]) -> None:
+    file.write('[')
+    separator = '\n'
+    for record in records:
+        file.write(separator)
+        file.write(textwrap.indent(json.dumps(record, indent=2), '  '))
+        separator = ',\n'
+    file.write('\n]' if separator != '\n' else ']')
+
+
 def update_file_extension(filepath: Path, new_extension):
     updated_filepath = filepath.with_suffix('.' + new_extension)
     return updated_filepath
+
+
+def read_subscription_ids(filepath: Path) -> list[str]:
+    # One subscription id per line (comma delimited also accepted), '#' starts a comment
+    subscription_ids: list[str] = []
+    try:
+        with open(filepath, 'r') as file:
+            for line in file:
+                line = line.split('#', 1)[0]
+                subscription_ids.extend(sub_id.strip() for sub_id in line.split(',') if sub_id.strip())
+    except OSError as e:
+        file_io_logger.critical(f'Unable to read subscriptions file {filepath}: {str(e)}.')
+    return subscription_ids
+
+
+# Compact single line json bytes for one event (NDJSON transfer, columnar blobs)
+def dump_event_line(raw_event: dict) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(raw_event)
+    return json.dumps(raw_event, separators=(',', ':')).encode()
+
+
+def load_event_line(line: bytes) -> dict:
+    if orjson is not None:
+        return orjson.loads(line)
+    return json.loads(line)
@@ -26,66 +26,518 @@ License: Apache License
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 
+import queue
 import requests
+import threading
+import time
 from .auth import AzureMonitorAuth
+from .config import FETCH_MAX_PAGES_PER_SLICE, FETCH_MIN_SLICE_SECONDS, FETCH_SLICES_PER_WORKER, MANAGEMENT_ENDPOINT, SUBSCRIPTION_PREFETCH_PAGES
+from .fetch_cache import FetchCache
 from .logger import get_logger
+from .retry import RETRYABLE_STATUS_CODES, RetryScheduler
+from .timestamps import parse_event_timestamp
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
 from datetime import timedelta
+from typing import Iterable, Iterator
 
 log_getters_logger = get_logger('log_getters')
 
+FILTER_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
 
-def fetch_logs_restapi(session, url, headers) -> tuple:
-    try:
-        response = session.get(url, headers=headers)
-        status_code: int = response.status_code
+
+class PrefetchError(RuntimeError):
+    pass
+
+
+def fetch_logs_restapi(session, url, headers, retry_scheduler: RetryScheduler | None = None) -> tuple:
+    # Retryable failures (429, 408, 5xx, connection errors) re-request the same url, so pagination resumes from the failed nextLink
+    retry_scheduler = retry_scheduler or RetryScheduler()
+    attempt = 0
+    while True:
+        response = None
+        try:
+            with retry_scheduler.limiter:
+                response = session.get(url, headers=headers)
+            status_code: int | None = response.status_code
+        except requests.RequestException as e:
+            status_code = None
+            log_getters_logger.warning(f'Connection error while fetching logs: {e}')
+        except Exception as e:
+            retry_scheduler.record_error()
+            log_getters_logger.error(f'Exception occurred while fetching logs: {e}')
+            return None, None
+
+        response_headers = response.headers if response is not None else None
+        retry_scheduler.record_response(status_code, response_headers)
         if status_code == 200:
-            response_json = response.json()
+            try:
+                response_json = response.json()
+            except ValueError as e:
+                retry_scheduler.record_error()
+                log_getters_logger.error(f'Exception occurred while decoding logs: {e}')
+                return None, None
             if response_json.get('value'):
                 return response_json.get('value', []), response_json.get('nextLink', None)
+            elif response_json.get('nextLink'):
+                # Empty page mid pagination, keep following the chain
+                return [], response_json.get('nextLink')
             else:
                 log_getters_logger.warning(f'Logger: The provided parameters resulted in an empty log set.')
                 return None, None
+        elif retry_scheduler.should_retry(status_code, attempt):
+            delay = retry_scheduler.get_retry_delay(attempt, response_headers)
+            retry_scheduler.record_retry(status_code, delay)
+            log_getters_logger.warning(f'Fetch returned status {status_code}, retrying the same page in {delay:.1f}s (attempt {attempt + 1}/{retry_scheduler.max_retries}).')
+            time.sleep(delay)
+            attempt += 1
         else:
-            log_getters_logger.error(f'Error fetching logs from restapi. Status Code: {status_code}: {response.text}')
+            if status_code in RETRYABLE_STATUS_CODES or status_code is None:
+                retry_scheduler.record_exhausted()
+                log_getters_logger.critical(f'Retries exhausted, logs are truncated at: {url}')
+            else:
+                retry_scheduler.record_error()
+                log_getters_logger.error(f'Error fetching logs from restapi. Status Code: {status_code}: {response.text}')
             return None, None
-    except Exception as e:
-        log_getters_logger.error(f'Exception occurred while fetching logs: {e}')
-        return None, None
 
 
-def get_azure_activity_restapi(sub_id: str, filter_start_time: str | None = None, filter_end_time: str | None = None, cor_id: str | None = None) -> list[dict]:
-    auth_instance = AzureMonitorAuth()
-    headers = auth_instance.chain_auth_restapi()
-    if not headers:
-        log_getters_logger.critical('Response from auth returned empty header.')
-        return []
-
+def get_filter_window(filter_start_time: str | None, filter_end_time: str | None) -> tuple[str, str]:
+    # Defaults to the last 24 hours unless both start & end time are provided
     if not filter_start_time or not filter_end_time:
         filter_end_time = datetime.utcnow()
         filter_start_time = filter_end_time - timedelta(days=1)
 
         filter_end_time = filter_end_time.strftime('%Y-%m-%dT%H:%M:%SZ')
         filter_start_time = filter_start_time.strftime('%Y-%m-%dT%H:%M:%SZ')
+    return filter_start_time, filter_end_time
+
 
+def build_activity_url(sub_id: str, filter_start_time: str, filter_end_time: str, cor_id: str | None = None) -> str:
     if cor_id:
-        url = (f"https://management.azure.com/subscriptions/{sub_id}/providers/microsoft.insights/eventtypes/management/values"
-               f"?api-version=2015-04-01"
-               f"&$filter=eventTimestamp ge '{filter_start_time}' and eventTimestamp le '{filter_end_time}' and correlationId eq '{cor_id}'")
-    else:
-        url = (f"https://management.azure.com/subscriptions/{sub_id}/providers/microsoft.insights/eventtypes/management/values"
-               f"?api-version=2015-04-01"
-               f"&$filter=eventTimestamp ge '{filter_start_time}' and eventTimestamp le '{filter_end_time}'")
+        return (f"{MANAGEMENT_ENDPOINT}/subscriptions/{sub_id}/providers/microsoft.insights/eventtypes/management/values"
+                f"?api-version=2015-04-01"
+                f"&$filter=eventTimestamp ge '{filter_start_time}' and eventTimestamp le '{filter_end_time}' and correlationId eq '{cor_id}'")
+    return (f"{MANAGEMENT_ENDPOINT}/subscriptions/{sub_id}/providers/microsoft.insights/eventtypes/management/values"
+            f"?api-version=2015-04-01"
+            f"&$filter=eventTimestamp ge '{filter_start_time}' and eventTimestamp le '{filter_end_time}'")
+
+
+def parse_filter_time(filter_time: str) -> datetime:
+    # Accepts Azure style timestamps, fractional seconds are trimmed to 6 digits (Python iso rec)
+    filter_time = filter_time.strip()
+    if filter_time.endswith('Z'):
+        try:
+            return parse_event_timestamp(filter_time)
+        except ValueError:
+            pass
+    filter_time = filter_time.rstrip('Z')
+    if '.' in filter_time:
+        seconds, fraction = filter_time.split('.', 1)
+        filter_time = f'{seconds}.{fraction[:6].ljust(6, "0")}'
+    return datetime.fromisoformat(filter_time).replace(tzinfo=None)
+
+
+def format_filter_time(filter_time: datetime) -> str:
+    return filter_time.strftime(FILTER_TIME_FORMAT)
+
+
+def get_time_windows(filter_start_time: str, filter_end_time: str, fetch_workers: int) -> list[tuple[datetime, datetime]]:
+    start, end = parse_filter_time(filter_start_time), parse_filter_time(filter_end_time)
+    if fetch_workers > 1:
+        return split_time_window(start, end, fetch_workers * FETCH_SLICES_PER_WORKER)
+    return [(start, end)]
+
+
+def split_time_window(start: datetime, end: datetime, slices: int) -> list[tuple[datetime, datetime]]:
+    # Newest slice first, matching the order the endpoint returns events in
+    slices = max(1, slices)
+    width = (end - start) / slices
+    boundaries = [start + width * i for i in range(slices)] + [end]
+    windows = [(boundaries[i], boundaries[i + 1]) for i in range(slices)]
+    windows.reverse()
+    return windows
+
+
+def dedupe_activity_logs(pages: Iterable[list[dict]]) -> list[dict]:
+    activity_logs: list[dict] = []
+    for page in dedupe_activity_pages(pages):
+        activity_logs.extend(page)
+    return activity_logs
+
+
+def dedupe_activity_pages(pages: Iterable[list[dict]]) -> Iterator[list[dict]]:
+    # Adjacent slices share their boundary timestamp, drop repeated eventDataIds
+    seen_event_ids: set[str] = set()
+    for page in pages:
+        deduped_page: list[dict] = []
+        for raw_event in page:
+            event_id = raw_event.get('eventDataId')
+            if event_id:
+                if event_id in seen_event_ids:
+                    continue
+                seen_event_ids.add(event_id)
+            deduped_page.append(raw_event)
+        if deduped_page:
+            yield deduped_page
+
+
+def get_unfetched_window_end(pages: list[list[dict]]) -> datetime | None:
+    # Pages are newest first, events up to the oldest timestamp seen (inclusive, later pages may share it) are not fetched yet.
+    # One microsecond past it so the 6 digit filter time never cuts off 7 digit event times. None when no page has a timestamp.
+    for page in reversed(pages):
+        event_times: list[datetime] = []
+        for raw_event in page:
+            try:
+                event_times.append(parse_filter_time(raw_event['eventTimestamp']))
+            except (KeyError, TypeError, ValueError):
+                continue
+        if event_times:
+            return min(event_times) + timedelta(microseconds=1)
+    return None
+
+
+class TimeSlicedFetcher:
+    # Follows the nextLink chain of each time slice on a bounded worker pool.
+    # Slices that page past max_pages_per_slice keep the pages fetched so far, the range older than those pages is split in half and re-submitted.
+    def __init__(self, sub_id: str, headers: dict[str, str], cor_id: str | None = None, workers: int = 4, retry_scheduler: RetryScheduler | None = None,
+                 max_pages_per_slice: int = FETCH_MAX_PAGES_PER_SLICE, min_slice_seconds: int = FETCH_MIN_SLICE_SECONDS):
+        self.sub_id = sub_id
+        self.retry_scheduler = retry_scheduler or RetryScheduler(max_concurrency=workers)
+        self.headers = headers
+        self.cor_id = cor_id
+        self.max_pages_per_slice = max_pages_per_slice
+        self.min_slice = timedelta(seconds=min_slice_seconds)
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='log-axe-fetch')
+        self._local = threading.local()
+        self._sessions: list[requests.Session] = []
+        self._sessions_lock = threading.Lock()
+
+    def _get_session(self) -> requests.Session:
+        # One keep-alive session per worker thread
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            self._local.session = session
+            with self._sessions_lock:
+                self._sessions.append(session)
+        return session
+
+    def submit(self, window: tuple[datetime, datetime]) -> Future:
+        return self.executor.submit(self._fetch_window, window)
+
+    # Returns the slice's pages, the futures of the unfetched older range when it was split,
+    # and whether every request of the slice got its data (no failed or truncated page)
+    def _fetch_window(self, window: tuple[datetime, datetime]) -> tuple[list[list[dict]], list[Future], bool]:
+        start, end = window
+        session = self._get_session()
+        # The whole slice is fetched on this thread, so the thread's failure count isolates it from other slices & subscriptions
+        failure_count = self.retry_scheduler.get_thread_failure_count()
+        url = build_activity_url(self.sub_id, format_filter_time(start), format_filter_time(end), self.cor_id)
+
+        pages: list[list[dict]] = []
+        page_count = 0
+        while url:
+            response_value, response_next = fetch_logs_restapi(session, url, self.headers, self.retry_scheduler)
+            if response_value:
+                pages.append(response_value)
+            url = response_next
+            page_count += 1
+            if url and page_count >= self.max_pages_per_slice:
+                unfetched_end = get_unfetched_window_end(pages)
+                if unfetched_end is not None and (unfetched_end - start) >= self.min_slice * 2:
+                    log_getters_logger.info(f'Splitting time slice {format_filter_time(start)} - {format_filter_time(unfetched_end)} after {page_count} pages.')
+                    return pages, [self.submit(half) for half in split_time_window(start, unfetched_end, 2)], self.retry_scheduler.get_thread_failure_count() == failure_count
+        log_getters_logger.info(f'[+] Collected time slice {format_filter_time(start)} - {format_filter_time(end)}.')
+        return pages, [], self.retry_scheduler.get_thread_failure_count() == failure_count
+
+    def iter_pages(self, windows: list[tuple[datetime, datetime]]) -> Iterator[list[dict]]:
+        # Pages are yielded in slice order (newest first) regardless of completion order
+        yield from self.iter_future_pages([self.submit(window) for window in windows])
+
+    def iter_future_pages(self, futures: list[Future]) -> Iterator[list[dict]]:
+        for future in futures:
+            pages, split_futures, _ = future.result()
+            yield from pages
+            yield from self.iter_future_pages(split_futures)
 
+    # Pages of the futures and their splits, complete is False when a request of any of them failed
+    def collect_future_pages(self, futures: list[Future]) -> tuple[list[list[dict]], bool]:
+        collected_pages: list[list[dict]] = []
+        complete = True
+        for future in futures:
+            pages, split_futures, window_complete = future.result()
+            split_pages, split_complete = self.collect_future_pages(split_futures)
+            collected_pages.extend(pages)
+            collected_pages.extend(split_pages)
+            complete = complete and window_complete and split_complete
+        return collected_pages, complete
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        with self._sessions_lock:
+            for session in self._sessions:
+                session.close()
+            self._sessions = []
+
+
+def get_azure_activity_restapi(sub_id: str, filter_start_time: str | None = None, filter_end_time: str | None = None, cor_id: str | None = None, fetch_workers: int = 1, retry_scheduler: RetryScheduler | None = None) -> list[dict]:
+    auth_instance = AzureMonitorAuth()
+    headers = auth_instance.chain_auth_restapi()
+    if not headers:
+        log_getters_logger.critical('Response from auth returned empty header.')
+        return []
+
+    filter_start_time, filter_end_time = get_filter_window(filter_start_time, filter_end_time)
+    return fetch_azure_activity(sub_id, headers, filter_start_time, filter_end_time, cor_id, fetch_workers, retry_scheduler or RetryScheduler(max_concurrency=fetch_workers))
+
+
+def fetch_azure_activity(sub_id: str, headers: dict[str, str], filter_start_time: str, filter_end_time: str, cor_id: str | None = None, fetch_workers: int = 1, retry_scheduler: RetryScheduler | None = None) -> list[dict]:
     activity_logs = []
+    for page in iter_azure_activity(sub_id, headers, filter_start_time, filter_end_time, cor_id, fetch_workers, retry_scheduler):
+        activity_logs.extend(page)
+    return activity_logs
+
+
+def iter_azure_activity(sub_id: str, headers: dict[str, str], filter_start_time: str, filter_end_time: str, cor_id: str | None = None, fetch_workers: int = 1,
+                        retry_scheduler: RetryScheduler | None = None, fetch_cache: FetchCache | None = None) -> Iterator[list[dict]]:
+    # Yields each page as it arrives
+    retry_scheduler = retry_scheduler or RetryScheduler(max_concurrency=fetch_workers)
+    if fetch_cache:
+        yield from iter_azure_activity_cached(sub_id, headers, filter_start_time, filter_end_time, cor_id, fetch_workers, retry_scheduler, fetch_cache)
+        return
+    if fetch_workers > 1:
+        yield from iter_azure_activity_time_sliced(sub_id, headers, filter_start_time, filter_end_time, cor_id, fetch_workers, retry_scheduler)
+        return
+
+    url = build_activity_url(sub_id, filter_start_time, filter_end_time, cor_id)
+
+    session = requests.Session()
+    try:
+        while url:
+            response_value, response_next = fetch_logs_restapi(session, url, headers, retry_scheduler)
+            if response_value:
+                yield response_value
+            url = response_next
+            log_getters_logger.info(f'[+] Collecting logs...')
+    finally:
+        session.close()
+
+
+def get_azure_activity_subscriptions(sub_ids: list[str], filter_start_time: str | None = None, filter_end_time: str | None = None, cor_id: str | None = None,
+                                     fetch_workers: int = 1, subscription_workers: int = 4, all_subscriptions: bool = False, fetch_engine: str = 'threads',
+                                     retry_scheduler: RetryScheduler | None = None, fetch_cache: FetchCache | None = None) -> list[dict]:
+    activity_logs: list[dict] = []
+    for page in iter_azure_activity_subscriptions(sub_ids, filter_start_time, filter_end_time, cor_id, fetch_workers, subscription_workers, all_subscriptions, fetch_engine, retry_scheduler, fetch_cache):
+        activity_logs.extend(page)
+    return activity_logs
+
+
+def iter_azure_activity_subscriptions(sub_ids: list[str], filter_start_time: str | None = None, filter_end_time: str | None = None, cor_id: str | None = None,
+                                      fetch_workers: int = 1, subscription_workers: int = 4, all_subscriptions: bool = False, fetch_engine: str = 'threads',
+                                      retry_scheduler: RetryScheduler | None = None, fetch_cache: FetchCache | None = None) -> Iterator[list[dict]]:
+    # Authenticates once and fetches every subscription concurrently, pages are yielded in subscription order as they arrive.
+    # fetch_workers is the per-subscription concurrency limit, retry_scheduler adapts the overall limit to the throttle budget.
+    retry_scheduler = retry_scheduler or RetryScheduler(max_concurrency=fetch_workers * subscription_workers)
+    auth_instance = AzureMonitorAuth()
+    headers = auth_instance.chain_auth_restapi()
+    if not headers:
+        retry_scheduler.record_error()
+        log_getters_logger.critical('Response from auth returned empty header.')
+        return
+
+    sub_ids = list(sub_ids)
+    if all_subscriptions:
+        sub_ids.extend(list_subscriptions(headers, retry_scheduler))
+    sub_ids = list(dict.fromkeys(sub_id.strip() for sub_id in sub_ids if sub_id and sub_id.strip()))
+    if not sub_ids:
+        log_getters_logger.critical('No subscriptions were provided or found.')
+        return
+
+    filter_start_time, filter_end_time = get_filter_window(filter_start_time, filter_end_time)
+
+    if fetch_engine == 'async' and fetch_cache:
+        log_getters_logger.warning('The fetch cache is served by the threads fetch engine.')
+    elif fetch_engine == 'async':
+        from .async_log_getters import is_async_engine_available, iter_azure_activity_async
+        if is_async_engine_available():
+            yield from iter_azure_activity_async(sub_ids, headers, filter_start_time, filter_end_time, cor_id, fetch_workers, subscription_workers, retry_scheduler)
+            return
+        log_getters_logger.warning('aiohttp is not installed, falling back to the threads fetch engine.')
+
+    if len(sub_ids) == 1:
+        yield from tag_subscription_pages(sub_ids[0], iter_azure_activity(sub_ids[0], headers, filter_start_time, filter_end_time, cor_id, fetch_workers, retry_scheduler, fetch_cache))
+        return
+
+    # Set when the consumer stops early, so fetchers blocked on a full queue can exit
+    stop_event = threading.Event()
+
+    def put_page(page_queue: queue.Queue, page: list[dict] | None) -> bool:
+        while not stop_event.is_set():
+            try:
+                page_queue.put(page, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def fetch_subscription(sub_id: str, page_queue: queue.Queue) -> None:
+        try:
+            for page in iter_azure_activity(sub_id, headers, filter_start_time, filter_end_time, cor_id, fetch_workers, retry_scheduler, fetch_cache):
+                if not put_page(page_queue, page):
+                    return
+        except Exception as e:
+            # Counted as a failed request so callers know the results are incomplete
+            retry_scheduler.record_error()
+            log_getters_logger.error(f'Exception occurred while fetching subscription {sub_id}: {e}')
+        finally:
+            put_page(page_queue, None)
+
+    # One queue per subscription keeps subscription order, so output is stable between runs.
+    # Queues are bounded: subscriptions waiting their turn buffer a few pages instead of their whole dataset.
+    page_queues: list[queue.Queue] = [queue.Queue(maxsize=SUBSCRIPTION_PREFETCH_PAGES) for _ in sub_ids]
+    with ThreadPoolExecutor(max_workers=max(1, min(subscription_workers, len(sub_ids))), thread_name_prefix='log-axe-sub') as executor:
+        try:
+            for sub_id, page_queue in zip(sub_ids, page_queues):
+                executor.submit(fetch_subscription, sub_id, page_queue)
+            for sub_id, page_queue in zip(sub_ids, page_queues):
+                yield from tag_subscription_pages(sub_id, iter(page_queue.get, None))
+        finally:
+            stop_event.set()
+
+
+def tag_subscription_pages(sub_id: str, pages: Iterable[list[dict]]) -> Iterator[list[dict]]:
+    event_count = 0
+    for page in pages:
+        for raw_event in page:
+            raw_event.setdefault('subscriptionId', sub_id)
+        event_count += len(page)
+        yield page
+    log_getters_logger.info(f'[+] Collected {event_count} events from subscription {sub_id}.')
+
+
+def prefetch_pages(pages: Iterable[list[dict]], depth: int = 2) -> Iterator[list[dict]]:
+    # Pulls pages on a background thread so the next page downloads while the current one is processed.
+    # A producer exception is passed through the queue and raised in the consumer, the pages after it were never fetched.
+    page_queue: queue.Queue = queue.Queue(maxsize=max(1, depth))
+    end_of_pages = object()
+    # Set when the consumer stops early, so a producer blocked on a full queue can exit
+    stop_event = threading.Event()
+
+    def put_page(page) -> bool:
+        while not stop_event.is_set():
+            try:
+                page_queue.put(page, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def producer() -> None:
+        try:
+            for page in pages:
+                if not put_page(page):
+                    return
+        except Exception as e:
+            put_page(e)
+        finally:
+            put_page(end_of_pages)
+
+    threading.Thread(target=producer, name='log-axe-prefetch', daemon=True).start()
+    try:
+        while (page := page_queue.get()) is not end_of_pages:
+            if isinstance(page, Exception):
+                log_getters_logger.critical(f'Exception occurred while fetching logs: {page}')
+                raise PrefetchError(f'Fetching logs failed, the run was stopped: {page}') from page
+            yield page
+    finally:
+        stop_event.set()
+
+
+def list_subscriptions(headers: dict[str, str], retry_scheduler: RetryScheduler | None = None) -> list[str]:
+    # Tenant enumeration, only enabled subscriptions have readable activity logs
+    url = f'{MANAGEMENT_ENDPOINT}/subscriptions?api-version=2020-01-01'
+    sub_ids: list[str] = []
 
     session = requests.Session()
     while url:
-        response_value, response_next = fetch_logs_restapi(session, url, headers)
-        if response_value:
-            activity_logs.extend(response_value)
+        response_value, response_next = fetch_logs_restapi(session, url, headers, retry_scheduler)
+        for subscription in response_value or []:
+            if subscription.get('state', 'Enabled') == 'Enabled' and subscription.get('subscriptionId'):
+                sub_ids.append(subscription['subscriptionId'])
         url = response_next
-        log_getters_logger.info(f'[+] Collecting logs...')
     session.close()
 
-    return activity_logs
+    log_getters_logger.info(f'[+] Found {len(sub_ids)} enabled subscriptions.')
+    return sub_ids
+
+
+def iter_azure_activity_time_sliced(sub_id: str, headers: dict[str, str], filter_start_time: str, filter_end_time: str, cor_id: str | None = None, fetch_workers: int = 4, retry_scheduler: RetryScheduler | None = None) -> Iterator[list[dict]]:
+    try:
+        windows = get_time_windows(filter_start_time, filter_end_time, fetch_workers)
+    except ValueError as e:
+        log_getters_logger.critical(f'Unable to parse the start or end time for time slicing: {e}')
+        return
+
+    fetcher = TimeSlicedFetcher(sub_id, headers, cor_id, fetch_workers, retry_scheduler)
+    try:
+        log_getters_logger.info(f'[+] Collecting logs across {len(windows)} time slices with {fetch_workers} workers...')
+        yield from dedupe_activity_pages(fetcher.iter_pages(windows))
+    finally:
+        fetcher.close()
+
+
+def iter_azure_activity_cached(sub_id: str, headers: dict[str, str], filter_start_time: str, filter_end_time: str, cor_id: str | None = None, fetch_workers: int = 1,
+                               retry_scheduler: RetryScheduler | None = None, fetch_cache: FetchCache | None = None) -> Iterator[list[dict]]:
+    # Settled buckets are served from the cache or fetched whole and cached, buckets still open are fetched for the requested range only
+    try:
+        start, end = parse_filter_time(filter_start_time), parse_filter_time(filter_end_time)
+    except ValueError as e:
+        log_getters_logger.critical(f'Unable to parse the start or end time for the fetch cache: {e}')
+        return
+
+    retry_scheduler = retry_scheduler or RetryScheduler(max_concurrency=fetch_workers)
+    fetcher = TimeSlicedFetcher(sub_id, headers, cor_id, fetch_workers, retry_scheduler)
+    try:
+        bucket_plan: list[tuple[datetime | None, list[dict] | None, Future | None]] = []
+        for bucket_start, bucket_end in fetch_cache.get_buckets(start, end):
+            if fetch_cache.is_settled(bucket_end):
+                cached_events = fetch_cache.get(sub_id, cor_id, bucket_start)
+                if cached_events is not None:
+                    bucket_plan.append((bucket_start, cached_events, None))
+                else:
+                    bucket_plan.append((bucket_start, None, fetcher.submit((bucket_start, bucket_end))))
+            else:
+                bucket_plan.append((None, None, fetcher.submit((max(start, bucket_start), min(end, bucket_end)))))
+        log_getters_logger.info(f'[+] Fetch cache served {sum(1 for _, cached, _ in bucket_plan if cached is not None)} of {len(bucket_plan)} time buckets for {sub_id}.')
+
+        def iter_bucket_pages() -> Iterator[list[dict]]:
+            for bucket_start, cached_events, future in bucket_plan:
+                if bucket_start is None:
+                    yield from fetcher.iter_future_pages([future])
+                    continue
+                if cached_events is None:
+                    # Only a bucket whose own requests all got their data is cached, settled buckets are never re-fetched
+                    pages, complete = fetcher.collect_future_pages([future])
+                    cached_events = [raw_event for page in pages for raw_event in page]
+                    if complete:
+                        fetch_cache.put(sub_id, cor_id, bucket_start, cached_events)
+                    else:
+                        log_getters_logger.warning(f'Not caching bucket {format_filter_time(bucket_start)} for {sub_id}, requests failed while it was fetched.')
+                window_events = [raw_event for raw_event in cached_events if is_event_in_window(raw_event, start, end)]
+                if window_events:
+                    yield window_events
+
+        yield from dedupe_activity_pages(iter_bucket_pages())
+    finally:
+        fetcher.close()
+        fetch_cache.save_index()
+
+
+def is_event_in_window(raw_event: dict, start: datetime, end: datetime) -> bool:
+    event_time = raw_event.get('eventTimestamp')
+    if not event_time:
+        return False
+    try:
+        return start <= parse_filter_time(event_time) <= end
+    except ValueError:
+        return False
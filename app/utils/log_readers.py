@@ -0,0 +1,358 @@
+"""
+Tool Name: Azure Activity Log Axe
+Script Name: log_readers.py
+Author: Nathan Eades
+Date: 2024-06-01
+Description: Offline ingestion of exported activity logs (json lines, diagnostic setting archives, Event Hub capture, saved outputs).
+License: Apache License
+"""
+
+#   This file is part of Azure Activity Log Axe.
+#
+#   Copyright 2024 Permiso Security <https://permiso.io>
+#         Nathan Eades:
+#             - LinkedIn: <@eadesclouddef>
+#             - GitHub: <eadesclouddef> or <neades2305>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import gzip
+import json
+import multiprocessing
+import queue
+import re
+from .config import INPUT_CHUNK_SIZE, INPUT_PAGE_SIZE, INPUT_PREFETCH_PAGES
+from .logger import get_logger
+from pathlib import Path
+from typing import IO, Any, Iterable, Iterator
+
+try:
+    import fastavro
+except ImportError:  # Optional, only required for Event Hub capture (.avro) files
+    fastavro = None
+
+log_readers_logger = get_logger('log_readers')
+
+input_file_suffixes: set[str] = {'.json', '.jsonl', '.ndjson', '.avro'}
+
+# '{', the first key and the first character of its value, or '{}'
+json_first_key_pattern = re.compile(r'\{\s*(?:\}|"((?:[^"\\]|\\.)*)"\s*:\s*(\S))')
+
+# Diagnostic setting (storage / Event Hub) values that differ from the REST schema
+diagnostic_status_values: dict[str, str] = {'Start': 'Started', 'Success': 'Succeeded', 'Failure': 'Failed', 'Accept': 'Accepted'}
+diagnostic_level_values: dict[str, str] = {'Information': 'Informational'}
+diagnostic_caller_claims: tuple[str, ...] = (
+    'http://schemas.xmlsoap.org/ws/2005/05/identity/claims/upn',
+    'http://schemas.xmlsoap.org/ws/2005/05/identity/claims/name',
+    'appid',
+)
+
+
+def get_input_files(input_paths: Iterable[Path]) -> list[Path]:
+    # Directories are searched recursively, gzip files are read transparently
+    input_files: list[Path] = []
+    for input_path in input_paths:
+        input_path = Path(input_path)
+        if input_path.is_dir():
+            input_files.extend(sorted(path for path in input_path.rglob('*') if path.is_file() and get_input_suffix(path) in input_file_suffixes))
+        elif input_path.is_file():
+            input_files.append(input_path)
+        else:
+            log_readers_logger.warning(f'Input path does not exist: {input_path}')
+    return input_files
+
+
+def get_input_suffix(path: Path) -> str:
+    suffixes = [suffix.lower() for suffix in path.suffixes]
+    if suffixes and suffixes[-1] == '.gz':
+        suffixes = suffixes[:-1]
+    return suffixes[-1] if suffixes else ''
+
+
+def open_input_file(path: Path) -> IO:
+    if path.suffix.lower() == '.gz':
+        return gzip.open(path, 'rt', encoding='utf-8-sig')
+    return open(path, 'r', encoding='utf-8-sig')
+
+
+def iter_json_array(file: IO, buffer: str = '', chunk_size: int = INPUT_CHUNK_SIZE) -> Iterator:
+    # Incrementally decodes the elements of a json array, the opening '[' must already be consumed.
+    # Returns (yield from) the unread buffer after the closing ']'.
+    decoder = json.JSONDecoder()
+    position = 0
+    end_of_file = False
+    while True:
+        # Skip whitespace and separators
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if position < len(buffer) and buffer[position] == ']':
+            return buffer[position + 1:]
+        if position >= len(buffer):
+            if end_of_file:
+                raise ValueError('Unexpected end of file inside a json array.')
+            chunk = file.read(chunk_size)
+            end_of_file = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        try:
+            element, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            # Element is split across chunks
+            if end_of_file:
+                raise
+            chunk = file.read(chunk_size)
+            end_of_file = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield element
+
+
+def decode_json_value(decoder: json.JSONDecoder, file: IO, buffer: str, position: int, chunk_size: int) -> tuple[Any, str, int]:
+    # raw_decode at position, reading more while the value is cut off (or may be, a number at the end of the buffer)
+    while True:
+        try:
+            value, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            value, end = None, -1
+        if 0 <= end < len(buffer):
+            return value, buffer, end
+        chunk = file.read(chunk_size)
+        if not chunk:
+            if end == -1:
+                decoder.raw_decode(buffer, position)  # Raises the decode error
+            return value, buffer, end
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+def skip_json_whitespace(file: IO, buffer: str, position: int, chunk_size: int, separators: str = ' \t\r\n') -> tuple[str, int]:
+    # Position of the next significant character, len(buffer) at the end of the file
+    while True:
+        while position < len(buffer) and buffer[position] in separators:
+            position += 1
+        if position < len(buffer):
+            return buffer, position
+        chunk = file.read(chunk_size)
+        if not chunk:
+            return '', 0
+        buffer, position = chunk, 0
+
+
+def iter_json_file(file: IO, chunk_size: int = INPUT_CHUNK_SIZE) -> Iterator[dict]:
+    # Supports a json array, json lines (or any sequence of objects), and objects holding a "records" array (diagnostic settings /
+    # Event Hub body). The format is decided from the first character, '[' or '{', and an object from its first key: a top level
+    # "records" array is streamed element by element whether the object spans one line or many. Other objects are decoded whole.
+    decoder = json.JSONDecoder()
+    buffer, position = skip_json_whitespace(file, '', 0, chunk_size)
+    if buffer[position:position + 1] == '[':
+        for element in iter_json_array(file, buffer[position + 1:], chunk_size):
+            yield from expand_records(element)
+        return
+
+    while True:
+        buffer, position = skip_json_whitespace(file, buffer, position, chunk_size)
+        if position >= len(buffer):
+            return
+        # Read on until the first key and the first character of its value are in the buffer
+        first_key = json_first_key_pattern.match(buffer, position)
+        while first_key is None and buffer[position] == '{' and len(buffer) - position < chunk_size:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            buffer = buffer[position:] + chunk
+            position = 0
+            first_key = json_first_key_pattern.match(buffer, position)
+
+        if first_key is None or first_key.group(1) != 'records' or first_key.group(2) != '[':
+            value, buffer, position = decode_json_value(decoder, file, buffer, position, chunk_size)
+            yield from expand_records(value)
+            continue
+
+        buffer = yield from iter_json_array(file, buffer[first_key.end():], chunk_size)
+        buffer, position = skip_object_members(decoder, file, buffer, chunk_size)
+
+
+def skip_object_members(decoder: json.JSONDecoder, file: IO, buffer: str, chunk_size: int) -> tuple[str, int]:
+    # Decodes and drops the members left after the "records" array, returns the position after the closing '}'
+    position = 0
+    while True:
+        buffer, position = skip_json_whitespace(file, buffer, position, chunk_size, ' \t\r\n,')
+        if position >= len(buffer):
+            raise ValueError('Unexpected end of file inside a json object.')
+        if buffer[position] == '}':
+            return buffer, position + 1
+        _, buffer, position = decode_json_value(decoder, file, buffer, position, chunk_size)
+        buffer, position = skip_json_whitespace(file, buffer, position, chunk_size)
+        if buffer[position:position + 1] != ':':
+            raise ValueError('Expected \':\' after a key inside a json object.')
+        buffer, position = skip_json_whitespace(file, buffer, position + 1, chunk_size)
+        _, buffer, position = decode_json_value(decoder, file, buffer, position, chunk_size)
+
+
+def expand_records(element) -> Iterator[dict]:
+    if isinstance(element, dict) and isinstance(element.get('records'), list):
+        yield from element['records']
+    elif isinstance(element, dict):
+        yield element
+
+
+def iter_avro_file(path: Path) -> Iterator[dict]:
+    # Event Hub capture, each record Body is a json object with a "records" array
+    if fastavro is None:
+        log_readers_logger.critical(f'fastavro is required to read Event Hub capture files, skipped: {path}')
+        return
+    with open(path, 'rb') as file:
+        for capture_record in fastavro.reader(file):
+            body = capture_record.get('Body')
+            if not body:
+                continue
+            try:
+                yield from expand_records(json.loads(body))
+            except (TypeError, ValueError) as e:
+                log_readers_logger.warning(f'Unreadable Event Hub capture body in {path}: {e}')
+
+
+def iter_input_file_events(path: Path) -> Iterator[dict]:
+    try:
+        if get_input_suffix(path) == '.avro':
+            records = iter_avro_file(path)
+            for record in records:
+                yield normalize_activity_event(record)
+            return
+        with open_input_file(path) as file:
+            for record in iter_json_file(file):
+                yield normalize_activity_event(record)
+    except (OSError, ValueError) as e:
+        log_readers_logger.error(f'Unable to read input file {path}: {e}')
+
+
+def run_input_worker(paths: list[Path], page_queue, page_size: int) -> None:
+    # Worker process: streams the pages of each file in order with None after each file, blocks while page_queue is full
+    for path in paths:
+        for page in chunk_events(iter_input_file_events(path), page_size):
+            page_queue.put(page)
+        page_queue.put(None)
+
+
+def normalize_activity_event(record: dict) -> dict:
+    # REST schema events (and saved axe keyed data) pass through, diagnostic schema events are mapped onto REST field names
+    if 'eventTimestamp' in record or 'time' not in record:
+        return record
+    return map_diagnostic_event(record)
+
+
+def map_diagnostic_event(record: dict) -> dict:
+    properties: dict = record.get('properties') or {}
+    if isinstance(properties, str):
+        try:
+            properties = json.loads(properties)
+        except ValueError:
+            properties = {}
+    identity: dict = record.get('identity') or {}
+    claims: dict = identity.get('claims') or {}
+    operation_name: str = record.get('operationName') or ''
+    resource_id: str = record.get('resourceId') or ''
+    result_type: str = record.get('resultType') or ''
+    result_signature: str = record.get('resultSignature') or ''
+    category: str = properties.get('eventCategory') or record.get('category') or 'Administrative'
+
+    # subscriptionId & resourceGroupName are inferred from the resourceId
+    resource_parts = resource_id.split('/')
+    resource_parts_lower = [part.lower() for part in resource_parts]
+    subscription_id = resource_parts[resource_parts_lower.index('subscriptions') + 1] if 'subscriptions' in resource_parts_lower[:-1] else None
+    resource_group_name = resource_parts[resource_parts_lower.index('resourcegroups') + 1] if 'resourcegroups' in resource_parts_lower[:-1] else None
+
+    caller = next((claims.get(claim) for claim in diagnostic_caller_claims if claims.get(claim)), None)
+    status = diagnostic_status_values.get(result_type, result_type)
+    # resultSignature is "<status>.<subStatus>" e.g. Succeeded.Created
+    sub_status = result_signature.split('.', 1)[1] if '.' in result_signature else ''
+
+    return {
+        'authorization': identity.get('authorization'),
+        'caller': caller,
+        'claims': claims,
+        'correlationId': record.get('correlationId'),
+        'description': record.get('resultDescription', ''),
+        'eventDataId': record.get('eventDataId') or properties.get('eventDataId'),
+        'eventName': {'value': properties.get('eventName'), 'localizedValue': properties.get('eventName')},
+        'category': {'value': category, 'localizedValue': category},
+        'eventTimestamp': record.get('time'),
+        'httpRequest': {'clientIpAddress': record.get('callerIpAddress')} if record.get('callerIpAddress') else None,
+        'level': diagnostic_level_values.get(record.get('level') or record.get('Level'), record.get('level') or record.get('Level')),
+        'operationId': record.get('operationId') or properties.get('operationId'),
+        'operationName': {'value': operation_name, 'localizedValue': operation_name},
+        'properties': properties,
+        'resourceGroupName': resource_group_name,
+        'resourceProviderName': {'value': operation_name.split('/')[0], 'localizedValue': operation_name.split('/')[0]},
+        'resourceId': resource_id,
+        'status': {'value': status, 'localizedValue': status},
+        'subStatus': {'value': sub_status, 'localizedValue': sub_status},
+        'subscriptionId': subscription_id,
+        'tenantId': record.get('tenantId'),
+    }
+
+
+def iter_input_pages(input_paths: Iterable[Path], input_workers: int = 1, page_size: int = INPUT_PAGE_SIZE) -> Iterator[list[dict]]:
+    # One worker streams each file in pages. More workers stream files in parallel processes, pages stay in file order.
+    input_files = get_input_files(input_paths)
+    if not input_files:
+        log_readers_logger.critical('No input files found.')
+        return
+    log_readers_logger.info(f'[+] Reading {len(input_files)} input files...')
+
+    if input_workers <= 1:
+        for path in input_files:
+            yield from chunk_events(iter_input_file_events(path), page_size)
+        return
+
+    # Files are dealt round robin, worker w streams files w, w + workers, ... and the reader takes file n from worker n % workers.
+    # Each worker parses at most INPUT_PREFETCH_PAGES pages ahead, so memory stays bounded by pages, not by file sizes.
+    input_workers = min(input_workers, len(input_files))
+    page_queues = [multiprocessing.Queue(maxsize=INPUT_PREFETCH_PAGES) for _ in range(input_workers)]
+    worker_processes = [multiprocessing.Process(target=run_input_worker, args=(input_files[worker::input_workers], page_queues[worker], page_size), daemon=True)
+                        for worker in range(input_workers)]
+    for worker_process in worker_processes:
+        worker_process.start()
+    try:
+        for file_number, path in enumerate(input_files):
+            page_queue, worker_process = page_queues[file_number % input_workers], worker_processes[file_number % input_workers]
+            while True:
+                try:
+                    page = page_queue.get(timeout=1)
+                except queue.Empty:
+                    # A worker that exited normally has flushed its pages into the queue
+                    if worker_process.is_alive() or not page_queue.empty():
+                        continue
+                    log_readers_logger.critical(f'Input worker exited while reading {path}, input is incomplete.')
+                    return
+                if page is None:
+                    break
+                yield page
+    finally:
+        for worker_process in worker_processes:
+            if worker_process.is_alive():
+                worker_process.terminate()
+            worker_process.join()
+
+
+def chunk_events(events: Iterable[dict], page_size: int) -> Iterator[list[dict]]:
+    page: list[dict] = []
+    for event in events:
+        page.append(event)
+        if len(page) >= page_size:
+            yield page
+            page = []
+    if page:
+        yield page
@@ -0,0 +1,261 @@
+"""
+Tool Name: Azure Activity Log Axe
+Script Name: retry.py
+Author: Nathan Eades
+Date: 2024-06-01
+Description: Throttling aware retry scheduling and adaptive concurrency for the fetch engines.
+License: Apache License
+"""
+
+#   This file is part of Azure Activity Log Axe.
+#
+#   Copyright 2024 Permiso Security <https://permiso.io>
+#         Nathan Eades:
+#             - LinkedIn: <@eadesclouddef>
+#             - GitHub: <eadesclouddef> or <neades2305>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import asyncio
+import random
+import threading
+from .config import FETCH_MAX_RETRIES, FETCH_RETRY_BASE_DELAY, FETCH_RETRY_MAX_DELAY, RATELIMIT_HIGH_REMAINING, RATELIMIT_LOW_REMAINING
+from .logger import get_logger
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Mapping
+
+retry_logger = get_logger('retry')
+
+RETRYABLE_STATUS_CODES: set[int] = {408, 429, 500, 502, 503, 504}
+RATELIMIT_HEADER_PREFIX = 'x-ms-ratelimit-remaining-'
+
+
+class FetchStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests: int = 0
+        self.retries: int = 0
+        self.throttled: int = 0
+        self.server_errors: int = 0
+        self.connection_errors: int = 0
+        self.exhausted: int = 0
+        self.errors: int = 0
+        self.throttle_wait_seconds: float = 0.0
+        self.backoff_wait_seconds: float = 0.0
+        self.min_ratelimit_remaining: int | None = None
+        self.min_concurrency: int | None = None
+        self.max_concurrency: int | None = None
+
+    def add(self, **counters) -> None:
+        with self._lock:
+            for name, amount in counters.items():
+                setattr(self, name, getattr(self, name) + amount)
+
+    def observe(self, ratelimit_remaining: int | None, concurrency: int) -> None:
+        with self._lock:
+            if ratelimit_remaining is not None and (self.min_ratelimit_remaining is None or ratelimit_remaining < self.min_ratelimit_remaining):
+                self.min_ratelimit_remaining = ratelimit_remaining
+            self.min_concurrency = concurrency if self.min_concurrency is None else min(self.min_concurrency, concurrency)
+            self.max_concurrency = concurrency if self.max_concurrency is None else max(self.max_concurrency, concurrency)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                'Requests': self.requests,
+                'Retries': self.retries,
+                'Throttled Responses': self.throttled,
+                'Server Errors': self.server_errors,
+                'Connection Errors': self.connection_errors,
+                'Retries Exhausted': self.exhausted,
+                'Request Errors': self.errors,
+                'Throttle Wait Seconds': round(self.throttle_wait_seconds, 2),
+                'Backoff Wait Seconds': round(self.backoff_wait_seconds, 2),
+                'Min Rate Limit Remaining': self.min_ratelimit_remaining,
+                'Concurrency Range': [self.min_concurrency, self.max_concurrency],
+            }
+
+
+class RetryScheduler:
+    # Shared by every request of a run. Decides whether and how long to wait before re-requesting the same url,
+    # and adapts the concurrency limit to the remaining throttle budget (halve on 429, step down when low, step up when healthy).
+    def __init__(self, max_concurrency: int = 1, min_concurrency: int = 1, max_retries: int = FETCH_MAX_RETRIES,
+                 base_delay: float = FETCH_RETRY_BASE_DELAY, max_delay: float = FETCH_RETRY_MAX_DELAY,
+                 low_remaining: int = RATELIMIT_LOW_REMAINING, high_remaining: int = RATELIMIT_HIGH_REMAINING):
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.concurrency_limit = self.max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.low_remaining = low_remaining
+        self.high_remaining = high_remaining
+        self.stats = FetchStats()
+        self._lock = threading.Lock()
+        # Failures recorded by the current thread, a fetcher compares it before & after a window to know the window is complete
+        self._thread_failures = threading.local()
+        self.limiter = ConcurrencyLimiter(self)
+        # Event loop limiters following this scheduler, woken when the limit is raised
+        self.async_limiters: list[AsyncConcurrencyLimiter] = []
+
+    def should_retry(self, status_code: int | None, attempt: int) -> bool:
+        # status_code None is a connection error
+        if attempt >= self.max_retries:
+            return False
+        return status_code is None or status_code in RETRYABLE_STATUS_CODES
+
+    def get_retry_delay(self, attempt: int, headers: Mapping[str, str] | None = None) -> float:
+        retry_after = get_retry_after(headers)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        # Full jitter exponential backoff
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def record_response(self, status_code: int | None, headers: Mapping[str, str] | None = None) -> None:
+        remaining = get_ratelimit_remaining(headers)
+        with self._lock:
+            previous_limit = self.concurrency_limit
+            if status_code == 429:
+                self.concurrency_limit = max(self.min_concurrency, self.concurrency_limit // 2)
+            elif remaining is not None and remaining < self.low_remaining:
+                self.concurrency_limit = max(self.min_concurrency, self.concurrency_limit - 1)
+            elif status_code == 200 and (remaining is None or remaining > self.high_remaining):
+                self.concurrency_limit = min(self.max_concurrency, self.concurrency_limit + 1)
+            concurrency_limit = self.concurrency_limit
+
+        self.stats.add(requests=1)
+        if status_code == 429:
+            self.stats.add(throttled=1)
+        elif status_code is None:
+            self.stats.add(connection_errors=1)
+        elif status_code >= 500:
+            self.stats.add(server_errors=1)
+        self.stats.observe(remaining, concurrency_limit)
+        self.limiter.notify()
+        if concurrency_limit > previous_limit:
+            for async_limiter in list(self.async_limiters):
+                async_limiter.notify()
+
+    def record_retry(self, status_code: int | None, delay: float) -> None:
+        if status_code == 429:
+            self.stats.add(retries=1, throttle_wait_seconds=delay)
+        else:
+            self.stats.add(retries=1, backoff_wait_seconds=delay)
+
+    def record_exhausted(self) -> None:
+        self.stats.add(exhausted=1)
+        self._thread_failures.count = self.get_thread_failure_count() + 1
+
+    def record_error(self) -> None:
+        self.stats.add(errors=1)
+        self._thread_failures.count = self.get_thread_failure_count() + 1
+
+    def get_failure_count(self) -> int:
+        # Requests that ended without their data (truncated pages)
+        return self.stats.exhausted + self.stats.errors
+
+    def get_thread_failure_count(self) -> int:
+        return getattr(self._thread_failures, 'count', 0)
+
+
+class ConcurrencyLimiter:
+    # Thread limiter that follows the scheduler's current concurrency_limit
+    def __init__(self, scheduler: RetryScheduler):
+        self.scheduler = scheduler
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    def __enter__(self):
+        with self._condition:
+            while self.in_flight >= self.scheduler.concurrency_limit:
+                self._condition.wait()
+            self.in_flight += 1
+        return self
+
+    def __exit__(self, *exc) -> None:
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def notify(self) -> None:
+        with self._condition:
+            self._condition.notify_all()
+
+
+class AsyncConcurrencyLimiter:
+    # Event loop limiter that follows the scheduler's current concurrency_limit, created on its loop and closed with it
+    def __init__(self, scheduler: RetryScheduler):
+        self.scheduler = scheduler
+        self.in_flight = 0
+        self._condition = asyncio.Condition()
+        self._loop = asyncio.get_running_loop()
+        scheduler.async_limiters.append(self)
+
+    async def __aenter__(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.scheduler.concurrency_limit)
+            self.in_flight += 1
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    # Wakes the waiters to re-check a raised limit, callable from any thread
+    def notify(self) -> None:
+        self._loop.call_soon_threadsafe(self._loop.create_task, self._notify_all())
+
+    async def _notify_all(self) -> None:
+        async with self._condition:
+            self._condition.notify_all()
+
+    def close(self) -> None:
+        if self in self.scheduler.async_limiters:
+            self.scheduler.async_limiters.remove(self)
+
+
+def get_retry_after(headers: Mapping[str, str] | None) -> float | None:
+    # Retry-After is either delta seconds or an HTTP date
+    if not headers:
+        return None
+    retry_after = headers.get('Retry-After') or headers.get('retry-after')
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(retry_after)
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        retry_logger.warning(f'Unable to parse Retry-After header: {retry_after}')
+        return None
+
+
+def get_ratelimit_remaining(headers: Mapping[str, str] | None) -> int | None:
+    # Lowest of the x-ms-ratelimit-remaining-* budgets (subscription-reads, tenant-reads, ...)
+    if not headers:
+        return None
+    remaining: int | None = None
+    for name, value in headers.items():
+        if name.lower().startswith(RATELIMIT_HEADER_PREFIX):
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                continue
+            remaining = value if remaining is None else min(remaining, value)
+    return remaining
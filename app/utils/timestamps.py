@@ -0,0 +1,74 @@
+"""
+Tool Name: Azure Activity Log Axe
+Script Name: timestamps.py
+Author: Nathan Eades
+Date: 2024-06-01
+Description: Fast parsing and rendering of Azure event timestamps.
+License: Apache License
+"""
+
+#   This file is part of Azure Activity Log Axe.
+#
+#   Copyright 2024 Permiso Security <https://permiso.io>
+#         Nathan Eades:
+#             - LinkedIn: <@eadesclouddef>
+#             - GitHub: <eadesclouddef> or <neades2305>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+from datetime import datetime, timedelta
+
+EVENT_TIME_FORMAT: str = '%Y-%m-%dT%H:%M:%S.%fZ'
+EPOCH: datetime = datetime(1970, 1, 1)
+# int64 microseconds placeholder for a missing or unparseable time (sorts first)
+NULL_EVENT_TIME: int = -(2 ** 63)
+
+
+def parse_event_timestamp(event_time: str) -> datetime:
+    # Fixed layout parser for YYYY-MM-DDTHH:MM:SS[.f...]Z, Azure uses up to 7 fractional digits which are trimmed to 6 (Python iso rec)
+    # Anything else falls back to strptime, raises ValueError when unparseable
+    if len(event_time) >= 20 and event_time[-1] == 'Z' and event_time[4] == '-' and event_time[7] == '-' and event_time[10] == 'T' and event_time[13] == ':' and event_time[16] == ':':
+        if len(event_time) == 20:
+            microsecond = 0
+        elif event_time[19] == '.' and event_time[20:-1].isdigit():
+            microsecond = int(event_time[20:-1][:6].ljust(6, '0'))
+        else:
+            microsecond = -1
+        if microsecond >= 0:
+            return datetime(int(event_time[0:4]), int(event_time[5:7]), int(event_time[8:10]), int(event_time[11:13]), int(event_time[14:16]), int(event_time[17:19]), microsecond)
+
+    if '.' in event_time:
+        if len(event_time.split('.')[-1]) > 6:
+            event_time = event_time[:-1][:26] + 'Z'
+    else:
+        event_time = event_time[:-1] + '.000000Z'
+    return datetime.strptime(event_time, EVENT_TIME_FORMAT)
+
+
+def format_event_timestamp(event_time: datetime) -> str:
+    # Same output as strftime(EVENT_TIME_FORMAT) for naive datetimes
+    return event_time.isoformat(timespec='microseconds') + 'Z'
+
+
+def get_microseconds(event_time: datetime) -> int:
+    return (event_time - EPOCH) // timedelta(microseconds=1)
+
+
+# int64 microseconds since epoch for an event timestamp string, NULL_EVENT_TIME when missing or unparseable
+def get_event_time_microseconds(event_time: str | None) -> int:
+    if not event_time:
+        return NULL_EVENT_TIME
+    try:
+        return get_microseconds(parse_event_timestamp(event_time))
+    except ValueError:
+        return NULL_EVENT_TIME
@@ -0,0 +1,107 @@
+"""
+Tool Name: Azure Activity Log Axe
+Script Name: axe_key_bench.py
+Author: Nathan Eades
+Date: 2024-06-01
+Description: Micro-benchmark of axeKey hashing, memoization & batch keying.
+License: Apache License
+"""
+
+#   This file is part of Azure Activity Log Axe.
+#
+#   Copyright 2024 Permiso Security <https://permiso.io>
+#         Nathan Eades:
+#             - LinkedIn: <@eadesclouddef>
+#             - GitHub: <eadesclouddef> or <neades2305>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import argparse
+import random
+import time
+from .legacy_processor import legacy_get_axe_key
+from typing import Callable
+from app.core.azure_axe_key import axe_key_caches, get_axe_key, get_axe_keys, get_hashed_axe_key, is_axe_key_hash_mode_available
+from app.utils.config import valid_axe_key_hash_modes
+
+# Run from the repository root: python -m benchmarks.axe_key_bench [--events 1000000] [--events-per-operation 4]
+# axeKeys per second for each hash mode: unmemoized, memoized per event, batch (cold cache) & batch again (warm cache).
+# The md5 baseline is the original per event lowercase & hash, its keys must match every md5 run.
+
+
+def make_key_fields(event_count: int, events_per_operation: int, seed: int = 1) -> list[tuple[str, str, str]]:
+    # Events of one operation share the triple and arrive close together, not strictly adjacent
+    rng = random.Random(seed)
+    operation_names = [f'Microsoft.{provider}/{resource}/{action}' for provider in ('Compute', 'Storage', 'Network', 'KeyVault') for resource in ('items', 'accounts') for action in ('write', 'delete', 'action')]
+    key_fields: list[tuple[str, str, str]] = []
+    for operation in range(event_count // events_per_operation):
+        cor_id = f'{rng.getrandbits(128):032x}'
+        resource_id = f'/subscriptions/SUB-{operation % 8}/resourceGroups/RG-{operation % 97}/providers/Microsoft.Compute/items/Item-{operation}'
+        key_fields.extend([(cor_id, rng.choice(operation_names).upper(), resource_id)] * events_per_operation)
+    window = events_per_operation * 8
+    for position in range(0, len(key_fields), window):
+        chunk = key_fields[position:position + window]
+        rng.shuffle(chunk)
+        key_fields[position:position + window] = chunk
+    return key_fields
+
+
+def time_keys(function: Callable[[], list]) -> tuple[list, float]:
+    start = time.perf_counter()
+    axe_keys = function()
+    return axe_keys, time.perf_counter() - start
+
+
+def print_rate(label: str, key_count: int, seconds: float, baseline_seconds: float, identical: bool | None = None) -> None:
+    identical_note = f'   identical: {identical}' if identical is not None else ''
+    print(f'  {label:<22} {key_count / seconds:>12,.0f} keys/s   {seconds:6.2f}s   x{baseline_seconds / seconds:.1f}{identical_note}')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='axeKey hashing, memoization & batch keying micro-benchmark.')
+    parser.add_argument('--events', type=int, default=1000000)
+    parser.add_argument('--events-per-operation', type=int, default=4)
+    args = parser.parse_args()
+
+    key_fields = make_key_fields(args.events, args.events_per_operation)
+    key_count = len(key_fields)
+    print(f'{key_count} events, {args.events_per_operation} events per operation')
+
+    legacy_keys, baseline_seconds = time_keys(lambda: [legacy_get_axe_key(*fields) for fields in key_fields])
+    print('md5 baseline (lowercase & hash per event)')
+    print_rate('per event', key_count, baseline_seconds, baseline_seconds)
+
+    for hash_mode in valid_axe_key_hash_modes:
+        if not is_axe_key_hash_mode_available(hash_mode):
+            print(f'{hash_mode}: not installed, skipped')
+            continue
+        print(hash_mode)
+        unmemoized_keys, seconds = time_keys(lambda: [get_hashed_axe_key(cor_id.lower(), operation_name.lower(), resource_id.lower(), hash_mode) for cor_id, operation_name, resource_id in key_fields])
+        print_rate('unmemoized', key_count, seconds, baseline_seconds, unmemoized_keys == legacy_keys if hash_mode == 'md5' else None)
+
+        axe_key_caches[hash_mode].clear()
+        memoized_keys, seconds = time_keys(lambda: [get_axe_key(*fields, hash_mode=hash_mode) for fields in key_fields])
+        print_rate('memoized, per event', key_count, seconds, baseline_seconds, memoized_keys == unmemoized_keys)
+
+        axe_key_caches[hash_mode].clear()
+        batch_keys, seconds = time_keys(lambda: get_axe_keys(key_fields, hash_mode))
+        print_rate('memoized, batch', key_count, seconds, baseline_seconds, batch_keys == unmemoized_keys)
+
+        # Second pass over the same triples, every key is a cache hit until the cache bound clears it
+        batch_keys, seconds = time_keys(lambda: get_axe_keys(key_fields, hash_mode))
+        print_rate('memoized, batch warm', key_count, seconds, baseline_seconds, batch_keys == unmemoized_keys)
+        axe_key_caches[hash_mode].clear()
+
+
+if __name__ == '__main__':
+    main()
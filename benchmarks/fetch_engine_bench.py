@@ -0,0 +1,82 @@
+"""
+Tool Name: Azure Activity Log Axe
+Script Name: fetch_engine_bench.py
+Author: Nathan Eades
+Date: 2024-06-01
+Description: Benchmark of the sequential, threads and async fetch engines against a mock endpoint.
+License: Apache License
+"""
+
+#   This file is part of Azure Activity Log Axe.
+#
+#   Copyright 2024 Permiso Security <https://permiso.io>
+#         Nathan Eades:
+#             - LinkedIn: <@eadesclouddef>
+#             - GitHub: <eadesclouddef> or <neades2305>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import argparse
+import time
+from .mock_management_endpoint import MockManagementEndpoint, use_mock_endpoint
+from .synthetic_events import make_activity_events
+from app.utils.async_log_getters import is_async_engine_available
+from app.utils.log_getters import get_azure_activity_subscriptions
+
+# Run from the repository root: python -m benchmarks.fetch_engine_bench [--latency-ms 20]
+# Compares the sequential, threads and async fetch engines against the mock management endpoint.
+
+FILTER_START_TIME = '2024-06-01T00:00:00.000000Z'
+FILTER_END_TIME = '2024-06-03T00:00:00.000000Z'
+
+
+def run_engine(endpoint: MockManagementEndpoint, sub_ids: list[str], fetch_engine: str, fetch_workers: int, subscription_workers: int) -> tuple[list[dict], float, int]:
+    endpoint.reset_request_count()
+    start = time.perf_counter()
+    activity_logs = get_azure_activity_subscriptions(sub_ids, FILTER_START_TIME, FILTER_END_TIME, fetch_workers=fetch_workers,
+                                                     subscription_workers=subscription_workers, fetch_engine=fetch_engine)
+    return activity_logs, time.perf_counter() - start, endpoint.request_count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Fetch engine benchmark against a local mock management endpoint.')
+    parser.add_argument('--subscriptions', type=int, default=4)
+    parser.add_argument('--events', type=int, default=1000, help='Events per subscription.')
+    parser.add_argument('--page-size', type=int, default=50)
+    parser.add_argument('--latency-ms', type=float, default=20.0, help='Latency injected into every request.')
+    parser.add_argument('--fetch-workers', type=int, default=4)
+    parser.add_argument('--subscription-workers', type=int, default=4)
+    args = parser.parse_args()
+
+    sub_ids = [f'sub-{number}' for number in range(1, args.subscriptions + 1)]
+    events_by_subscription = {sub_id: make_activity_events(args.events, seed=number, sub_id=sub_id) for number, sub_id in enumerate(sub_ids)}
+    engines = [('sequential', 'threads', 1, 1), ('threads', 'threads', args.fetch_workers, args.subscription_workers)]
+    if is_async_engine_available():
+        engines.append(('async', 'async', args.fetch_workers, args.subscription_workers))
+    else:
+        print('aiohttp is not installed, skipping the async engine.')
+
+    with MockManagementEndpoint(events_by_subscription, args.page_size, args.latency_ms / 1000) as endpoint:
+        use_mock_endpoint(endpoint.url)
+        print(f'{args.subscriptions} subscriptions x {args.events} events, {args.page_size} per page, {args.latency_ms:g} ms latency')
+        baseline_ids: list[str] | None = None
+        for name, fetch_engine, fetch_workers, subscription_workers in engines:
+            activity_logs, seconds, request_count = run_engine(endpoint, sub_ids, fetch_engine, fetch_workers, subscription_workers)
+            event_ids = [raw_event['eventDataId'] for raw_event in activity_logs]
+            baseline_ids = event_ids if baseline_ids is None else baseline_ids
+            print(f'{name:<12} workers {fetch_workers}x{subscription_workers}  {seconds:7.2f}s  {request_count:5} requests  '
+                  f'{len(event_ids)} events  identical to sequential: {event_ids == baseline_ids}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""
+Tool Name: Azure Activity Log Axe
+Script Name: legacy_processor.py
+Author: Nathan Eades
+Date: 2024-06-01
+Description: Baseline three-pass keying & simplification, the reference the benchmarks compare against.
+License: Apache License
+"""
+
+#   This file is part of Azure Activity Log Axe.
+#
+#   Copyright 2024 Permiso Security <https://permiso.io>
+#         Nathan Eades:
+#             - LinkedIn: <@eadesclouddef>
+#             - GitHub: <eadesclouddef> or <neades2305>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import hashlib
+import json
+from datetime import datetime
+from typing import Any
+
+# Baseline implementations the benchmarks measure against: the three-pass keying & simplification that preceded the
+# fused single pass, with its per event strptime / strftime timestamp handling and per event md5 axe keys.
+
+LEGACY_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+
+def legacy_get_axe_key(cor_id: str | None, operation_name: str | None, resource_id: str | None) -> str | None:
+    if cor_id and operation_name and resource_id:
+        return hashlib.md5(f'{cor_id.lower()}:{operation_name.lower()}:{resource_id.lower()}'.encode()).hexdigest()
+    return None
+
+
+def legacy_parse_event_timestamp(event_time: str) -> datetime:
+    if '.' in event_time:
+        if len(event_time.split('.')[-1]) > 6:
+            # Trim the fractional seconds to 6 digits (Python iso rec)
+            event_time = event_time[:-1][:26] + 'Z'
+    else:
+        event_time = event_time[:-1] + '.000000Z'
+    return datetime.strptime(event_time, LEGACY_DATE_FORMAT)
+
+
+def legacy_format_event_timestamp(event_time: datetime) -> str:
+    return event_time.strftime(LEGACY_DATE_FORMAT)
+
+
+def get_object_value(dict_object: dict, *keys) -> Any:
+    value: Any = dict_object
+    for key in keys:
+        value = value.get(key)
+        if value is None:
+            return None
+    return value
+
+
+def legacy_process_activity_logs(activity_logs: list[dict]) -> tuple[list[dict], list[dict]]:
+    # Pass 1 keys the raw events, pass 2 folds the keyed events (re-parsing the stored start & end time per event),
+    # pass 3 copies every group into the output list. Returns (keyed_log_data, simplified_log_data_list).
+    keyed_log_data: list[dict] = []
+    for raw_event in activity_logs:
+        axe_key = legacy_get_axe_key(raw_event.get('correlationId'), raw_event.get('operationName').get('value'), raw_event.get('resourceId'))
+        if axe_key:
+            raw_event['axeKey'] = axe_key
+            keyed_log_data.append(raw_event)
+
+    simplified_log_data_objects: dict[str, dict] = {}
+    for raw_event in keyed_log_data:
+        axe_key = raw_event['axeKey']
+        if axe_key not in simplified_log_data_objects:
+            simplified_log_data_objects[axe_key] = {
+                'caller': None, 'operationName': None, 'operationNameLocalized': None, 'startTime': None, 'endTime': None, 'ip': None,
+                'subStatuses': [], 'subStatusCounts': {}, 'startStatus': None, 'endStatus': None, 'statuses': [], 'statusCounts': {},
+                'subscriptionId': None, 'claims': {}, 'requestBody': {}, 'responseBody': {}, 'category': None, 'level': None,
+                'resourceGroupName': None, 'resourceId': None, 'eventDataIds': [], 'correlationId': None, 'operationIds': set(),
+            }
+        simplified_event = simplified_log_data_objects[axe_key]
+        simplified_event['caller'] = get_object_value(raw_event, 'caller')
+        simplified_event['operationName'] = get_object_value(raw_event, 'operationName', 'value').lower()
+        simplified_event['operationNameLocalized'] = get_object_value(raw_event, 'operationName', 'localizedValue')
+        simplified_event['ip'] = get_object_value(raw_event, 'httpRequest', 'clientIpAddress') or get_object_value(raw_event, 'claims', 'ipaddr')
+        simplified_event['subscriptionId'] = get_object_value(raw_event, 'subscriptionId')
+        simplified_event['category'] = get_object_value(raw_event, 'category', 'value')
+        simplified_event['level'] = get_object_value(raw_event, 'level')
+        simplified_event['resourceProviderName'] = get_object_value(raw_event, 'resourceProviderName', 'value').lower()
+        simplified_event['resourceGroupName'] = get_object_value(raw_event, 'resourceGroupName')
+        simplified_event['resourceId'] = get_object_value(raw_event, 'resourceId')
+        simplified_event['correlationId'] = get_object_value(raw_event, 'correlationId')
+
+        sub_status = get_object_value(raw_event, 'subStatus', 'value')
+        if sub_status:
+            simplified_event['subStatusCounts'][sub_status] = simplified_event['subStatusCounts'].get(sub_status, 0) + 1
+            if sub_status not in simplified_event['subStatuses']:
+                simplified_event['subStatuses'].append(sub_status)
+        status = get_object_value(raw_event, 'status', 'value')
+        if status:
+            simplified_event['statusCounts'][status] = simplified_event['statusCounts'].get(status, 0) + 1
+            if status not in simplified_event['statuses']:
+                simplified_event['statuses'].append(status)
+
+        event_time = get_object_value(raw_event, 'eventTimestamp')
+        if event_time:
+            try:
+                event_time = legacy_parse_event_timestamp(event_time)
+            except ValueError:
+                continue
+        if not simplified_event['startTime'] or event_time < legacy_parse_event_timestamp(simplified_event['startTime']):
+            simplified_event['startTime'] = legacy_format_event_timestamp(event_time)
+            simplified_event['startStatus'] = raw_event['status']['value']
+        if not simplified_event['endTime'] or event_time > legacy_parse_event_timestamp(simplified_event['endTime']):
+            simplified_event['endTime'] = legacy_format_event_timestamp(event_time)
+            simplified_event['endStatus'] = raw_event['status']['value']
+
+        for claim_name, simplified_claim_name in (('appid', 'appid'), ('appidacr', 'appidacr'), ('idtyp', 'idtyp'), ('uti', 'uti'),
+                                                  ('http://schemas.microsoft.com/claims/authnmethodsreferences', 'authnmethodsreferences')):
+            claim_value = get_object_value(raw_event, 'claims', claim_name)
+            if claim_value:
+                simplified_event['claims'][simplified_claim_name] = claim_value
+
+        request_body = get_object_value(raw_event, 'properties', 'requestbody')
+        if request_body:
+            simplified_event['requestBody'] = json.loads(request_body)
+        response_body = get_object_value(raw_event, 'properties', 'responseBody')
+        if response_body:
+            simplified_event['responseBody'] = json.loads(response_body)
+
+        event_data_id = get_object_value(raw_event, 'eventDataId')
+        if event_data_id:
+            simplified_event['eventDataIds'].append(event_data_id)
+        operation_id = get_object_value(raw_event, 'operationId')
+        if operation_id:
+            simplified_event['operationIds'].add(operation_id)
+    for simplified_event in simplified_log_data_objects.values():
+        simplified_event['operationIds'] = list(simplified_event['operationIds'])
+
+    simplified_log_data_list: list[dict] = []
+    for axe_key, simplified_event in simplified_log_data_objects.items():
+        full_event = {'axeKey': axe_key}
+        full_event.update(simplified_event)
+        simplified_log_data_list.append(full_event)
+    return keyed_log_data, simplified_log_data_list
@@ -0,0 +1,134 @@
+"""
+Tool Name: Azure Activity Log Axe
+Script Name: mock_management_endpoint.py
+Author: Nathan Eades
+Date: 2024-06-01
+Description: Local mock of the Azure management activity log endpoint with injected latency.
+License: Apache License
+"""
+
+#   This file is part of Azure Activity Log Axe.
+#
+#   Copyright 2024 Permiso Security <https://permiso.io>
+#         Nathan Eades:
+#             - LinkedIn: <@eadesclouddef>
+#             - GitHub: <eadesclouddef> or <neades2305>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import json
+import re
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+filter_pattern = re.compile(r"eventTimestamp ge '([^']*)' and eventTimestamp le '([^']*)'(?: and correlationId eq '([^']*)')?")
+
+
+def get_comparable_time(event_time: str) -> str:
+    # YYYY-MM-DDTHH:MM:SS.ffffff, fractions trimmed or padded to 6 digits so filter & event times compare as strings
+    event_time = event_time.rstrip('Z')
+    seconds, _, fraction = event_time.partition('.')
+    return f'{seconds}.{fraction[:6].ljust(6, "0")}'
+
+
+class MockManagementEndpoint:
+    # Local stand-in for the management endpoint: serves events_by_subscription (newest first) for the activity log
+    # $filter, page_size events per page with a nextLink, after latency_seconds per request. Also lists the subscriptions.
+    def __init__(self, events_by_subscription: dict[str, list[dict]], page_size: int = 50, latency_seconds: float = 0.02):
+        self.events_by_subscription = events_by_subscription
+        self.page_size = page_size
+        self.latency_seconds = latency_seconds
+        self.request_count = 0
+        self._lock = threading.Lock()
+        self._filtered_events: dict[tuple, list[dict]] = {}
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._get_handler())
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        self._thread = threading.Thread(target=self.server.serve_forever, name='mock-management-endpoint', daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset_request_count(self) -> None:
+        with self._lock:
+            self.request_count = 0
+
+    def get_response(self, path: str, query: dict[str, list[str]]) -> dict:
+        with self._lock:
+            self.request_count += 1
+        if path.rstrip('/') == '/subscriptions':
+            return {'value': [{'subscriptionId': sub_id, 'state': 'Enabled'} for sub_id in self.events_by_subscription]}
+
+        sub_id = path.split('/')[2]
+        filter_match = filter_pattern.search(query.get('$filter', [''])[0])
+        if filter_match is None:
+            return {'value': []}
+        filter_key = (sub_id, *filter_match.groups())
+        with self._lock:
+            filtered_events = self._filtered_events.get(filter_key)
+        if filtered_events is None:
+            start, end, cor_id = get_comparable_time(filter_match[1]), get_comparable_time(filter_match[2]), filter_match[3]
+            filtered_events = [raw_event for raw_event in self.events_by_subscription.get(sub_id, [])
+                               if start <= get_comparable_time(raw_event['eventTimestamp']) <= end and (cor_id is None or raw_event['correlationId'] == cor_id)]
+            with self._lock:
+                self._filtered_events[filter_key] = filtered_events
+
+        skip = int(query.get('$skiptoken', ['0'])[0])
+        response = {'value': filtered_events[skip:skip + self.page_size]}
+        if skip + self.page_size < len(filtered_events):
+            next_query = {name: values[0] for name, values in query.items()}
+            next_query['$skiptoken'] = str(skip + self.page_size)
+            response['nextLink'] = f'{self.url}{path}?{urllib.parse.urlencode(next_query)}'
+        return response
+
+    def _get_handler(self) -> type:
+        endpoint = self
+
+        class MockManagementHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args) -> None:
+                pass
+
+            def do_GET(self) -> None:
+                time.sleep(endpoint.latency_seconds)
+                parsed_url = urllib.parse.urlparse(self.path)
+                body = json.dumps(endpoint.get_response(parsed_url.path, urllib.parse.parse_qs(parsed_url.query))).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('x-ms-ratelimit-remaining-subscription-reads', '11999')
+                self.end_headers()
+                self.wfile.write(body)
+
+        return MockManagementHandler
+
+
+class MockAuth:
+    # Replaces AzureMonitorAuth, the mock endpoint accepts any bearer token
+    def chain_auth_restapi(self) -> dict[str, str]:
+        return {'Authorization': 'Bearer mock-token', 'Content-Type': 'application/json'}
+
+
+def use_mock_endpoint(url: str) -> None:
+    # Points the REST fetchers (threads and async) at the mock endpoint without Azure credentials
+    from app.utils import log_getters
+    log_getters.MANAGEMENT_ENDPOINT = url
+    log_getters.AzureMonitorAuth = MockAuth
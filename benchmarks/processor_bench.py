@@ -0,0 +1,93 @@
+"""
+Tool Name: Azure Activity Log Axe
+Script Name: processor_bench.py
+Author: Nathan Eades
+Date: 2024-06-01
+Description: Benchmark of the baseline three-pass processor against the fused single pass.
+License: Apache License
+"""
+
+#   This file is part of Azure Activity Log Axe.
+#
+#   Copyright 2024 Permiso Security <https://permiso.io>
+#         Nathan Eades:
+#             - LinkedIn: <@eadesclouddef>
+#             - GitHub: <eadesclouddef> or <neades2305>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import argparse
+import multiprocessing
+import resource
+import sys
+import time
+from .legacy_processor import legacy_process_activity_logs
+from .synthetic_events import make_activity_events
+from app.core.azure_activity_processor import AzureActivityProcessor
+from typing import Iterator
+
+# Run from the repository root: python -m benchmarks.processor_bench [--events 1000000]
+# Each mode runs in a fresh process: time to key & simplify, and peak RSS growth over the generated input events.
+
+PAGE_SIZE = 5000
+
+
+def get_peak_rss_mb() -> float:
+    # ru_maxrss is KB on Linux, bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss / (1024 * 1024) if sys.platform == 'darwin' else peak_rss / 1024
+
+
+def drain_pages(pages: list[list[dict]]) -> Iterator[list[dict]]:
+    # Hands pages over one at a time and drops the list's reference, as a fetch would
+    pages.reverse()
+    while pages:
+        yield pages.pop()
+
+
+def run_mode(mode: str, event_count: int, result_queue) -> None:
+    activity_logs = make_activity_events(event_count)
+    pages = [activity_logs[position:position + PAGE_SIZE] for position in range(0, len(activity_logs), PAGE_SIZE)]
+    if mode != 'legacy three-pass':
+        del activity_logs
+    input_peak_mb = get_peak_rss_mb()
+
+    start = time.perf_counter()
+    if mode == 'legacy three-pass':
+        _, simplified_log_data_list = legacy_process_activity_logs(activity_logs)
+    else:
+        azure_activity = AzureActivityProcessor()
+        azure_activity.process_activity_pages(drain_pages(pages), retain_raw=mode == 'fused')
+        simplified_log_data_list = azure_activity.get_simplified_log_data()
+    seconds = time.perf_counter() - start
+    result_queue.put((seconds, get_peak_rss_mb() - input_peak_mb, len(simplified_log_data_list)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Keying & simplification time and peak memory, baseline three-pass against the fused single pass.')
+    parser.add_argument('--events', type=int, default=200000)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    print(f'{args.events} synthetic events, {PAGE_SIZE} per page')
+    for mode in ('legacy three-pass', 'fused', 'fused, no raw retention'):
+        result_queue = context.Queue()
+        process = context.Process(target=run_mode, args=(mode, args.events, result_queue))
+        process.start()
+        seconds, peak_growth_mb, operation_count = result_queue.get()
+        process.join()
+        print(f'{mode:<24} {seconds:8.2f}s  {args.events / seconds:10,.0f} events/s  peak RSS +{peak_growth_mb:7.1f} MB  {operation_count} operations')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Tool Name: Azure Activity Log Axe
+Script Name: synthetic_events.py
+Author: Nathan Eades
+Date: 2024-06-01
+Description: Reproducible synthetic activity log events for the benchmarks.
+License: Apache License
+"""
+
+#   This file is part of Azure Activity Log Axe.
+#
+#   Copyright 2024 Permiso Security <https://permiso.io>
+#         Nathan Eades:
+#             - LinkedIn: <@eadesclouddef>
+#             - GitHub: <eadesclouddef> or <neades2305>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import json
+import random
+import uuid
+from datetime import datetime, timedelta
+
+# Operation names cycled across synthetic operations
+operation_names: list[str] = [
+    'Microsoft.Storage/storageAccounts/listKeys/action',
+    'Microsoft.Compute/virtualMachines/write',
+    'Microsoft.Authorization/roleAssignments/write',
+    'Microsoft.Resources/deployments/write',
+]
+statuses: list[str] = ['Started', 'Accepted', 'Succeeded', 'Failed']
+
+
+def make_activity_events(event_count: int, start: datetime = datetime(2024, 6, 1), span_hours: int = 48, seed: int = 1, sub_id: str = 'sub-1',
+                         events_per_operation: int = 4) -> list[dict]:
+    # Activity log REST events (newest first, as the endpoint returns them), about events_per_operation events share each
+    # (correlationId, operationName, resourceId). Timestamps carry Azure's 7 fractional digits. Same seed, same events.
+    rng = random.Random(seed)
+    operation_count = max(1, event_count // max(1, events_per_operation))
+    activity_logs: list[dict] = []
+    for event_number in range(event_count):
+        operation = rng.randrange(operation_count)
+        operation_name = operation_names[operation % len(operation_names)]
+        provider, resource_type = operation_name.split('/')[:2]
+        event_time = start + timedelta(seconds=rng.randrange(span_hours * 3600), microseconds=rng.randrange(10 ** 6))
+        raw_event = {
+            'authorization': {'action': operation_name, 'scope': f'/subscriptions/{sub_id}'},
+            'caller': f'user{operation % 7}@contoso.com',
+            'channels': 'Operation',
+            'claims': {'appid': f'app{operation % 3}', 'ipaddr': f'10.0.0.{operation % 250}', 'uti': f'uti{event_number}', 'idtyp': 'user'},
+            'correlationId': f'correlation-{sub_id}-{operation}',
+            'description': '',
+            'eventDataId': str(uuid.UUID(int=rng.getrandbits(128))),
+            'eventName': {'value': 'EndRequest', 'localizedValue': 'End request'},
+            'category': {'value': 'Administrative', 'localizedValue': 'Administrative'},
+            'eventTimestamp': f'{event_time.strftime("%Y-%m-%dT%H:%M:%S.%f")}{rng.randrange(10)}Z',
+            'id': f'/subscriptions/{sub_id}/events/{event_number}',
+            'level': rng.choice(['Informational', 'Error']),
+            'operationId': f'operation-{operation}-{rng.randrange(2)}',
+            'operationName': {'value': operation_name, 'localizedValue': operation_name.split('/')[-1]},
+            'resourceGroupName': f'rg{operation % 5}',
+            'resourceProviderName': {'value': provider, 'localizedValue': provider},
+            'resourceType': {'value': f'{provider}/{resource_type}', 'localizedValue': resource_type},
+            'resourceId': f'/subscriptions/{sub_id}/resourceGroups/rg{operation % 5}/providers/{provider}/{resource_type}/resource{operation}',
+            'status': {'value': rng.choice(statuses), 'localizedValue': ''},
+            'subStatus': {'value': rng.choice(['', 'Created', 'OK']), 'localizedValue': ''},
+            'submissionTimestamp': event_time.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'subscriptionId': sub_id,
+            'tenantId': 'tenant-1',
+            'properties': {'statusCode': rng.choice(['OK', 'Created'])},
+        }
+        if rng.random() < 0.3:
+            raw_event['properties']['requestbody'] = json.dumps({'properties': {'value': operation, 'items': [1, 2]}})
+        if rng.random() < 0.3:
+            raw_event['properties']['responseBody'] = json.dumps({'id': operation})
+        if rng.random() < 0.8:
+            raw_event['httpRequest'] = {'clientIpAddress': f'1.2.3.{operation % 200}', 'method': 'PUT'}
+        activity_logs.append(raw_event)
+    activity_logs.sort(key=lambda raw_event: raw_event['eventTimestamp'], reverse=True)
+    return activity_logs
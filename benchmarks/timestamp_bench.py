@@ -0,0 +1,78 @@
+"""
+Tool Name: Azure Activity Log Axe
+Script Name: timestamp_bench.py
+Author: Nathan Eades
+Date: 2024-06-01
+Description: Micro-benchmark of event timestamp parsing and rendering.
+License: Apache License
+"""
+
+#   This file is part of Azure Activity Log Axe.
+#
+#   Copyright 2024 Permiso Security <https://permiso.io>
+#         Nathan Eades:
+#             - LinkedIn: <@eadesclouddef>
+#             - GitHub: <eadesclouddef> or <neades2305>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import argparse
+import random
+import time
+from .legacy_processor import legacy_format_event_timestamp, legacy_parse_event_timestamp
+from datetime import datetime, timedelta
+from typing import Callable
+from app.utils.timestamps import format_event_timestamp, parse_event_timestamp
+
+# Run from the repository root: python -m benchmarks.timestamp_bench [--events 1000000]
+# Per event timestamp parse & render, the baseline strptime / strftime against the fixed layout parser & isoformat.
+
+
+def make_event_timestamps(event_count: int, seed: int = 1) -> list[str]:
+    # Azure event timestamps with 0 to 7 fractional digits (7 is the common case)
+    rng = random.Random(seed)
+    start = datetime(2024, 6, 1)
+    event_timestamps: list[str] = []
+    for _ in range(event_count):
+        event_time = start + timedelta(seconds=rng.randrange(90 * 86400), microseconds=rng.randrange(10 ** 6))
+        fraction_digits = rng.choice((7, 7, 7, 7, 6, 3, 0))
+        fraction = f'{event_time.microsecond:06d}{rng.randrange(10)}'[:fraction_digits]
+        event_timestamps.append(f'{event_time.strftime("%Y-%m-%dT%H:%M:%S")}{"." + fraction if fraction else ""}Z')
+    return event_timestamps
+
+
+def time_call(function: Callable, values: list) -> tuple[list, float]:
+    start = time.perf_counter()
+    results = [function(value) for value in values]
+    return results, time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Timestamp parse & render micro-benchmark.')
+    parser.add_argument('--events', type=int, default=1000000)
+    args = parser.parse_args()
+
+    event_timestamps = make_event_timestamps(args.events)
+    print(f'{args.events} event timestamps (0 to 7 fractional digits)')
+
+    legacy_times, legacy_parse_seconds = time_call(legacy_parse_event_timestamp, event_timestamps)
+    event_times, parse_seconds = time_call(parse_event_timestamp, event_timestamps)
+    print(f'parse   strptime {legacy_parse_seconds:6.2f}s   fixed layout {parse_seconds:6.2f}s   x{legacy_parse_seconds / parse_seconds:.1f}   identical: {legacy_times == event_times}')
+
+    legacy_strings, legacy_render_seconds = time_call(legacy_format_event_timestamp, event_times)
+    event_strings, render_seconds = time_call(format_event_timestamp, event_times)
+    print(f'render  strftime {legacy_render_seconds:6.2f}s   isoformat    {render_seconds:6.2f}s   x{legacy_render_seconds / render_seconds:.1f}   identical: {legacy_strings == event_strings}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Tool Name: Azure Activity Log Axe
+Script Name: test_field_paths.py
+Author: Nathan Eades
+Date: 2024-06-01
+Description: Field paths, including bracketed keys that contain dots.
+License: Apache License
+"""
+
+#   This file is part of Azure Activity Log Axe.
+#
+#   Copyright 2024 Permiso Security <https://permiso.io>
+#         Nathan Eades:
+#             - LinkedIn: <@eadesclouddef>
+#             - GitHub: <eadesclouddef> or <neades2305>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import pytest
+from app.core.field_paths import compile_field_path, filter_records, split_field_condition, split_field_path
+from app.core.query_engine import QueryPlan, QuerySyntaxError
+
+# Run from the repository root: python -m pytest -q
+
+UPN_CLAIM = 'http://schemas.xmlsoap.org/ws/2005/05/identity/claims/upn'
+
+RECORDS = [
+    {'claims': {UPN_CLAIM: 'alice@contoso.com', 'appid': 'app-1'}, 'operationIds': ['op-1', 'op-2']},
+    {'claims': {UPN_CLAIM: 'bob@contoso.com', 'appid': 'app-2'}, 'operationIds': ['op-3']},
+]
+
+
+def test_split_field_path():
+    assert split_field_path(f"claims['{UPN_CLAIM}']") == ('claims', UPN_CLAIM)
+    assert split_field_path('x["a.b"]["c"].d') == ('x', 'a.b', 'c', 'd')
+    assert split_field_path('operationIds[0]') == ('operationIds', '0')
+    assert split_field_path("a['it\\'s']") == ('a', "it's")
+    for path in ('a[', 'a..b', '.a', 'a.'):
+        with pytest.raises(ValueError):
+            split_field_path(path)
+
+
+def test_bracketed_claim_key():
+    accessor = compile_field_path(f"claims['{UPN_CLAIM}']")
+    assert accessor(RECORDS[0]) == ('alice@contoso.com',)
+    # The dotted form walks claims -> 'http://schemas' -> ... and finds nothing
+    assert compile_field_path(f'claims.{UPN_CLAIM}')(RECORDS[0]) == ()
+
+
+def test_bracketed_claim_key_in_filters_and_queries():
+    field, values = split_field_condition(f"claims['{UPN_CLAIM}']:bob@contoso.com")
+    assert field == f"claims['{UPN_CLAIM}']" and values == 'bob@contoso.com'
+    assert filter_records(RECORDS, [(field, [values], False)]) == [RECORDS[1]]
+
+    query_plan = QueryPlan(f"claims['{UPN_CLAIM}'] = 'alice@contoso.com' and claims.appid = app-1")
+    assert list(query_plan.iter_matches(RECORDS)) == [RECORDS[0]]
+    with pytest.raises(QuerySyntaxError):
+        QueryPlan('claims..appid = app-1')
@@ -0,0 +1,105 @@
+"""
+Tool Name: Azure Activity Log Axe
+Script Name: test_follow_emit.py
+Author: Nathan Eades
+Date: 2024-06-01
+Description: Follow mode: completed, update and incomplete records and the pruning of emitted ids.
+License: Apache License
+"""
+
+#   This file is part of Azure Activity Log Axe.
+#
+#   Copyright 2024 Permiso Security <https://permiso.io>
+#         Nathan Eades:
+#             - LinkedIn: <@eadesclouddef>
+#             - GitHub: <eadesclouddef> or <neades2305>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import copy
+from benchmarks.synthetic_events import make_activity_events
+from datetime import datetime, timedelta
+from app.core.azure_activity_processor import AzureActivityProcessor
+
+# Run from the repository root: python -m pytest -q
+
+QUIET_PERIOD = timedelta(minutes=15)
+EVENT_TEMPLATE = make_activity_events(1)[0]
+
+
+def make_event(event_data_id: str, correlation_id: str, event_time: str, status: str) -> dict:
+    # Events of one correlation id share an axeKey
+    raw_event = copy.deepcopy(EVENT_TEMPLATE)
+    raw_event.update({
+        'eventDataId': event_data_id,
+        'correlationId': correlation_id,
+        'operationId': correlation_id,
+        'operationName': {'value': 'Microsoft.Compute/virtualMachines/write', 'localizedValue': 'Create or Update Virtual Machine'},
+        'resourceId': f'/subscriptions/sub-1/resourceGroups/rg/providers/Microsoft.Compute/virtualMachines/{correlation_id}',
+        'eventTimestamp': f'2024-06-01T{event_time}:00.0000000Z',
+        'status': {'value': status, 'localizedValue': status},
+    })
+    return raw_event
+
+
+def pop_records(azure_activity: AzureActivityProcessor, **options) -> list[tuple[list[str], str]]:
+    return [(record['eventDataIds'], record['recordType']) for record in azure_activity.pop_completed_operations(QUIET_PERIOD, **options)]
+
+
+def get_follow_processor() -> AzureActivityProcessor:
+    azure_activity = AzureActivityProcessor()
+    azure_activity.retain_raw = False
+    return azure_activity
+
+
+def test_completed_update_and_incomplete_records():
+    azure_activity = get_follow_processor()
+    azure_activity.add_events([make_event('e1', 'A', '10:00', 'Started'), make_event('e2', 'A', '10:01', 'Succeeded'),
+                               make_event('e3', 'B', '10:20', 'Started')], refresh_list=False)
+    # A is terminal and quiet for 19 minutes of event time, B is still in flight
+    assert pop_records(azure_activity) == [(['e1', 'e2'], 'completed')]
+
+    # A re-read event is dropped, a late one is emitted on its own as an update
+    azure_activity.add_events([make_event('e2', 'A', '10:01', 'Succeeded'), make_event('e4', 'A', '10:02', 'Succeeded')], refresh_list=False)
+    assert pop_records(azure_activity) == [(['e4'], 'update')]
+
+    azure_activity.add_events([make_event('e5', 'B', '10:25', 'Succeeded')], refresh_list=False)
+    assert pop_records(azure_activity) == []
+    assert pop_records(azure_activity, flush=True) == [(['e3', 'e5'], 'incomplete')]
+    assert not azure_activity.simplified_log_data_objects
+
+
+def test_emitted_ids_are_pruned_at_the_cutoff():
+    azure_activity = get_follow_processor()
+    azure_activity.add_events([make_event('e1', 'A', '10:00', 'Started'), make_event('e2', 'A', '10:01', 'Succeeded'),
+                               make_event('e3', 'B', '11:00', 'Started')], refresh_list=False)
+    assert pop_records(azure_activity, emitted_id_cutoff=datetime(2024, 6, 1, 9, 30)) == [(['e1', 'e2'], 'completed')]
+    assert set(azure_activity.emitted_event_data_ids) == {'e1', 'e2'}
+
+    # Once the polls no longer re-read 10:01, A is forgotten and a late event starts a new record
+    assert pop_records(azure_activity, emitted_id_cutoff=datetime(2024, 6, 1, 10, 30)) == []
+    assert not azure_activity.emitted_event_data_ids and not azure_activity.emitted_axe_keys
+    azure_activity.add_events([make_event('e4', 'A', '10:05', 'Succeeded'), make_event('e6', 'B', '11:30', 'Succeeded')], refresh_list=False)
+    assert pop_records(azure_activity, emitted_id_cutoff=datetime(2024, 6, 1, 10, 30)) == [(['e4'], 'completed')]
+
+
+def test_settled_operations_are_pruned_without_emission():
+    azure_activity = get_follow_processor()
+    azure_activity.add_events([make_event('e1', 'A', '10:00', 'Started'), make_event('e2', 'A', '10:01', 'Succeeded'),
+                               make_event('e3', 'B', '10:02', 'Started')], refresh_list=False)
+    assert azure_activity.prune_settled_operations(datetime(2024, 6, 1, 10, 30)) == 1
+    assert [simplified_operation.event_data_ids for simplified_operation in azure_activity.simplified_log_data_objects.values()] == [['e3']]
+
+    # The dedupe set only holds the remaining groups, B still drops its re-read event
+    azure_activity.add_events([make_event('e3', 'B', '10:02', 'Started'), make_event('e7', 'B', '10:40', 'Succeeded')], refresh_list=False)
+    assert azure_activity.seen_event_data_ids == {'e3', 'e7'}
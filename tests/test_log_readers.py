@@ -0,0 +1,85 @@
+"""
+Tool Name: Azure Activity Log Axe
+Script Name: test_log_readers.py
+Author: Nathan Eades
+Date: 2024-06-01
+Description: Input file formats: json arrays, json lines and "records" objects.
+License: Apache License
+"""
+
+#   This file is part of Azure Activity Log Axe.
+#
+#   Copyright 2024 Permiso Security <https://permiso.io>
+#         Nathan Eades:
+#             - LinkedIn: <@eadesclouddef>
+#             - GitHub: <eadesclouddef> or <neades2305>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import json
+import pytest
+import tracemalloc
+from app.utils.log_readers import iter_json_file
+
+# Run from the repository root: python -m pytest -q
+
+RECORDS = [{'eventDataId': str(event_number), 'eventTimestamp': '2024-06-01T00:00:00Z', 'count': 12345} for event_number in range(40)]
+
+INPUT_TEXTS = {
+    'array': json.dumps(RECORDS),
+    'json lines': '\n'.join(map(json.dumps, RECORDS)) + '\n',
+    'records on one line': json.dumps({'records': RECORDS, 'count': 12345}),
+    'records over many lines': json.dumps({'records': RECORDS, 'meta': {'records': [1]}}, indent=2),
+    'records after other keys': json.dumps({'meta': {'records': [1]}, 'records': RECORDS}),
+    'records objects as json lines': '\n'.join(json.dumps({'records': RECORDS[position:position + 10]}) for position in range(0, 40, 10)),
+}
+
+
+@pytest.mark.parametrize('input_name', INPUT_TEXTS)
+@pytest.mark.parametrize('chunk_size', [5, 64, 1024 * 1024])
+def test_input_formats(tmp_path, input_name, chunk_size):
+    # Small chunks split keys, numbers and records across reads
+    path = tmp_path / 'input.json'
+    path.write_text(INPUT_TEXTS[input_name])
+    with open(path) as file:
+        assert list(iter_json_file(file, chunk_size)) == RECORDS
+
+
+def test_nested_records_key_is_not_the_records_array(tmp_path):
+    records = [{'properties': {'records': [1, 2]}, 'eventDataId': str(event_number)} for event_number in range(3)]
+    path = tmp_path / 'input.json'
+    path.write_text('\n'.join(map(json.dumps, records)))
+    with open(path) as file:
+        assert list(iter_json_file(file, 16)) == records
+
+
+def test_truncated_input_is_an_error(tmp_path):
+    path = tmp_path / 'input.json'
+    path.write_text(json.dumps({'records': RECORDS})[:-10])
+    with open(path) as file, pytest.raises(ValueError):
+        list(iter_json_file(file, 64))
+
+
+def test_records_on_one_line_are_streamed(tmp_path):
+    # ~4.5MB on a single line, only the current chunk and record are held
+    path = tmp_path / 'input.json'
+    path.write_text(json.dumps({'records': [{'eventDataId': str(event_number), 'padding': 'x' * 200} for event_number in range(20000)]}))
+    tracemalloc.start()
+    try:
+        with open(path) as file:
+            event_count = sum(1 for _ in iter_json_file(file, 64 * 1024))
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert event_count == 20000
+    assert peak_memory < path.stat().st_size / 4
@@ -0,0 +1,93 @@
+"""
+Tool Name: Azure Activity Log Axe
+Script Name: test_query_engine.py
+Author: Nathan Eades
+Date: 2024-06-01
+Description: Query plans over the field index, the columnar store and streamed records.
+License: Apache License
+"""
+
+#   This file is part of Azure Activity Log Axe.
+#
+#   Copyright 2024 Permiso Security <https://permiso.io>
+#         Nathan Eades:
+#             - LinkedIn: <@eadesclouddef>
+#             - GitHub: <eadesclouddef> or <neades2305>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import pytest
+from benchmarks.synthetic_events import make_activity_events
+from app.core.columnar_store import ColumnarEventStore
+from app.core.field_index import FieldIndex
+from app.core.query_engine import QueryPlan, QuerySyntaxError, parse_query_number
+
+# Run from the repository root: python -m pytest -q
+
+RECORDS = [
+    {'axeKey': 'a', 'statuses': ['Started', 'Succeeded'], 'status': {'value': 'Succeeded'}, 'statusCounts': {'Failed': 0}},
+    {'axeKey': 'b', 'statuses': ['Started', 'Failed'], 'status': {'value': 'Failed'}, 'statusCounts': {'Failed': 2}},
+    {'axeKey': 'c', 'statuses': ['Started'], 'status': {'value': 'Started'}, 'statusCounts': {}},
+]
+
+
+def get_indexed_keys(query: str) -> list[str]:
+    row_ids = QueryPlan(query).get_row_ids(FieldIndex(RECORDS))
+    return [RECORDS[row_id]['axeKey'] for row_id in row_ids]
+
+
+def get_scanned_keys(query: str) -> list[str]:
+    return [record['axeKey'] for record in QueryPlan(query).iter_matches(RECORDS)]
+
+
+@pytest.mark.parametrize('query, expected_keys', [
+    ('statuses = Succeeded', ['a']),
+    ('statuses != Succeeded', ['b', 'c']),
+    ('statuses in (Failed, Succeeded)', ['a', 'b']),
+    ('statuses = Started and not statuses in (Failed)', ['a', 'c']),
+    ('status = Failed or statusCounts.Failed > 1', ['b']),
+    ('statuses.* ^= fail', ['b']),
+])
+def test_index_and_scan_agree(query, expected_keys):
+    # A list field matches on any element, whether the field index or a record scan answers the term
+    assert get_indexed_keys(query) == expected_keys
+    assert get_scanned_keys(query) == expected_keys
+
+
+@pytest.mark.parametrize('query', [
+    'status = Succeeded and caller ^= user1',
+    "operationName ~ 'virtualmachines' and not status in (Failed, Started)",
+    'claims.appid = app1 or correlationId = cor-1',
+])
+def test_columnar_source_matches_scan(query):
+    # Hot fields are answered from the code columns, the rest is scanned over the decoded candidate rows
+    events = make_activity_events(1000)
+    columnar_store = ColumnarEventStore()
+    columnar_store.append_events(events)
+    query_plan = QueryPlan(query)
+    row_ids = query_plan.get_row_ids(columnar_store)
+    scanned_ids = [row_id for row_id, raw_event in enumerate(events) if query_plan.root.matches(raw_event)]
+    assert scanned_ids
+    assert row_ids.tolist() == scanned_ids
+
+
+def test_nan_and_inf_are_not_numbers():
+    assert parse_query_number('2.5') == 2.5
+    for value in ('nan', 'NaN', 'inf', '-inf', 'Infinity'):
+        assert parse_query_number(value) is None
+
+
+def test_syntax_errors():
+    for query in ('', 'status =', 'status = (a', "status = 'a", 'status ~= a', 'overlaps(2024-06-01)'):
+        with pytest.raises(QuerySyntaxError):
+            QueryPlan(query)
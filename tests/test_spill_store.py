@@ -0,0 +1,96 @@
+"""
+Tool Name: Azure Activity Log Axe
+Script Name: test_spill_store.py
+Author: Nathan Eades
+Date: 2024-06-01
+Description: Spilled processing must match the in-memory processor.
+License: Apache License
+"""
+
+#   This file is part of Azure Activity Log Axe.
+#
+#   Copyright 2024 Permiso Security <https://permiso.io>
+#         Nathan Eades:
+#             - LinkedIn: <@eadesclouddef>
+#             - GitHub: <eadesclouddef> or <neades2305>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import copy
+import tracemalloc
+from benchmarks.synthetic_events import make_activity_events
+from datetime import datetime, timedelta, timezone
+from typing import Iterator
+from app.core.azure_activity_processor import AzureActivityProcessor
+from app.core.azure_axe_key import axe_key_caches
+from app.core.spill_store import SpillGroupStore, SpilledKeyedLogSummary
+
+# Run from the repository root: python -m pytest -q
+
+
+def get_pages(events: list[dict], page_size: int = 200) -> list[list[dict]]:
+    # Each run gets its own copy, the processor adds the axeKey to the raw events
+    events = copy.deepcopy(events)
+    return [events[position:position + page_size] for position in range(0, len(events), page_size)]
+
+
+def test_spilled_processing_matches_in_memory(tmp_path):
+    # ~4MB of events against a 1MB budget, the insert buffer is flushed to SQLite several times
+    events = make_activity_events(3000, datetime(2024, 6, 1, tzinfo=timezone.utc))
+
+    in_memory = AzureActivityProcessor()
+    in_memory.process_activity_pages(get_pages(events))
+
+    spill_store = SpillGroupStore(tmp_path, memory_budget_mb=1)
+    spilled = AzureActivityProcessor()
+    spilled.process_activity_pages(get_pages(events), spill_store=spill_store)
+
+    assert spill_store.connection.execute('SELECT COUNT(*) FROM events').fetchone()[0] == len(events)
+    assert spilled.get_simplified_log_data() == in_memory.get_simplified_log_data()
+    assert spilled.get_keyed_log_data() == in_memory.get_keyed_log_data()
+    assert spilled.get_keyed_log_summary(5) == in_memory.get_keyed_log_summary(5)
+    assert isinstance(spilled.keyed_log_summary, SpilledKeyedLogSummary)
+    spill_store.close()
+
+
+def iter_event_pages(event_count: int, page_size: int = 200) -> Iterator[list[dict]]:
+    # Generated page by page, one hour of distinct operations per page, so only the processor holds data across pages
+    for page in range(event_count // page_size):
+        yield make_activity_events(page_size, datetime(2024, 6, 1, tzinfo=timezone.utc) + timedelta(hours=page), span_hours=1, seed=page, sub_id=f'sub-{page}')
+
+
+def get_peak_memory_mb(spill_store: SpillGroupStore | None, event_count: int) -> float:
+    # Python heap peak while processing, streaming every simplified record and summarizing (SQLite's own cache is not traced)
+    axe_key_caches['md5'].clear()
+    tracemalloc.start()
+    try:
+        azure_activity = AzureActivityProcessor()
+        azure_activity.process_activity_pages(iter_event_pages(event_count, page_size=100), spill_store=spill_store)
+        for _ in azure_activity.iter_simplified_log_data():
+            pass
+        azure_activity.get_keyed_log_summary(5)
+        return tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+
+def test_spilled_processing_stays_within_memory_budget(tmp_path):
+    # ~7MB of events, the in-memory processor holds all of them, the spilled one its insert buffer, one page & one group at a time
+    memory_budget_mb = 1
+    spill_store = SpillGroupStore(tmp_path, memory_budget_mb=memory_budget_mb)
+    spilled_peak_mb = get_peak_memory_mb(spill_store, 5000)
+    in_memory_peak_mb = get_peak_memory_mb(None, 5000)
+    spill_store.close()
+
+    assert spilled_peak_mb < 4 * memory_budget_mb
+    assert spilled_peak_mb * 4 < in_memory_peak_mb
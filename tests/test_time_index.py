@@ -0,0 +1,81 @@
+"""
+Tool Name: Azure Activity Log Axe
+Script Name: test_time_index.py
+Author: Nathan Eades
+Date: 2024-06-01
+Description: Time index ranges & overlaps must match a scan of the records.
+License: Apache License
+"""
+
+#   This file is part of Azure Activity Log Axe.
+#
+#   Copyright 2024 Permiso Security <https://permiso.io>
+#         Nathan Eades:
+#             - LinkedIn: <@eadesclouddef>
+#             - GitHub: <eadesclouddef> or <neades2305>
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import numpy as np
+import pytest
+from benchmarks.synthetic_events import make_activity_events
+from datetime import datetime
+from app.core.azure_activity_processor import AzureActivityProcessor
+from app.core.query_engine import QueryPlan
+from app.core.time_index import TimeIndex
+from app.utils.timestamps import NULL_EVENT_TIME
+
+# Run from the repository root: python -m pytest -q
+
+
+@pytest.fixture(scope='module')
+def azure_activity() -> AzureActivityProcessor:
+    azure_activity = AzureActivityProcessor()
+    azure_activity.process_activity_pages([make_activity_events(2000, datetime(2024, 6, 1), span_hours=48)])
+    return azure_activity
+
+
+@pytest.mark.parametrize('dataset, query', [
+    ('keyed', 'overlaps(2024-06-01T12:00:00Z, 2024-06-01T13:00:00Z)'),
+    ('keyed', 'overlaps(2024-05-01, 2024-06-01T00:30:00Z)'),
+    ('keyed', 'eventTimestamp >= 2024-06-02 and eventTimestamp < 2024-06-02T06:00:00Z'),
+    ('keyed', 'eventTimestamp > 2024-06-02T20:00:00Z and status = Succeeded'),
+    ('simplified', 'overlaps(2024-06-01T12:00:00Z, 2024-06-01T13:00:00Z)'),
+    ('simplified', 'overlaps(2024-06-02T23:00:00Z, 2024-07-01)'),
+    ('simplified', 'startTime > 2024-06-02T12:00:00Z or endTime <= 2024-06-01T12:00:00Z'),
+    ('simplified', 'endTime >= 2024-06-02T12:00:00Z and statuses = Succeeded'),
+])
+def test_time_index_matches_scan(azure_activity, dataset, query):
+    records = azure_activity.get_keyed_log_data() if dataset == 'keyed' else azure_activity.get_simplified_log_data()
+    query_plan = QueryPlan(query)
+    row_ids = query_plan.get_row_ids(azure_activity.get_query_source(dataset), azure_activity.get_time_indexes(dataset))
+    scanned_ids = [row_id for row_id, record in enumerate(records) if query_plan.root.matches(record)]
+    assert scanned_ids
+    assert sorted(row_ids.tolist()) == scanned_ids
+
+
+def test_overlap_bounds_and_missing_times():
+    # Rows: [10, 20], [20, 30], [31, 40], no time, [5, 50]
+    start_times = np.array([10, 20, 31, NULL_EVENT_TIME, 5], dtype=np.int64)
+    end_times = np.array([20, 30, 40, NULL_EVENT_TIME, 50], dtype=np.int64)
+    time_index = TimeIndex(start_times, end_times, {'startTime': 'start', 'endTime': 'end'})
+
+    # Touching bounds overlap, the row without a time never does
+    assert sorted(time_index.get_overlapping(20, 20).tolist()) == [0, 1, 4]
+    assert sorted(time_index.get_overlapping(30, 31).tolist()) == [1, 2, 4]
+    assert sorted(time_index.get_overlapping(51, 60).tolist()) == []
+    assert sorted(time_index.get_overlapping(None, 9).tolist()) == [4]
+    assert sorted(time_index.get_overlapping().tolist()) == [0, 1, 2, 4]
+    assert np.flatnonzero(time_index.get_comparison_mask('endTime', '<', 30)).tolist() == [0]
+    assert np.flatnonzero(time_index.get_comparison_mask('startTime', '>=', 20)).tolist() == [1, 2]
+    assert time_index.get_bounds() == (5, 50)